@@ -0,0 +1,211 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+
+# Бэкенды инференса. Каждый принимает пакет кадров BGR uint8 размером
+# input_size x input_size (после FramePipeline) и возвращает количество
+# людей на каждом кадре. ONNX Runtime и OpenVINO работают с моделью,
+# экспортированной из peopleDetectionModel.pt, и считают только класс person.
+# Номер класса person и порог IoU при экспорте сохраняются рядом с моделью,
+# чтобы все бэкенды считали людей одинаково
+
+# порог IoU подавления немаксимумов, как по умолчанию в ultralytics
+NMS_IOU = 0.7
+
+
+def resolve_person_class(model, default=0):
+    # номер класса person берем из имен классов модели, если он там есть
+    return next((i for i, name in model.names.items() if name == "person"), default)
+
+
+class TorchBackend:
+
+    def __init__(
+        self, model_path, threads=None, person_class=0, conf=0.25, iou=NMS_IOU
+    ):
+        from ultralytics import YOLO
+
+        if threads:
+            import torch
+
+            torch.set_num_threads(threads)
+
+        self.model = YOLO(model_path)
+        self.person_class = resolve_person_class(self.model, person_class)
+        self.conf = conf
+        self.iou = iou
+
+    def count_people(self, frames):
+        results = self.model(
+            frames,
+            classes=[self.person_class],
+            conf=self.conf,
+            iou=self.iou,
+            verbose=False,
+        )
+        return [len(r.boxes) for r in results]
+
+
+class _ExportedBackend:
+    # Общие пред- и постобработка для экспортированных моделей YOLOv8:
+    # вход (N, 3, S, S) float32 RGB, выход (N, 4 + классы, кандидаты)
+
+    def __init__(self, person_class=0, conf=0.25, iou=NMS_IOU):
+        self.person_class = person_class
+        self.conf = conf
+        self.iou = iou
+        self.input_buffer = None
+
+    def preprocess(self, frames):
+        batch = np.stack(frames)
+        shape = (batch.shape[0], 3, batch.shape[1], batch.shape[2])
+        if self.input_buffer is None or self.input_buffer.shape != shape:
+            self.input_buffer = np.empty(shape, dtype=np.float32)
+
+        # BGR HWC -> RGB CHW, [0, 255] -> [0, 1]
+        np.multiply(
+            batch[..., ::-1].transpose(0, 3, 1, 2), 1 / 255, out=self.input_buffer
+        )
+        return self.input_buffer
+
+    def postprocess(self, output):
+        counts = []
+        for prediction in output:
+            # разбираем только строку уверенности для класса person
+            scores = prediction[4 + self.person_class]
+            keep = scores > self.conf
+            if not keep.any():
+                counts.append(0)
+                continue
+
+            cx, cy, w, h = prediction[:4, keep]
+            boxes = np.stack([cx - w / 2, cy - h / 2, w, h], axis=1)
+            indices = cv2.dnn.NMSBoxes(
+                boxes.tolist(), scores[keep].tolist(), self.conf, self.iou
+            )
+            counts.append(len(indices))
+        return counts
+
+    def count_people(self, frames):
+        return self.postprocess(self.infer(self.preprocess(frames)))
+
+
+class OnnxBackend(_ExportedBackend):
+
+    def __init__(self, model_path, threads=None, **kwargs):
+        super().__init__(**kwargs)
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+
+        self.session = ort.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def infer(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class OpenVinoBackend(_ExportedBackend):
+
+    def __init__(self, model_path, threads=None, **kwargs):
+        super().__init__(**kwargs)
+        import openvino as ov
+
+        config = {"PERFORMANCE_HINT": "THROUGHPUT"}
+        if threads:
+            config["INFERENCE_NUM_THREADS"] = threads
+
+        core = ov.Core()
+        self.model = core.compile_model(core.read_model(model_path), "CPU", config)
+
+    def infer(self, batch):
+        return self.model(batch)[0]
+
+
+BACKENDS = {
+    "torch": TorchBackend,
+    "onnx": OnnxBackend,
+    "openvino": OpenVinoBackend,
+}
+
+
+def export_model(model_path, backend, int8=False, input_size=640, person_class=0):
+    # Экспортирует .pt модель в формат бэкенда, если файла еще нет,
+    # и возвращает путь к экспортированной модели и ее метаданные
+    # (номер класса person и порог IoU)
+    if backend == "torch":
+        return model_path, {"person_class": person_class, "iou": NMS_IOU}
+
+    stem = os.path.splitext(model_path)[0]
+    suffix = "_int8" if int8 else ""
+    if backend == "onnx":
+        exported_path = f"{stem}{suffix}.onnx"
+    else:
+        # ultralytics сохраняет модель OpenVINO как <имя .pt>.xml в каталоге модели
+        exported_path = os.path.join(
+            f"{stem}{suffix}_openvino_model", f"{os.path.basename(stem)}.xml"
+        )
+    metadata_path = f"{exported_path}.json"
+    if os.path.exists(exported_path) and os.path.exists(metadata_path):
+        with open(metadata_path, encoding="utf-8") as f:
+            return exported_path, json.load(f)
+
+    from ultralytics import YOLO
+
+    model = YOLO(model_path)
+    metadata = {
+        "person_class": resolve_person_class(model, person_class),
+        "iou": NMS_IOU,
+    }
+    if not os.path.exists(exported_path):
+        if backend == "onnx":
+            path = model.export(format="onnx", dynamic=True, imgsz=input_size)
+            if int8:
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+
+                quantize_dynamic(path, exported_path, weight_type=QuantType.QUInt8)
+            else:
+                os.replace(path, exported_path)
+        else:
+            # OpenVINO квантует модель по калибровочному датасету ultralytics
+            path = model.export(
+                format="openvino", dynamic=True, int8=int8, imgsz=input_size
+            )
+            os.replace(path, os.path.dirname(exported_path))
+
+    with open(metadata_path, "w", encoding="utf-8") as f:
+        json.dump(metadata, f)
+    return exported_path, metadata
+
+
+def create_backend(
+    backend,
+    model_path,
+    threads=None,
+    int8=False,
+    input_size=640,
+    person_class=0,
+    conf=0.25,
+):
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд инференса: {backend}")
+
+    model_path, metadata = export_model(
+        model_path, backend, int8=int8, input_size=input_size, person_class=person_class
+    )
+    return BACKENDS[backend](
+        model_path,
+        threads=threads,
+        person_class=metadata["person_class"],
+        conf=conf,
+        iou=metadata["iou"],
+    )
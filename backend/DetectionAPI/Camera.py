@@ -1,7 +1,21 @@
 import random
 
+
 class Camera:
     
+    # байты тестовых снимков, чтобы не читать файл на каждый кадр
+    _samples = {}
+    
+    @classmethod
+    def fetch_frame(cls, id: int):
+        #как и take_photo, пока отдает один из тестовых снимков, но сразу
+        #в виде байтов: настоящая камера будет отдавать кадр по сети
+        name = f"photo{random.randint(1, 5)}.jpg"
+        if name not in cls._samples:
+            with open(name, "rb") as f:
+                cls._samples[name] = f.read()
+        return cls._samples[name]
+    
     @staticmethod
     def take_photo(id: int):
         #тут он по адресу из 2гиса находит нужную остановку в пуле камер,
@@ -1,23 +1,25 @@
-import os
-
-from ultralytics import YOLO
+import cv2
 
 
 class YoloDetector:  
     
-    def __init__(self, model):
-        self.model = model
+    def __init__(self, backend, pipeline):
+        # backend - один из бэкендов из Backends.py
+        self.backend = backend
+        self.pipeline = pipeline
+
+    def detect_batch(self, sources):
+        # кадры в памяти приводятся к размеру модели в заранее выделенных буферах
+        frames = self.pipeline.prepare_batch(sources)
+        # один проход модели на весь пакет изображений
+        return self.backend.count_people(frames)
     
     def detect(self, path):
-        results = self.model(path)
-
-        people_count = 0
-        for r in results:
-            for box in r.boxes:
-                if r.names[int(box.cls)] == "person":
-                    people_count += 1
-                    
-        results[0].show()
+        image = cv2.imread(path)
+        # imread не бросает исключений, а возвращает None
+        if image is None:
+            raise ValueError(f"Не удалось прочитать изображение: {path}")
+        people_count = self.detect_batch([image])[0]
                     
         
                    
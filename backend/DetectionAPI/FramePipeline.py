@@ -0,0 +1,76 @@
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Размеры кадров в загрузках произвольные, поэтому буферы уменьшенных
+# кадров хранятся только для последних размеров
+MAX_RESIZE_BUFFERS = 2
+
+
+class FramePipeline:
+    # Декодирует кадры из байтов в памяти и приводит их к квадрату
+    # input_size x input_size с сохранением пропорций (letterbox).
+    # Буферы под пакет выделяются один раз и переиспользуются, поэтому
+    # prepare_batch можно вызывать только из одного потока одновременно
+
+    def __init__(self, input_size=640, max_batch_size=8):
+        self.input_size = input_size
+        self.batch_buffer = np.empty(
+            (max_batch_size, input_size, input_size, 3), dtype=np.uint8
+        )
+        self.resize_buffers = OrderedDict()
+
+    @staticmethod
+    def decode(data):
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError("Не удалось декодировать изображение")
+        return frame
+
+    def _resize(self, frame):
+        height, width = frame.shape[:2]
+        scale = min(self.input_size / height, self.input_size / width)
+        size = (
+            max(1, min(self.input_size, round(height * scale))),
+            max(1, min(self.input_size, round(width * scale))),
+        )
+        if size == (height, width):
+            return frame
+
+        # кадры с одной камеры обычно одного размера, буфер переиспользуется
+        buffer = self.resize_buffers.get(size)
+        if buffer is None:
+            buffer = np.empty((*size, 3), dtype=np.uint8)
+            self.resize_buffers[size] = buffer
+            if len(self.resize_buffers) > MAX_RESIZE_BUFFERS:
+                self.resize_buffers.popitem(last=False)
+        else:
+            self.resize_buffers.move_to_end(size)
+        return cv2.resize(
+            frame, (size[1], size[0]), dst=buffer, interpolation=cv2.INTER_LINEAR
+        )
+
+    def letterbox(self, frame, out):
+        resized = self._resize(frame)
+        height, width = resized.shape[:2]
+        top = (self.input_size - height) // 2
+        left = (self.input_size - width) // 2
+
+        out.fill(114)
+        out[top:top + height, left:left + width] = resized
+        return out
+
+    def prepare_batch(self, frames):
+        if len(frames) > len(self.batch_buffer):
+            self.batch_buffer = np.empty(
+                (len(frames), self.input_size, self.input_size, 3), dtype=np.uint8
+            )
+
+        return [
+            self.letterbox(
+                self.decode(frame) if isinstance(frame, bytes) else frame,
+                self.batch_buffer[i],
+            )
+            for i, frame in enumerate(frames)
+        ]
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+from Metrics import BATCH_SIZE, INFERENCE, QUEUE_WAIT
+
+
+class MicroBatcher:
+    # Собирает одновременные запросы в один пакет: ждет до max_batch_size
+    # изображений или max_wait_ms миллисекунд с момента первого запроса,
+    # затем выполняет один вызов модели на весь пакет
+
+    def __init__(self, detector, max_batch_size=8, max_wait_ms=10):
+        self.detector = detector
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.worker = None
+
+    def start(self):
+        self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, source):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((source, future, time.monotonic()))
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Запросы, которые уже отменили, в модель не передаем
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            started = time.monotonic()
+            for _, _, queued in batch:
+                QUEUE_WAIT.observe(started - queued)
+            BATCH_SIZE.observe(len(batch))
+
+            sources = [source for source, _, _ in batch]
+            try:
+                counts = await asyncio.to_thread(self.detector.detect_batch, sources)
+                INFERENCE.observe(time.monotonic() - started)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future, _), count in zip(batch, counts):
+                if not future.done():
+                    future.set_result(count)
@@ -0,0 +1,50 @@
+import bisect
+
+# Гистограммы в текстовом формате Prometheus для эндпоинта /metrics
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        # последняя корзина - +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        cumulative = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+
+def render_gauge(name, documentation, value):
+    return [
+        f"# HELP {name} {documentation}",
+        f"# TYPE {name} gauge",
+        f"{name} {value}",
+    ]
+
+
+QUEUE_WAIT = Histogram(
+    "detection_queue_wait_seconds", "Время ожидания кадра в очереди до запуска пакета"
+)
+INFERENCE = Histogram("detection_inference_seconds", "Время инференса одного пакета")
+BATCH_SIZE = Histogram(
+    "detection_batch_size", "Количество кадров в пакете", buckets=(1, 2, 4, 8, 16, 32)
+)
+DECODE = Histogram("detection_decode_seconds", "Время декодирования кадра")
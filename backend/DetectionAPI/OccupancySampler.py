@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class OccupancySampler:
+    # Периодически снимает загруженность станций через камеру и детектор.
+    # Станции, которые недавно встречались в запросах маршрутов, опрашиваются
+    # раз в hot_interval секунд, остальные - раз в cold_interval.
+    # Показания хранятся в кольцевых буферах NumPy (строка на станцию),
+    # сглаженное значение (экспоненциальное среднее) читается за O(1)
+
+    def __init__(
+        self,
+        camera,
+        pipeline,
+        batcher,
+        window=32,
+        hot_interval=15,
+        cold_interval=120,
+        hot_window=600,
+        alpha=0.3,
+        tick=1.0,
+        max_per_tick=16,
+    ):
+        self.camera = camera
+        self.pipeline = pipeline
+        self.batcher = batcher
+        self.window = window
+        self.hot_interval = hot_interval
+        self.cold_interval = cold_interval
+        self.hot_window = hot_window
+        self.alpha = alpha
+        self.tick = tick
+        self.max_per_tick = max_per_tick
+        self.worker = None
+
+        self.rows = {}
+        self.station_ids = []
+
+        capacity = 64
+        self.history = np.full((capacity, window), np.nan, dtype=np.float32)
+        self.sampled_at = np.full((capacity, window), np.nan)
+        self.heads = np.zeros(capacity, dtype=np.int64)
+        self.smoothed = np.full(capacity, np.nan, dtype=np.float32)
+        self.last_sampled = np.full(capacity, -np.inf)
+        self.last_requested = np.full(capacity, -np.inf)
+
+    @staticmethod
+    def _grow(array, fill):
+        grown = np.full((2 * len(array),) + array.shape[1:], fill, dtype=array.dtype)
+        grown[: len(array)] = array
+        return grown
+
+    def _row(self, station_id):
+        row = self.rows.get(station_id)
+        if row is None:
+            row = len(self.station_ids)
+            if row == len(self.heads):
+                self.history = self._grow(self.history, np.nan)
+                self.sampled_at = self._grow(self.sampled_at, np.nan)
+                self.heads = self._grow(self.heads, 0)
+                self.smoothed = self._grow(self.smoothed, np.nan)
+                self.last_sampled = self._grow(self.last_sampled, -np.inf)
+                self.last_requested = self._grow(self.last_requested, -np.inf)
+            self.rows[station_id] = row
+            self.station_ids.append(station_id)
+        return row
+
+    def track(self, station_ids):
+        # отмечаем станции как недавно запрошенные
+        now = time.monotonic()
+        for station_id in station_ids:
+            row = self._row(station_id)
+            self.last_requested[row] = now
+
+    def record(self, station_id, value, now=None):
+        now = time.monotonic() if now is None else now
+        row = self._row(station_id)
+        position = self.heads[row] % self.window
+        self.history[row, position] = value
+        self.sampled_at[row, position] = now
+        self.heads[row] += 1
+        self.last_sampled[row] = now
+
+        previous = self.smoothed[row]
+        self.smoothed[row] = (
+            value
+            if np.isnan(previous)
+            else self.alpha * value + (1 - self.alpha) * previous
+        )
+
+    def current(self, station_id):
+        row = self.rows.get(station_id)
+        if row is None or np.isnan(self.smoothed[row]):
+            return None
+        return float(self.smoothed[row])
+
+    def snapshot(self):
+        count = len(self.station_ids)
+        values = self.smoothed[:count]
+        return {
+            self.station_ids[row]: float(values[row])
+            for row in np.flatnonzero(~np.isnan(values))
+        }
+
+    def series(self, station_id):
+        # показания станции в хронологическом порядке
+        row = self.rows.get(station_id)
+        if row is None:
+            return []
+        order = np.roll(np.arange(self.window), -(self.heads[row] % self.window))
+        values = self.history[row, order]
+        times = self.sampled_at[row, order]
+        known = ~np.isnan(values)
+        return list(zip(times[known].tolist(), values[known].tolist()))
+
+    def due(self, now):
+        count = len(self.station_ids)
+        if not count:
+            return []
+
+        hot = now - self.last_requested[:count] <= self.hot_window
+        intervals = np.where(hot, self.hot_interval, self.cold_interval)
+        overdue = (now - self.last_sampled[:count]) / intervals
+        rows = np.flatnonzero(overdue >= 1)
+        # сначала станции, которые дольше всех ждут опроса
+        rows = rows[np.argsort(-overdue[rows], kind="stable")][: self.max_per_tick]
+        return [self.station_ids[row] for row in rows]
+
+    async def sample(self, station_ids):
+        now = time.monotonic()
+        frames = await asyncio.gather(
+            *(
+                asyncio.to_thread(self.pipeline.decode, self.camera.fetch_frame(s))
+                for s in station_ids
+            )
+        )
+        counts = await asyncio.gather(*(self.batcher.submit(f) for f in frames))
+        for station_id, count in zip(station_ids, counts):
+            self.record(station_id, count, now)
+
+    async def _run(self):
+        while True:
+            station_ids = self.due(time.monotonic())
+            if station_ids:
+                try:
+                    await self.sample(station_ids)
+                except Exception:
+                    logger.exception("Ошибка при опросе станций")
+                    # не повторяем опрос сломанных станций на каждом тике
+                    now = time.monotonic()
+                    for station_id in station_ids:
+                        self.last_sampled[self.rows[station_id]] = now
+            await asyncio.sleep(self.tick)
+
+    def start(self):
+        self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
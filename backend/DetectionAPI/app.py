@@ -1,25 +1,160 @@
-from fastapi import FastAPI
-from ultralytics import YOLO
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
 
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+from Backends import create_backend
 from Camera import Camera
 from Detector import YoloDetector
+from FramePipeline import FramePipeline
+from InferenceQueue import MicroBatcher
+from Metrics import BATCH_SIZE, DECODE, INFERENCE, QUEUE_WAIT, render_gauge
+from OccupancySampler import OccupancySampler
+
+path_to_model = os.getenv("MODEL_PATH", "peopleDetectionModel.pt")
+input_size = int(os.getenv("MODEL_INPUT_SIZE", 640))
+max_batch_size = int(os.getenv("BATCH_MAX_SIZE", 8))
 
-path_to_model = "peopleDetectionModel.pt"
-model = YOLO(path_to_model)
+# бэкенд выбирается под тип узла: torch, onnx или openvino
+backend = create_backend(
+    os.getenv("INFERENCE_BACKEND", "torch"),
+    path_to_model,
+    threads=int(os.getenv("INFERENCE_THREADS", 0)) or None,
+    int8=os.getenv("INFERENCE_INT8", "0") == "1",
+    input_size=input_size,
+    person_class=int(os.getenv("PERSON_CLASS_ID", 0)),
+)
 
 camera = Camera()
-detector = YoloDetector(model)
+pipeline = FramePipeline(input_size=input_size, max_batch_size=max_batch_size)
+detector = YoloDetector(backend, pipeline)
+batcher = MicroBatcher(
+    detector,
+    max_batch_size=max_batch_size,
+    max_wait_ms=float(os.getenv("BATCH_MAX_WAIT_MS", 10)),
+)
+# фоновый опрос камер, чтобы загруженность не считалась в момент запроса маршрута
+sampler = OccupancySampler(
+    camera,
+    pipeline,
+    batcher,
+    hot_interval=float(os.getenv("SAMPLER_HOT_INTERVAL", 15)),
+    cold_interval=float(os.getenv("SAMPLER_COLD_INTERVAL", 120)),
+    hot_window=float(os.getenv("SAMPLER_HOT_WINDOW", 600)),
+    alpha=float(os.getenv("SAMPLER_SMOOTHING_ALPHA", 0.3)),
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    batcher.start()
+    sampler.start()
+    yield
+    await sampler.stop()
+    await batcher.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+class StationsRequest(BaseModel):
+    station_ids: List[str]
+
+
+class StationsWorkloadResponse(BaseModel):
+    workloads: Dict[str, int]
+
+
+class OccupancyResponse(BaseModel):
+    workloads: Dict[str, float]
+
+
+class StationSeriesResponse(BaseModel):
+    station_id: str
+    current: Optional[float]
+    series: List[Tuple[float, float]]
+
+
+def decode_timed(data):
+    start = time.perf_counter()
+    frame = pipeline.decode(data)
+    DECODE.observe(time.perf_counter() - start)
+    return frame
+
+
+async def decode_frame(data):
+    try:
+        return await asyncio.to_thread(decode_timed, data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-app = FastAPI()
 
 @app.get("/count_people")
-def count_people(station_id):
-    path_to_photo = camera.take_photo(station_id)
-    count_people = detector.detect(path_to_photo)
+async def count_people(station_id):
+    frame = await decode_frame(camera.fetch_frame(station_id))
+    count_people = await batcher.submit(frame)
     
     return count_people
 
 
+@app.post("/count_people_image")
+async def count_people_image(request: Request):
+    # тело запроса - закодированное изображение (jpeg, png)
+    frame = await decode_frame(await request.body())
+    return await batcher.submit(frame)
+
+
+@app.post("/count_people_batch")
+async def count_people_batch(request: StationsRequest) -> StationsWorkloadResponse:
+    station_ids = list(dict.fromkeys(request.station_ids))
+    # все станции попадают в очередь сразу и обрабатываются общими пакетами
+    frames = await asyncio.gather(
+        *(decode_frame(camera.fetch_frame(station_id)) for station_id in station_ids)
+    )
+    counts = await asyncio.gather(*(batcher.submit(frame) for frame in frames))
+
+    return StationsWorkloadResponse(workloads=dict(zip(station_ids, counts)))
+
+
+@app.post("/occupancy")
+async def occupancy(request: StationsRequest) -> OccupancyResponse:
+    # станции из запроса опрашиваются чаще; в ответе - сглаженная
+    # загруженность всех станций, по которым уже есть показания
+    sampler.track(request.station_ids)
+    return OccupancyResponse(workloads=sampler.snapshot())
+
+
+@app.get("/occupancy/{station_id}")
+async def station_occupancy(station_id: str) -> StationSeriesResponse:
+    return StationSeriesResponse(
+        station_id=station_id,
+        current=sampler.current(station_id),
+        series=sampler.series(station_id),
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    lines = []
+    for histogram in (QUEUE_WAIT, INFERENCE, BATCH_SIZE, DECODE):
+        lines.extend(histogram.render())
+    lines.extend(
+        render_gauge(
+            "detection_queue_depth",
+            "Кадры в очереди на инференс",
+            batcher.queue.qsize(),
+        )
+    )
+    return PlainTextResponse(
+        "\n".join(lines) + "\n", media_type="text/plain; version=0.0.4"
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
 
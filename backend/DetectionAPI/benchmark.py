@@ -0,0 +1,86 @@
+# Сравнение бэкендов инференса на тестовых снимках photo*.jpg
+#
+#   python benchmark.py --backends torch onnx openvino --threads 4 --int8
+#
+# Для каждого бэкенда выводит задержку пакета (p50, p95) и пропускную
+# способность в кадрах в секунду для каждого размера пакета
+
+import argparse
+import glob
+import time
+
+import numpy as np
+
+from Backends import create_backend
+from FramePipeline import FramePipeline
+
+
+def load_frames(pipeline):
+    frames = []
+    for path in sorted(glob.glob("photo*.jpg")):
+        with open(path, "rb") as f:
+            frames.append(pipeline.decode(f.read()))
+    return frames
+
+
+def run(backend, pipeline, frames, batch_size, iterations, warmup):
+    batch = [frames[i % len(frames)] for i in range(batch_size)]
+    for _ in range(warmup):
+        backend.count_people(pipeline.prepare_batch(batch))
+
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        backend.count_people(pipeline.prepare_batch(batch))
+        latencies.append(time.perf_counter() - start)
+
+    latencies = np.array(latencies)
+    return {
+        "p50_ms": np.percentile(latencies, 50) * 1000,
+        "p95_ms": np.percentile(latencies, 95) * 1000,
+        "fps": batch_size * iterations / latencies.sum(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="peopleDetectionModel.pt")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "openvino"])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8])
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--int8", action="store_true")
+    parser.add_argument("--input-size", type=int, default=640)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    args = parser.parse_args()
+
+    pipeline = FramePipeline(args.input_size, max(args.batch_sizes))
+    frames = load_frames(pipeline)
+
+    print(f"{'backend':<10} {'batch':>5} {'p50, ms':>10} {'p95, ms':>10} {'fps':>8}")
+    for name in args.backends:
+        try:
+            backend = create_backend(
+                name,
+                args.model,
+                threads=args.threads,
+                int8=args.int8,
+                input_size=args.input_size,
+            )
+        except Exception as e:
+            # бэкенд не установлен или модель не загрузилась - меряем остальные
+            print(f"{name:<10} пропущен: {e}")
+            continue
+
+        for batch_size in args.batch_sizes:
+            stats = run(
+                backend, pipeline, frames, batch_size, args.iterations, args.warmup
+            )
+            print(
+                f"{name:<10} {batch_size:>5} {stats['p50_ms']:>10.1f} "
+                f"{stats['p95_ms']:>10.1f} {stats['fps']:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Промежуточные обработчики (ASGI middleware) приложения.
+"""
+import time
+import uuid
+
+from apiserver.app.services.logs import correlation_id
+from apiserver.app.services.metrics import (
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUESTS_IN_FLIGHT,
+    request_timings,
+)
+
+
+class TimingMiddleware:
+    """
+    Измеряет время обработки HTTP-запросов и собирает тайминги этапов.
+
+    При timing_headers=True добавляет в ответ заголовок Server-Timing
+    с временем этапов, завершившихся до отправки заголовков ответа.
+    """
+
+    def __init__(self, app, timing_headers: bool = False):
+        self.app = app
+        self.timing_headers = timing_headers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        timings = {}
+        token = request_timings.set(timings)
+        status = "500"
+
+        async def send_with_timings(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                if self.timing_headers:
+                    timings["total"] = time.perf_counter() - start
+                    value = ", ".join(
+                        f"{name};dur={elapsed * 1000:.1f}"
+                        for name, elapsed in timings.items()
+                    )
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (b"server-timing", value.encode()),
+                    ]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            request_timings.reset(token)
+            # Метка - имя обработчика, а не путь, чтобы не плодить метки
+            # по параметрам пути
+            endpoint = scope.get("endpoint")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                handler=getattr(endpoint, "__name__", "unmatched"),
+                status=status,
+            )
+
+
+class CorrelationIdMiddleware:
+    """
+    Присваивает запросу идентификатор для журнала.
+
+    Идентификатор берется из заголовка X-Request-ID (если клиент или
+    балансировщик его передал) или генерируется и возвращается в ответе.
+    """
+
+    header = b"x-request-id"
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = dict(scope["headers"]).get(self.header, b"").decode("latin-1")
+        # Ограничиваем длину, чтобы клиент не раздувал записи журнала
+        request_id = request_id[:64] or uuid.uuid4().hex
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (self.header, request_id.encode("latin-1")),
+                ]
+            await send(message)
+
+        token = correlation_id.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            correlation_id.reset(token)
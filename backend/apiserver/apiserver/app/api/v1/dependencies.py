@@ -0,0 +1,29 @@
+"""
+Зависимости эндпоинтов API v1.
+"""
+from fastapi import Request
+
+from apiserver.app.services.public_transport import PublicTransportService
+from apiserver.app.services.route_planner import RoutePlannerService
+from apiserver.app.services.telemetry import TelemetryCollector
+from apiserver.app.services.transport_workload import TransportWorkloadService
+
+
+def get_public_transport_service(request: Request) -> PublicTransportService:
+    """Возвращает сервис построения маршрутов, созданный при запуске приложения."""
+    return request.app.state.public_transport_service
+
+
+def get_transport_workload_service(request: Request) -> TransportWorkloadService:
+    """Возвращает сервис загруженности транспорта, созданный при запуске приложения."""
+    return request.app.state.transport_workload_service
+
+
+def get_route_planner_service(request: Request) -> RoutePlannerService:
+    """Возвращает сервис выбора маршрутов, созданный при запуске приложения."""
+    return request.app.state.route_planner_service
+
+
+def get_telemetry_collector(request: Request) -> TelemetryCollector:
+    """Возвращает коллектор телеметрии, запущенный при запуске приложения."""
+    return request.app.state.telemetry_collector
@@ -0,0 +1,44 @@
+"""
+Эндпоинт метрик в текстовом формате Prometheus.
+"""
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from apiserver.app.api.v1.dependencies import (
+    get_public_transport_service,
+    get_transport_workload_service,
+)
+from apiserver.app.services.metrics import (
+    REGISTRY,
+    cache_metrics,
+    single_flight_metrics,
+)
+from apiserver.app.services.public_transport import PublicTransportService
+from apiserver.app.services.transport_workload import TransportWorkloadService
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics(
+    transport_service: PublicTransportService = Depends(get_public_transport_service),
+    transport_workload_service: TransportWorkloadService = Depends(
+        get_transport_workload_service
+    ),
+) -> PlainTextResponse:
+    """
+    Метрики приложения: время этапов построения маршрутов и запросов
+    к внешним API, попадания в кэши и объединение запросов.
+    """
+    caches = {
+        **transport_service.cache_stats(),
+        "station_workload": transport_workload_service.workload_cache.stats(),
+    }
+    lines = [
+        *REGISTRY.collect(),
+        *cache_metrics(caches),
+        *single_flight_metrics(transport_service.single_flight_stats()),
+    ]
+    return PlainTextResponse(
+        "\n".join(lines) + "\n", media_type="text/plain; version=0.0.4"
+    )
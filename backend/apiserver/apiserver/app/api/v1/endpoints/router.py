@@ -5,6 +5,7 @@ from fastapi import APIRouter
 
 from apiserver.config.settings import settings
 
+from .metrics import metrics
 from .routes import routes
 from .status import status
 
@@ -16,3 +17,6 @@ api_router.include_router(status.router, prefix="", tags=["status"])
 
 # Подключаем роутер для работы с маршрутами
 api_router.include_router(routes.router, prefix="/routes", tags=["routes"])
+
+# Подключаем роутер метрик Prometheus
+api_router.include_router(metrics.router, prefix="", tags=["metrics"])
@@ -1,117 +1,176 @@
 """
 Эндпоинты для построения маршрутов.
 """
-from fastapi import APIRouter
-from loguru import logger
-
-from apiserver.app.api.v1.schemas.routes import RouteByCoordinatesRequest, RouteResponse
-from apiserver.app.services.public_transport import PublicTransportService
-from apiserver.app.services.transport_workload import TransportWorkloadService
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from apiserver.app.api.v1.dependencies import get_route_planner_service
+from apiserver.app.api.v1.responses import ORJSONResponse
+from apiserver.app.api.v1.schemas.routes import (
+    BatchRouteRequest,
+    BatchRouteResponse,
+    CompactBatchRouteResponse,
+    CompactRouteResponse,
+    RouteByCoordinatesRequest,
+    RouteResponse,
+    RouteStreamEvent,
+)
+from apiserver.app.services.route_compaction import (
+    COMPACT_ROUTE_FIELDS,
+    CompactRouteSet,
+)
+from apiserver.app.services.route_planner import PlanProgress, RoutePlannerService
+from apiserver.app.services.route_ranking import RankedRoutes
 
 router = APIRouter()
 
 
-@router.post("/build_routes")
+def compact_route_set(
+    compact: bool = Query(
+        False, description="Вернуть компактные маршруты без повторов"
+    ),
+    fields: Optional[str] = Query(
+        None,
+        description="Поля компактных маршрутов через запятую "
+        f"({', '.join(COMPACT_ROUTE_FIELDS)}); включает компактный ответ",
+    ),
+) -> Optional[CompactRouteSet]:
+    """Возвращает набор компактных маршрутов ответа или None для полного ответа."""
+    if fields is None:
+        return CompactRouteSet() if compact else None
+
+    selected: List[str] = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = set(selected) - set(COMPACT_ROUTE_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неизвестные поля маршрута: {', '.join(sorted(unknown))}",
+        )
+    return CompactRouteSet(selected)
+
+
+def route_picks(ranked: RankedRoutes) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Формирует поля RouteResponse из результата ранжирования маршрутов."""
+    return {
+        "fastest_route": ranked.fastest,
+        "balanced_route": ranked.balanced,
+        "least_crowded_route": ranked.least_crowded,
+    }
+
+
+@router.post(
+    "/build_routes",
+    response_model=Union[RouteResponse, CompactRouteResponse],
+)
 async def build_routes_by_coordinates(
     request: RouteByCoordinatesRequest,
-) -> RouteResponse:
+    route_planner: RoutePlannerService = Depends(get_route_planner_service),
+    route_set: Optional[CompactRouteSet] = Depends(compact_route_set),
+) -> ORJSONResponse:
     """
     Получить оптимальные маршруты для пользователя
     """
-
-    transport_service = PublicTransportService()
-
-    # Находим остановки в радиусе от начальной точки
-    initial_stops = await transport_service.find_nearest_stops(
-        lat=request.start.latitude, lon=request.start.longitude
+    ranked = await route_planner.plan(
+        request.start.latitude,
+        request.start.longitude,
+        request.end.latitude,
+        request.end.longitude,
     )
-    end_stops = await transport_service.find_nearest_stops(
-        lat=request.end.latitude, lon=request.end.longitude
-    )
-    logger.info(
-        f"Найдено {len(initial_stops)} остановок общественного транспорта у начальной точки"
-    )
-    logger.info(
-        f"Найдено {len(end_stops)} остановок общественного транспорта у конечной точки"
+    if route_set is None:
+        return ORJSONResponse(route_picks(ranked))
+
+    picks = route_set.add_ranked(ranked)
+    return ORJSONResponse({"routes": route_set.routes, **picks})
+
+
+@router.post(
+    "/build_routes_stream",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "content": {"application/x-ndjson": {}},
+            "model": RouteStreamEvent,
+        }
+    },
+)
+async def build_routes_stream(
+    request: RouteByCoordinatesRequest,
+    route_planner: RoutePlannerService = Depends(get_route_planner_service),
+) -> StreamingResponse:
+    """
+    Получить оптимальные маршруты по мере их построения.
+
+    Ответ - поток NDJSON: по строке RouteStreamEvent с event="update" при
+    каждом изменении выбора маршрутов и последняя строка с event="final".
+    """
+    points = (
+        request.start.latitude,
+        request.start.longitude,
+        request.end.latitude,
+        request.end.longitude,
     )
+    # До начала потока: после отправки заголовков ошибку каталога
+    # остановок (HTTPException) клиент уже не получит
+    initial_stops, end_stops = await route_planner.find_stops(*points)
+
+    async def events() -> AsyncIterator[bytes]:
+        async for progress in route_planner.plan_progressive(
+            *points, initial_stops, end_stops
+        ):
+            yield stream_event(progress)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+def stream_event(progress: PlanProgress) -> bytes:
+    """Формирует строку потока NDJSON."""
+    event = {
+        "event": "final" if progress.final else "update",
+        "routes_built": progress.routes_built,
+        "routes_total": progress.routes_total,
+        **route_picks(progress.ranked),
+    }
+    return orjson.dumps(event, option=orjson.OPT_APPEND_NEWLINE)
+
+
+@router.post(
+    "/build_routes_batch",
+    response_model=Union[BatchRouteResponse, CompactBatchRouteResponse],
+)
+async def build_routes_batch(
+    request: BatchRouteRequest,
+    route_planner: RoutePlannerService = Depends(get_route_planner_service),
+    route_set: Optional[CompactRouteSet] = Depends(compact_route_set),
+) -> ORJSONResponse:
+    """
+    Получить оптимальные маршруты для пакета пар точек.
 
-    # Проверяем, что найдены остановки как у начальной, так и у конечной точки
-    if not initial_stops or not end_stops:
-        logger.warning("Не найдены остановки у начальной или конечной точки")
-        return RouteResponse(
-            fastest_route=None, balanced_route=None, least_crowded_route=None
+    Общие поиски остановок и построения маршрутов между одинаковыми парами
+    остановок выполняются один раз на весь пакет.
+    """
+    max_size = route_planner.batch_max_size
+    if len(request.pairs) > max_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Слишком много пар точек в пакете (максимум {max_size})",
         )
 
-    # Создаем список для хранения всех найденных маршрутов
-    all_routes = []
-
-    # Для каждой пары остановок строим маршрут
-    for initial_stop in initial_stops:
-        start_point = initial_stop.get("point", {})
-        start_lat = start_point.get("lat")
-        start_lon = start_point.get("lon")
-
-        if not start_lat or not start_lon:
-            continue
-
-        for end_stop in end_stops:
-            end_stop_lat = end_stop["point"].get("lat")
-            end_stop_lon = end_stop["point"].get("lon")
-
-            if not end_stop_lat or not end_stop_lon:
-                continue
-
-            # Строим маршрут между остановками
-            route = await transport_service.build_public_transport_route(
-                start_lat=start_lat,
-                start_lon=start_lon,
-                end_lat=end_stop_lat,
-                end_lon=end_stop_lon,
+    results = await route_planner.plan_batch(
+        [
+            (
+                pair.start.latitude,
+                pair.start.longitude,
+                pair.end.latitude,
+                pair.end.longitude,
             )
-            if route:
-                all_routes.append(route)
-
-    logger.info(f"Всего построено {len(all_routes)} маршрутов")
-    if len(all_routes) == 0:
-        logger.warning("Не найдены маршруты")
-        return RouteResponse(
-            fastest_route=None, balanced_route=None, least_crowded_route=None
-        )
-
-    transport_workload_service = TransportWorkloadService()
-    all_routes_with_workload = transport_workload_service.set_routes_workload(
-        all_routes
+            for pair in request.pairs
+        ]
     )
+    if route_set is None:
+        return ORJSONResponse({"results": [route_picks(ranked) for ranked in results]})
 
-    # Если маршрутов нет после расчета загруженности
-    if not all_routes_with_workload:
-        return RouteResponse(
-            fastest_route=None, balanced_route=None, least_crowded_route=None
-        )
-
-    # Создаем список для результатов
-    fastest_route = None
-    least_crowded_route = None
-    balanced_route = None
-
-    # Сортируем по времени для получения самого быстрого маршрута
-    all_routes_with_workload.sort(key=lambda x: x.get("total_duration", float("inf")))
-    fastest_route = all_routes_with_workload[0]
-
-    # Сортируем по загруженности для получения наименее загруженного маршрута
-    all_routes_with_workload.sort(key=lambda x: x.get("workload", float("inf")))
-    least_crowded_route = all_routes_with_workload[0]
-
-    # Получаем Парето-оптимальные маршруты
-    pareto_optimal_routes = transport_workload_service.get_pareto_optimal(
-        all_routes_with_workload
-    )
-    if pareto_optimal_routes:
-        # Выбираем первый из Парето-оптимальных маршрутов как сбалансированный
-        balanced_route = pareto_optimal_routes[0]
-
-    return RouteResponse(
-        fastest_route=fastest_route,
-        balanced_route=balanced_route,
-        least_crowded_route=least_crowded_route,
-    )
+    picks = [route_set.add_ranked(ranked) for ranked in results]
+    return ORJSONResponse({"routes": route_set.routes, "results": picks})
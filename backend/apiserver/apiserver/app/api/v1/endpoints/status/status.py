@@ -6,14 +6,20 @@ import time
 from datetime import datetime
 
 import psutil
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from loguru import logger
 
+from apiserver.app.api.v1.dependencies import (
+    get_public_transport_service,
+    get_telemetry_collector,
+)
 from apiserver.app.api.v1.schemas.status import (
     HealthResponse,
     RootResponse,
     StatusResponse,
 )
+from apiserver.app.services.public_transport import PublicTransportService
+from apiserver.app.services.telemetry import TelemetryCollector
 from apiserver.config.settings import settings
 
 router = APIRouter()
@@ -49,15 +55,21 @@ async def health_check():
 
 
 @router.get("/status", response_model=StatusResponse)
-async def status():
+async def status(
+    transport_service: PublicTransportService = Depends(get_public_transport_service),
+    telemetry_collector: TelemetryCollector = Depends(get_telemetry_collector),
+):
     """
     Подробная информация о состоянии приложения.
-    Возвращает информацию о системе, использовании ресурсов и времени работы.
+    Возвращает информацию о системе, использовании ресурсов, времени работы
+    и попаданиях в кэши. Использование ресурсов берется из последнего снимка
+    фонового коллектора телеметрии и сводится по всем процессам uvicorn.
     """
     logger.info("Status request received")
 
-    # Получение информации о системе
-    memory = psutil.virtual_memory()
+    # Последний снимок телеметрии (пустой, пока коллектор не отработал)
+    telemetry = telemetry_collector.snapshot
+    system = telemetry.get("system", {})
 
     # Подготовка ответа
     response = StatusResponse(
@@ -72,12 +84,15 @@ async def status():
             "hostname": platform.node(),
         },
         memory_usage={
-            "total": memory.total,
-            "available": memory.available,
-            "percent": memory.percent,
+            "total": system.get("memory_total", 0),
+            "available": system.get("memory_available", 0),
+            "percent": system.get("memory_percent", 0.0),
         },
-        cpu_usage=psutil.cpu_percent(interval=0.1),
+        cpu_usage=system.get("cpu_percent", 0.0),
+        caches=transport_service.cache_stats(),
+        single_flight=transport_service.single_flight_stats(),
+        telemetry=telemetry,
     )
 
-    logger.info(f"Status response: running in {settings.ENVIRONMENT} environment")
+    logger.info("Status response: running in {} environment", settings.ENVIRONMENT)
     return response
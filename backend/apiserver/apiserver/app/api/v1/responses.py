@@ -0,0 +1,19 @@
+"""
+Классы ответов API v1.
+"""
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+from apiserver.app.services.metrics import stage
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON-ответ, сериализуемый orjson без проверки моделью Pydantic."""
+
+    def render(self, content: Any) -> bytes:
+        with stage("serialization"):
+            return orjson.dumps(
+                content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            )
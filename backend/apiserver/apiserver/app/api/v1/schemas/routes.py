@@ -1,4 +1,4 @@
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel
 
@@ -20,3 +20,71 @@ class RouteResponse(BaseModel):
     fastest_route: dict | None
     balanced_route: dict | None
     least_crowded_route: dict | None
+
+
+class CompactMovement(BaseModel):
+    """Участок маршрута: тип, длительности, остановка, транспорт и геометрия (WKT)"""
+
+    type: Optional[str] = None
+    distance: Optional[float] = None
+    moving_duration: Optional[float] = None
+    waiting_duration: Optional[float] = None
+    waypoint_name: Optional[str] = None
+    routes_names: List[str] = []
+    geometry: List[str] = []
+
+
+class CompactRoute(BaseModel):
+    """Маршрут с полями, нужными клиентам; отсутствуют поля, не выбранные в fields"""
+
+    id: str
+    total_duration: Optional[float] = None
+    total_distance: Optional[float] = None
+    transfer_count: Optional[int] = None
+    walking_distance: Optional[float] = None
+    workload: Optional[float] = None
+    movements: Optional[List[CompactMovement]] = None
+
+
+class CompactRouteResponse(BaseModel):
+    """Ответ с компактными маршрутами; выбранные маршруты - идентификаторы в routes"""
+
+    routes: Dict[str, CompactRoute]
+    fastest_route: Optional[str]
+    balanced_route: Optional[str]
+    least_crowded_route: Optional[str]
+
+
+class RouteStreamEvent(RouteResponse):
+    """Промежуточный (update) или окончательный (final) выбор маршрутов"""
+
+    event: str
+    routes_built: int
+    routes_total: int
+
+
+class BatchRouteRequest(BaseModel):
+    """Запрос маршрутов для пакета пар точек"""
+
+    pairs: List[RouteByCoordinatesRequest]
+
+
+class BatchRouteResponse(BaseModel):
+    """Ответ с маршрутами для каждой пары точек в порядке запроса"""
+
+    results: List[RouteResponse]
+
+
+class CompactRouteIds(BaseModel):
+    """Идентификаторы выбранных маршрутов"""
+
+    fastest_route: Optional[str]
+    balanced_route: Optional[str]
+    least_crowded_route: Optional[str]
+
+
+class CompactBatchRouteResponse(BaseModel):
+    """Ответ с компактными маршрутами, общими для всех пар точек пакета"""
+
+    routes: Dict[str, CompactRoute]
+    results: List[CompactRouteIds]
@@ -16,6 +16,9 @@ class StatusResponse(BaseModel):
     system_info: Dict[str, Any]
     memory_usage: Dict[str, Any]
     cpu_usage: float
+    caches: Dict[str, Dict[str, Any]] = {}
+    single_flight: Dict[str, Dict[str, Any]] = {}
+    telemetry: Dict[str, Any] = {}
 
 
 class RootResponse(BaseModel):
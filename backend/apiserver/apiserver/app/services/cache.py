@@ -0,0 +1,107 @@
+"""
+Кэш в памяти с ограничением размера (LRU) и временем жизни записей (TTL).
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Кэш, вытесняющий давно неиспользуемые записи при переполнении
+    и не возвращающий записи с истекшим временем жизни.
+
+    Записи с истекшим временем жизни еще stale_ttl секунд доступны через
+    get_stale - для ответа из кэша, когда внешний API недоступен.
+
+    Ведет счетчики попаданий и промахов.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, stale_ttl: float = 0):
+        """
+        Инициализация кэша.
+
+        Args:
+            maxsize: Максимальное количество записей
+            ttl: Время жизни записи по умолчанию в секундах
+            stale_ttl: Сколько секунд после истечения времени жизни запись
+                доступна через get_stale
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Есть ли запись с неистекшим временем жизни (счетчики не меняются)."""
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Возвращает значение по ключу.
+
+        Args:
+            key: Ключ записи
+
+        Returns:
+            Значение или None, если записи нет или ее время жизни истекло
+        """
+        entry = self._data.get(key)
+        now = time.monotonic()
+        if entry is None or entry[0] <= now:
+            if entry is not None and entry[0] + self.stale_ttl <= now:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def get_stale(self, key: Hashable) -> Optional[Any]:
+        """
+        Возвращает значение, даже если его время жизни истекло не больше
+        stale_ttl секунд назад. Счетчики попаданий и промахов не меняются.
+
+        Args:
+            key: Ключ записи
+
+        Returns:
+            Значение или None, если записи нет
+        """
+        entry = self._data.get(key)
+        if entry is None or entry[0] + self.stale_ttl <= time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Сохраняет значение, при переполнении вытесняя самую старую запись.
+
+        Args:
+            key: Ключ записи
+            value: Значение
+            ttl: Время жизни записи в секундах (по умолчанию - ttl кэша)
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает счетчики попаданий и промахов и заполненность кэша."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
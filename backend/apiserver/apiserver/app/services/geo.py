@@ -0,0 +1,110 @@
+"""
+Геометрические функции для работы с координатами.
+"""
+from typing import Tuple
+
+import numpy as np
+
+# Радиус Земли в метрах
+EARTH_RADIUS = 6371000
+
+# Длина одного градуса широты в метрах
+METERS_PER_DEGREE = EARTH_RADIUS * np.pi / 180
+
+
+def haversine(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    Векторизованно вычисляет расстояния между точками по формуле гаверсинусов.
+
+    Аргументы могут быть числами или массивами NumPy, совместимыми
+    по размерности (broadcasting).
+
+    Args:
+        lat1: Широта первых точек в градусах
+        lon1: Долгота первых точек в градусах
+        lat2: Широта вторых точек в градусах
+        lon2: Долгота вторых точек в градусах
+
+    Returns:
+        Массив расстояний в метрах
+    """
+    lat1_rad = np.radians(lat1)
+    lat2_rad = np.radians(lat2)
+    dlat = lat2_rad - lat1_rad
+    dlon = np.radians(lon2) - np.radians(lon1)
+
+    a = (
+        np.sin(dlat / 2) ** 2
+        + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(dlon / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat: float, lon: float, precision: int) -> str:
+    """
+    Кодирует точку в geohash заданной длины.
+
+    Args:
+        lat: Широта точки
+        lon: Долгота точки
+        precision: Количество символов geohash
+
+    Returns:
+        Строка geohash
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        value, value_range = (lon, lon_range) if even else (lat, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            value_range[0] = mid
+        else:
+            value_range[1] = mid
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(chars)
+
+
+def geohash_bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """
+    Возвращает границы ячейки geohash.
+
+    Args:
+        geohash: Строка geohash
+
+    Returns:
+        Кортеж (мин. широта, макс. широта, мин. долгота, макс. долгота)
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+
+    for char in geohash:
+        bits = _GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            value_range = lon_range if even else lat_range
+            mid = (value_range[0] + value_range[1]) / 2
+            if bits >> shift & 1:
+                value_range[0] = mid
+            else:
+                value_range[1] = mid
+            even = not even
+
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
@@ -0,0 +1,110 @@
+"""
+Общий HTTP-клиент для обращений к внешним API.
+
+Клиент создается один раз при запуске приложения и переиспользует
+keep-alive соединения между запросами.
+"""
+import importlib.util
+import time
+from typing import List
+
+import httpx
+from loguru import logger
+
+from apiserver.app.services.metrics import UPSTREAM_DURATION
+from apiserver.app.services.resilience import ResilientTransport, RetryBudget
+from apiserver.config.settings import settings
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """Транспорт, измеряющий время запросов к внешним API по хосту и коду ответа."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = await self.transport.handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        except Exception as e:
+            status = type(e).__name__
+            raise
+        finally:
+            UPSTREAM_DURATION.observe(
+                time.perf_counter() - start, host=request.url.host, status=status
+            )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Создает HTTP-клиент с пулом соединений по настройкам приложения.
+
+    Returns:
+        Асинхронный HTTP-клиент
+    """
+    http2 = settings.get("HTTP_CLIENT_HTTP2", False)
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("Пакет h2 не установлен, HTTP/2 отключен")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=settings.get("HTTP_CLIENT_MAX_CONNECTIONS", 100),
+        max_keepalive_connections=settings.get(
+            "HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS", 20
+        ),
+        keepalive_expiry=settings.get("HTTP_CLIENT_KEEPALIVE_EXPIRY", 30.0),
+    )
+    timeout = httpx.Timeout(
+        settings.get("HTTP_CLIENT_TIMEOUT", 10.0),
+        connect=settings.get("HTTP_CLIENT_CONNECT_TIMEOUT", 3.0),
+        pool=settings.get("HTTP_CLIENT_POOL_TIMEOUT", 5.0),
+    )
+
+    # Защита от сбоев снаружи, чтобы время каждой попытки попадало в метрики
+    transport = ResilientTransport(
+        InstrumentedTransport(httpx.AsyncHTTPTransport(limits=limits, http2=http2)),
+        max_attempts=settings.get("UPSTREAM_RETRY_MAX_ATTEMPTS", 3),
+        backoff_base=settings.get("UPSTREAM_RETRY_BACKOFF_BASE", 0.05),
+        backoff_max=settings.get("UPSTREAM_RETRY_BACKOFF_MAX", 1.0),
+        retry_budget=RetryBudget(
+            ratio=settings.get("UPSTREAM_RETRY_BUDGET_RATIO", 0.1),
+            min_per_second=settings.get("UPSTREAM_RETRY_BUDGET_MIN_PER_SECOND", 1.0),
+        ),
+        breaker_options={
+            "failure_ratio": settings.get("UPSTREAM_BREAKER_FAILURE_RATIO", 0.5),
+            "window": settings.get("UPSTREAM_BREAKER_WINDOW", 20),
+            "min_calls": settings.get("UPSTREAM_BREAKER_MIN_CALLS", 10),
+            "reset_timeout": settings.get("UPSTREAM_BREAKER_RESET_TIMEOUT", 10.0),
+        },
+        limit_options={
+            "initial": settings.get("UPSTREAM_LIMIT_INITIAL", 20),
+            "min_limit": settings.get("UPSTREAM_LIMIT_MIN", 1),
+            "max_limit": settings.get("UPSTREAM_LIMIT_MAX", 100),
+            "backoff": settings.get("UPSTREAM_LIMIT_BACKOFF", 0.5),
+        },
+        limit_timeout=settings.get("UPSTREAM_LIMIT_TIMEOUT", 1.0),
+    )
+    return httpx.AsyncClient(transport=transport, timeout=timeout)
+
+
+async def warm_up_http_client(client: httpx.AsyncClient) -> None:
+    """
+    Заранее открывает соединения с внешними API, чтобы первые запросы
+    пользователей не тратили время на установку TCP и TLS.
+
+    Args:
+        client: HTTP-клиент приложения
+    """
+    urls: List[str] = settings.get("HTTP_CLIENT_WARMUP_URLS", [])
+    for url in urls:
+        try:
+            await client.head(url)
+            logger.info("Соединение с {} установлено", url)
+        except httpx.HTTPError as e:
+            logger.warning("Не удалось прогреть соединение с {}: {}", url, e)
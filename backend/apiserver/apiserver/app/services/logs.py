@@ -0,0 +1,130 @@
+"""
+Настройка журналирования приложения.
+
+Записи журнала помечаются идентификатором запроса (correlation ID), могут
+выводиться в JSON и прореживаться по уровням. Запись в обработчики идет
+через очередь в отдельном потоке, чтобы ввод-вывод не блокировал цикл событий.
+"""
+import random
+import sys
+import traceback
+import zlib
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+import orjson
+from loguru import logger
+
+# Идентификатор текущего запроса ("-" вне запроса)
+correlation_id: ContextVar[str] = ContextVar("correlation_id", default="-")
+
+TEXT_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | "
+    "<magenta>{extra[correlation_id]}</magenta> | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - "
+    "<level>{message}</level>"
+)
+FILE_FORMAT = (
+    "{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {extra[correlation_id]} | "
+    "{name}:{function}:{line} - {message}"
+)
+
+
+def _add_correlation_id(record: Dict[str, Any]) -> None:
+    # Патчер вызывается в потоке, где сделана запись, поэтому видит
+    # контекст запроса даже при записи через очередь
+    record["extra"].setdefault("correlation_id", correlation_id.get())
+
+
+def _json_format(record: Dict[str, Any]) -> str:
+    """Формат записи в одну строку JSON."""
+    extra = dict(record["extra"])
+    # Строка, уже сериализованная для другого обработчика (extra общий у всех)
+    extra.pop("serialized", None)
+    entry = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "message": record["message"],
+        "correlation_id": extra.pop("correlation_id", "-"),
+        "logger": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+    }
+    if extra:
+        entry["extra"] = extra
+    if record["exception"] is not None:
+        entry["exception"] = "".join(traceback.format_exception(*record["exception"]))
+    record["extra"]["serialized"] = orjson.dumps(entry, default=str).decode()
+    return "{extra[serialized]}\n"
+
+
+class SamplingFilter:
+    """
+    Прореживает записи журнала по уровням.
+
+    Решение принимается по идентификатору запроса, поэтому записи одного
+    запроса либо сохраняются все, либо отбрасываются все. Записи вне
+    запроса прореживаются случайно.
+    """
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            rates: Доля сохраняемых записей по имени уровня (по умолчанию 1.0)
+        """
+        self.rates = {level.upper(): rate for level, rate in (rates or {}).items()}
+
+    def __call__(self, record: Dict[str, Any]) -> bool:
+        rate = self.rates.get(record["level"].name, 1.0)
+        if rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            return False
+        request_id = record["extra"].get("correlation_id", "-")
+        if request_id == "-":
+            return random.random() < rate
+        return zlib.crc32(request_id.encode()) % 10000 < rate * 10000
+
+
+def setup_logging(
+    level: str,
+    log_file: Optional[str] = None,
+    rotation: Optional[str] = None,
+    retention: Optional[str] = None,
+    json: bool = False,
+    enqueue: bool = True,
+    sampling: Optional[Dict[str, float]] = None,
+) -> None:
+    """
+    Настраивает обработчики журнала: stdout и, при необходимости, файл.
+
+    Args:
+        level: Минимальный уровень записей
+        log_file: Путь к файлу журнала (если None, пишем только в stdout)
+        rotation: Период ротации файла журнала
+        retention: Период хранения файлов журнала
+        json: Писать записи в JSON (по одной на строку)
+        enqueue: Писать через очередь в отдельном потоке
+        sampling: Доля сохраняемых записей по имени уровня
+    """
+    logger.remove()  # Удаляем стандартный обработчик
+    logger.configure(patcher=_add_correlation_id)
+    sampling_filter = SamplingFilter(sampling)
+
+    logger.add(
+        sys.stdout,
+        format=_json_format if json else TEXT_FORMAT,
+        level=level,
+        filter=sampling_filter,
+        enqueue=enqueue,
+    )
+    if log_file:
+        logger.add(
+            log_file,
+            rotation=rotation,
+            retention=retention,
+            format=_json_format if json else FILE_FORMAT,
+            level=level,
+            filter=sampling_filter,
+            enqueue=enqueue,
+        )
@@ -0,0 +1,328 @@
+"""
+Метрики приложения в текстовом формате Prometheus.
+
+Счетчики и гистограммы хранятся в памяти процесса. Время этапов обработки
+запроса измеряется контекстным менеджером stage: значение попадает
+в гистограмму и в тайминги текущего запроса (для заголовка Server-Timing).
+"""
+import bisect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Границы корзин гистограмм по умолчанию (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+Sample = Tuple[Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items())
+        + "}"
+    )
+
+
+def format_metric(
+    name: str, metric_type: str, documentation: str, samples: Iterable[Sample]
+) -> List[str]:
+    """
+    Формирует строки метрики в текстовом формате Prometheus.
+
+    Args:
+        name: Имя метрики
+        metric_type: Тип метрики (counter, gauge, histogram)
+        documentation: Описание метрики
+        samples: Пары (метки, значение)
+
+    Returns:
+        Строки без перевода строки в конце
+    """
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+    lines.extend(f"{name}{_format_labels(labels)} {value}" for labels, value in samples)
+    return lines
+
+
+class Counter:
+    """Монотонно растущий счетчик с метками."""
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Увеличивает счетчик с заданными метками."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Возвращает текущее значение с заданными метками."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        return self._values.get(key, 0.0)
+
+    def collect(self) -> List[str]:
+        return format_metric(
+            self.name,
+            self.metric_type,
+            self.documentation,
+            (
+                (dict(zip(self.labelnames, key)), value)
+                for key, value in self._values.items()
+            ),
+        )
+
+
+class Gauge(Counter):
+    """Значение, которое может увеличиваться и уменьшаться."""
+
+    metric_type = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        """Уменьшает значение с заданными метками."""
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        """Устанавливает значение с заданными метками."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        self._values[key] = float(value)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами и метками."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Для каждого набора меток: количества по корзинам (последняя - +Inf) и сумма
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Добавляет наблюдение с заданными метками."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = entry
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def collect(self) -> List[str]:
+        samples: List[Tuple[str, Dict[str, str], float]] = []
+        for key, (counts, total) in self._values.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                samples.append(("_bucket", {**labels, "le": str(bound)}, cumulative))
+            samples.append(("_sum", labels, total[0]))
+            samples.append(("_count", labels, cumulative))
+
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        lines.extend(
+            f"{self.name}{suffix}{_format_labels(labels)} {value}"
+            for suffix, labels, value in samples
+        )
+        return lines
+
+
+class Registry:
+    """Набор метрик процесса."""
+
+    def __init__(self):
+        self._metrics: List = []
+
+    def register(self, metric):
+        """Регистрирует метрику и возвращает ее."""
+        self._metrics.append(metric)
+        return metric
+
+    def collect(self) -> List[str]:
+        """Возвращает строки всех метрик в текстовом формате Prometheus."""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return lines
+
+
+def cache_metrics(caches: Dict[str, Dict[str, float]]) -> List[str]:
+    """
+    Формирует метрики кэшей из их статистики (TTLCache.stats).
+
+    Args:
+        caches: Статистика по имени кэша
+    """
+    lines = []
+    for field, metric_type, documentation in (
+        ("hits", "counter", "Попадания в кэш"),
+        ("misses", "counter", "Промахи кэша"),
+        ("size", "gauge", "Количество записей в кэше"),
+        ("maxsize", "gauge", "Максимальное количество записей в кэше"),
+    ):
+        suffix = "_total" if metric_type == "counter" else ""
+        lines.extend(
+            format_metric(
+                f"apiserver_cache_{field}{suffix}",
+                metric_type,
+                documentation,
+                (({"cache": name}, stats[field]) for name, stats in caches.items()),
+            )
+        )
+    return lines
+
+
+def single_flight_metrics(flights: Dict[str, Dict[str, float]]) -> List[str]:
+    """
+    Формирует метрики объединения запросов из их статистики (SingleFlight.stats).
+
+    Args:
+        flights: Статистика по типу запросов
+    """
+    lines = []
+    for field, name, metric_type, documentation in (
+        ("calls", "calls_total", "counter", "Вызовы запросов к внешним API"),
+        (
+            "coalesced",
+            "coalesced_total",
+            "counter",
+            "Вызовы, объединенные с уже выполняющимся запросом",
+        ),
+        ("in_flight", "in_flight", "gauge", "Выполняющиеся запросы к внешним API"),
+    ):
+        lines.extend(
+            format_metric(
+                f"apiserver_single_flight_{name}",
+                metric_type,
+                documentation,
+                (({"kind": kind}, stats[field]) for kind, stats in flights.items()),
+            )
+        )
+    return lines
+
+
+REGISTRY = Registry()
+
+STAGE_DURATION = REGISTRY.register(
+    Histogram(
+        "apiserver_stage_duration_seconds",
+        "Время этапов построения маршрутов",
+        ["stage"],
+    )
+)
+UPSTREAM_DURATION = REGISTRY.register(
+    Histogram(
+        "apiserver_upstream_request_duration_seconds",
+        "Время запросов к внешним API по хосту и коду ответа",
+        ["host", "status"],
+    )
+)
+HTTP_REQUEST_DURATION = REGISTRY.register(
+    Histogram(
+        "apiserver_http_request_duration_seconds",
+        "Время обработки запросов к приложению",
+        ["method", "handler", "status"],
+    )
+)
+HTTP_REQUESTS_IN_FLIGHT = REGISTRY.register(
+    Gauge(
+        "apiserver_http_requests_in_flight",
+        "Количество обрабатываемых запросов к приложению",
+    )
+)
+ROUTING_HEDGED = REGISTRY.register(
+    Counter(
+        "apiserver_routing_hedged_total",
+        "Запуски резервного провайдера маршрутов из-за медленного ответа",
+        ["provider"],
+    )
+)
+ROUTING_WINS = REGISTRY.register(
+    Counter(
+        "apiserver_routing_wins_total",
+        "Маршруты, полученные от провайдера первыми",
+        ["provider"],
+    )
+)
+QUERY_PLANNER_PAIRS = REGISTRY.register(
+    Counter(
+        "apiserver_query_planner_pairs_total",
+        "Пары остановок по решению планировщика запросов маршрутов",
+        ["outcome"],
+    )
+)
+UPSTREAM_RETRIES = REGISTRY.register(
+    Counter(
+        "apiserver_upstream_retries_total",
+        "Повторы запросов к внешним API",
+        ["endpoint"],
+    )
+)
+UPSTREAM_REJECTED = REGISTRY.register(
+    Counter(
+        "apiserver_upstream_rejected_total",
+        "Запросы и повторы к внешним API, не отправленные защитой от сбоев",
+        ["endpoint", "reason"],
+    )
+)
+UPSTREAM_BREAKER_STATE = REGISTRY.register(
+    Gauge(
+        "apiserver_upstream_breaker_state",
+        "Состояние выключателя эндпоинта "
+        "(0 - замкнут, 1 - пробный запрос, 2 - разомкнут)",
+        ["endpoint"],
+    )
+)
+UPSTREAM_CONCURRENCY_LIMIT = REGISTRY.register(
+    Gauge(
+        "apiserver_upstream_concurrency_limit",
+        "Адаптивный лимит одновременных запросов к эндпоинту",
+        ["endpoint"],
+    )
+)
+
+# Тайминги этапов текущего запроса (stage -> секунды)
+request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Измеряет время этапа обработки запроса.
+
+    Args:
+        name: Название этапа (метка stage)
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.observe(elapsed, stage=name)
+        timings = request_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
@@ -2,24 +2,93 @@
 Сервис для построения маршрутов в 2gis.
 Предоставляет функциональность для поиска остановок общественного транспорта.
 """
+import asyncio
 import math
-from typing import Any, Coroutine, Dict, List, Optional
+import time
+from typing import Any, AsyncIterator, Coroutine, Dict, List, Optional, Tuple
 
 import httpx
+import numpy as np
 from fastapi import HTTPException
 from loguru import logger
 
+from apiserver.app.services.cache import TTLCache
+from apiserver.app.services.metrics import stage
+from apiserver.app.services.raptor import RaptorEngine
+from apiserver.app.services.resilience import UpstreamUnavailable
+from apiserver.app.services.routing_providers import create_router
+from apiserver.app.services.single_flight import SingleFlight
+from apiserver.app.services.stop_cache import StopCell, StopCellCache
+from apiserver.app.services.stop_index import StopIndex
+from apiserver.app.services.travel_matrix import TravelMatrix
 from apiserver.config.settings import settings
 
 
 class PublicTransportService:
     """Сервис для построения маршрутов в 2gis."""
 
-    def __init__(self):
-        """Инициализация сервиса."""
+    def __init__(
+        self,
+        http_client: httpx.AsyncClient,
+        stop_index: Optional[StopIndex] = None,
+        raptor_engine: Optional[RaptorEngine] = None,
+        travel_matrix: Optional[TravelMatrix] = None,
+    ):
+        """
+        Инициализация сервиса.
+
+        Args:
+            http_client: Общий HTTP-клиент приложения
+            stop_index: Локальный индекс остановок; если не задан или не нашел
+                остановок, используется каталог 2GIS
+            raptor_engine: Локальный движок маршрутов по GTFS; если задан,
+                маршруты между остановками строятся им, а не провайдерами
+            travel_matrix: Предрассчитанная матрица времени в пути; если
+                задана, маршруты строятся только для лучших по ней пар остановок
+        """
+        self.http_client = http_client
+        self.stop_index = stop_index
+        self.raptor_engine = raptor_engine
+        self.travel_matrix = travel_matrix
+        self.travel_matrix_top_pairs = settings.get("TRAVEL_MATRIX_TOP_PAIRS", 3)
         self.api_key = settings.get("GIS_API_KEY")
-        self.base_url = "https://catalog.api.2gis.com/3.0/items"
+        self.base_url = settings.get(
+            "TWO_GIS_BASE_URL", "https://catalog.api.2gis.com/3.0/items"
+        )
         self.search_radius_const = settings.get("TRANSPORT_SEARCH_RADIUS", 500)  # метры
+        # Радиус поиска ближайшей остановки (метры)
+        self.nearest_stop_radius = settings.get("NEAREST_STOP_MAX_RADIUS", 10000)
+        self.route_build_concurrency = settings.get("ROUTE_BUILD_CONCURRENCY", 10)
+        self.route_build_timeout = settings.get("ROUTE_BUILD_TIMEOUT", 5.0)  # секунды
+        self.enable_schedule = settings.get("ROUTE_ENABLE_SCHEDULE", True)
+
+        # Кэш маршрутов между парами остановок. Маршруты с расписанием
+        # зависят от времени отправления, поэтому живут меньше
+        self.route_cache = TTLCache(
+            maxsize=settings.get("ROUTE_CACHE_MAX_SIZE", 10000),
+            ttl=settings.get("ROUTE_CACHE_TTL", 3600),
+            stale_ttl=settings.get("UPSTREAM_STALE_MAX_AGE", 3600),
+        )
+        self.route_cache_schedule_ttl = settings.get("ROUTE_CACHE_SCHEDULE_TTL", 60)
+        self.route_cache_time_bucket = settings.get("ROUTE_CACHE_TIME_BUCKET", 300)
+
+        # Кэш ответов каталога по ячейкам geohash
+        self.stop_cell_cache = None
+        if settings.get("STOP_CACHE_ENABLED", True):
+            self.stop_cell_cache = StopCellCache(
+                precision=settings.get("STOP_CACHE_PRECISION", 7),
+                maxsize=settings.get("STOP_CACHE_MAX_SIZE", 5000),
+                ttl=settings.get("STOP_CACHE_TTL", 3600),
+                stale_ttl=settings.get("UPSTREAM_STALE_MAX_AGE", 3600),
+            )
+        self.stop_cell_page_size = settings.get("STOP_CACHE_PAGE_SIZE", 50)
+
+        # Провайдеры маршрутов (2GIS, Яндекс, Google) с хеджированием запросов
+        self.router = create_router(http_client)
+
+        # Одинаковые одновременные запросы к 2GIS отправляются один раз
+        self.stop_flight = SingleFlight()
+        self.route_flight = SingleFlight()
 
     async def find_nearest_stop(
         self, lat: float, lon: float
@@ -34,29 +103,169 @@ class PublicTransportService:
         Returns:
             Информация о ближайшей остановке или None, если остановки не найдены
         """
+        if self.stop_index is not None:
+            stop = self.stop_index.find_nearest_stop(lat, lon, self.nearest_stop_radius)
+            if stop:
+                return stop
+
+        if self.stop_cell_cache is not None:
+            stops = await self._find_stops_in_cell(
+                lat, lon, extra_radius=0, max_count=1
+            )
+            if stops is not None:
+                return stops[0] if stops else None
+
+        items = await self._search_stops(lat, lon, self.nearest_stop_radius)
+        return items[0] if items else None
+
+    async def _search_stops(
+        self, lat: float, lon: float, radius: float, page_size: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Ищет остановки в каталоге 2GIS в радиусе от точки.
+
+        Args:
+            lat: Широта точки
+            lon: Долгота точки
+            radius: Радиус поиска в метрах
+            page_size: Количество остановок в ответе (по умолчанию - как в 2GIS)
+
+        Returns:
+            Список остановок, отсортированный по расстоянию до точки
+        """
+        key = ("search", round(lat, 6), round(lon, 6), int(radius), page_size)
+        return await self.stop_flight.do(
+            key, lambda: self._request_stops(lat, lon, radius, page_size)
+        )
+
+    async def _request_stops(
+        self, lat: float, lon: float, radius: float, page_size: Optional[int]
+    ) -> List[Dict[str, Any]]:
+        """Запрашивает остановки у каталога 2GIS (см. _search_stops)."""
         params = {
             "q": "остановка автобуса",
             "point": f"{lon},{lat}",
             "fields": "items.point",
             "key": self.api_key,
             "sort": "distance",
-            "radius": 10000,
+            "radius": int(radius),
             "type": "station",
         }
+        if page_size:
+            params["page_size"] = page_size
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(self.base_url, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("result", {}).get("items", []):
-                    return data["result"]["items"][0]
-                return None
+        try:
+            response = await self.http_client.get(self.base_url, params=params)
+        except httpx.HTTPError as e:
+            # Каталог недоступен (в том числе разомкнут выключатель) - не ждем
+            # и не повторяем дальше; ячейки кэша могут ответить устаревшими данными
+            if isinstance(e, UpstreamUnavailable):
+                logger.debug("Каталог 2GIS недоступен: {}", e)
             else:
-                logger.error(
-                    f"Ошибка при поиске ближайшей остановки: {response.status_code}"
+                logger.error("Каталог 2GIS недоступен: {}", e)
+            raise HTTPException(
+                status_code=503, detail="Каталог остановок временно недоступен"
+            )
+        if response.status_code == 200:
+            data = response.json()
+            return data.get("result", {}).get("items", [])
+        else:
+            logger.error("Ошибка при поиске остановок: {}", response.status_code)
+            # Тело ответа может быть большим, в журнал пишем только начало
+            logger.opt(lazy=True).debug(
+                "Ответ каталога 2GIS: {:.500}", lambda: response.text
+            )
+            raise HTTPException(status_code=500, detail=response.text)
+
+    async def _find_stops_in_cell(
+        self, lat: float, lon: float, extra_radius: float, max_count: int
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Находит ближайшие остановки по кэшированной ячейке geohash.
+
+        При отсутствии ячейки в кэше запрашивает у каталога 2GIS остановки
+        вокруг ее центра с запасом на полудиагональ ячейки.
+
+        Args:
+            lat: Широта точки
+            lon: Долгота точки
+            extra_radius: Добавка к расстоянию до ближайшей остановки в метрах
+            max_count: Максимальное количество остановок
+
+        Returns:
+            Остановки, отсортированные по расстоянию, или None, если данных
+            ячейки недостаточно и нужен прямой запрос к каталогу
+        """
+        key, center_lat, center_lon, half_diagonal = self.stop_cell_cache.cell(lat, lon)
+        cell = self.stop_cell_cache.get(key)
+        if cell is None:
+            try:
+                cell = await self.stop_flight.do(
+                    ("cell", key),
+                    lambda: self._fetch_stop_cell(
+                        center_lat, center_lon, half_diagonal
+                    ),
+                )
+            except HTTPException:
+                # Каталог недоступен - отвечаем по устаревшей ячейке, если она есть
+                cell = self.stop_cell_cache.get_stale(key)
+                if cell is None:
+                    raise
+                logger.warning("Каталог 2GIS недоступен, ячейка {} из кэша", key)
+            else:
+                self.stop_cell_cache.set(key, cell)
+
+        return cell.select(
+            lat,
+            lon,
+            extra_radius=extra_radius,
+            max_radius=self.nearest_stop_radius,
+            max_count=max_count,
+        )
+
+    async def _fetch_stop_cell(
+        self, center_lat: float, center_lon: float, half_diagonal: float
+    ) -> StopCell:
+        """
+        Запрашивает остановки-кандидаты для ячейки.
+
+        Радиус выбирается так, чтобы для любой точки ячейки в него попали
+        ближайшая остановка и все остановки в радиусе TRANSPORT_SEARCH_RADIUS
+        от нее: (расстояние до ближайшей от центра + константа + диагональ).
+
+        Args:
+            center_lat: Широта центра ячейки
+            center_lon: Долгота центра ячейки
+            half_diagonal: Полудиагональ ячейки в метрах
+
+        Returns:
+            Ячейка с остановками-кандидатами
+        """
+        nearest = await self._search_stops(
+            center_lat, center_lon, self.nearest_stop_radius, page_size=1
+        )
+        nearest_point = nearest[0].get("point", {}) if nearest else {}
+        if not nearest_point.get("lat") or not nearest_point.get("lon"):
+            return StopCell.create(center_lat, center_lon, self.nearest_stop_radius, [])
+
+        distance_to_nearest = self.calculate_distance(
+            center_lat, center_lon, nearest_point["lat"], nearest_point["lon"]
+        )
+        radius = distance_to_nearest + self.search_radius_const + 2 * half_diagonal
+        stops = await self._search_stops(
+            center_lat, center_lon, radius, page_size=self.stop_cell_page_size
+        )
+
+        # Ответ каталога обрезан по размеру страницы: гарантированно
+        # найдены только остановки не дальше последней из полученных
+        if len(stops) >= self.stop_cell_page_size:
+            last_point = stops[-1].get("point", {})
+            if last_point.get("lat") and last_point.get("lon"):
+                radius = self.calculate_distance(
+                    center_lat, center_lon, last_point["lat"], last_point["lon"]
                 )
-                logger.debug(response.text)
-                raise HTTPException(status_code=500, detail=response.text)
+
+        return StopCell.create(center_lat, center_lon, radius, stops)
 
     @staticmethod
     def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
@@ -97,17 +306,45 @@ class PublicTransportService:
 
         return distance
 
-    async def find_nearest_stops(self, lat: float, lon: float) -> List[Dict[str, Any]]:
+    async def find_nearest_stops(
+        self, lat: float, lon: float, max_count: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
         """
         Находит ближайшую остановку, а затем все остановки в радиусе (расстояние до ближайшей + константа).
 
         Args:
             lat: Широта точки
             lon: Долгота точки
+            max_count: Максимальное количество остановок
+                (по умолчанию - MAX_STOP_COUNT)
 
         Returns:
             Список остановок с их координатами
         """
+        max_stop_count = max_count or settings.get("MAX_STOP_COUNT", 3)
+
+        # Сначала ищем в локальном индексе, каталог 2GIS - только при промахе
+        if self.stop_index is not None:
+            stops = self.stop_index.find_nearest_stops(
+                lat,
+                lon,
+                extra_radius=self.search_radius_const,
+                max_radius=self.nearest_stop_radius,
+                max_count=max_stop_count,
+            )
+            if stops:
+                return stops
+
+        if self.stop_cell_cache is not None:
+            stops = await self._find_stops_in_cell(
+                lat,
+                lon,
+                extra_radius=self.search_radius_const,
+                max_count=max_stop_count,
+            )
+            if stops is not None:
+                return stops
+
         # Находим ближайшую остановку
         nearest_stop = await self.find_nearest_stop(lat, lon)
 
@@ -128,25 +365,8 @@ class PublicTransportService:
         # Определяем радиус поиска (расстояние до ближайшей + константа)
         search_radius = distance_to_nearest + self.search_radius_const
 
-        params = {
-            "q": "остановка автобуса",
-            "point": f"{lon},{lat}",
-            "fields": "items.point",
-            "key": self.api_key,
-            "sort": "distance",
-            "type": "station",
-            "radius": int(search_radius),
-        }
-
-        async with httpx.AsyncClient() as client:
-            response = await client.get(self.base_url, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                stops = data.get("result", {}).get("items", [])
-
-                return stops[: min(settings.get("MAX_STOP_COUNT", 5), len(stops))]
-
-            return []
+        stops = await self._search_stops(lat, lon, search_radius)
+        return stops[: min(max_stop_count, len(stops))]
 
     async def build_public_transport_route(
         self, start_lat, start_lon, end_lat, end_lon
@@ -163,47 +383,342 @@ class PublicTransportService:
         Returns:
             Информация о маршруте или None в случае ошибки
         """
+        if self.raptor_engine is not None:
+            routes = await self._build_local_routes(
+                [(start_lat, start_lon)], [(end_lat, end_lon)]
+            )
+            return routes[0] if routes else None
+
+        cache_key = self._route_cache_key(start_lat, start_lon, end_lat, end_lon)
+        cached_route = self.route_cache.get(cache_key)
+        if cached_route is not None:
+            # Возвращаем копию, так как маршрут дополняется данными о загруженности
+            return dict(cached_route)
+
+        route = await self.route_flight.do(
+            cache_key,
+            lambda: self._request_route(
+                cache_key, start_lat, start_lon, end_lat, end_lon
+            ),
+        )
+        return dict(route) if route is not None else None
 
-        route_url = "https://routing.api.2gis.com/public_transport/2.0"
-
-        # Формируем запрос к API 2GIS для построения маршрута общественного транспорта
-        params = {"key": self.api_key}
-
-        payload = {
-            "max_result_count": 1,
-            "source": {"point": {"lat": start_lat, "lon": start_lon, "type": "stop"}},
-            "target": {"point": {"lat": end_lat, "lon": end_lon, "type": "stop"}},
-            "enable_schedule": True,
-            "transport": [
-                "pedestrian",
-                "metro",
-                "light_metro",
-                "suburban_train",
-                "aeroexpress",
-                "tram",
-                "bus",
-                "trolleybus",
-                "shuttle_bus",
-                "monorail",
-                "funicular_railway",
-                "river_transport",
-                "cable_car",
-                "light_rail",
-                "premetro",
-                "mcc",
-                "mcd",
-            ],
-            "locale": "ru_RU",
+    async def _request_route(
+        self, cache_key: tuple, start_lat, start_lon, end_lat, end_lon
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Запрашивает маршрут у провайдеров маршрутов и сохраняет его в кэш.
+
+        Returns:
+            Маршрут (общий для объединенных вызовов) или None в случае ошибки
+        """
+        route = await self.router.build_route(start_lat, start_lon, end_lat, end_lon)
+        if route is None:
+            # Провайдеры недоступны - отвечаем устаревшим маршрутом, если он есть
+            route = self._stale_route(cache_key)
+            if route is not None:
+                logger.warning("Провайдеры маршрутов недоступны, маршрут из кэша")
+            return route
+
+        self.route_cache.set(
+            cache_key,
+            route,
+            ttl=self.route_cache_schedule_ttl if self.enable_schedule else None,
+        )
+        return route
+
+    def is_route_cached(self, start_lat, start_lon, end_lat, end_lon) -> bool:
+        """Можно ли получить маршрут без обращения к провайдерам маршрутов."""
+        if self.raptor_engine is not None:
+            return True
+        return (
+            self._route_cache_key(start_lat, start_lon, end_lat, end_lon)
+            in self.route_cache
+        )
+
+    def _stale_route(self, cache_key: tuple) -> Optional[Dict[str, Any]]:
+        """
+        Находит в кэше маршрут с истекшим временем жизни.
+
+        Для маршрутов с расписанием просматриваются и предыдущие интервалы
+        времени в пределах UPSTREAM_STALE_MAX_AGE.
+        """
+        *point_key, time_bucket = cache_key
+        buckets = 1
+        if self.enable_schedule:
+            buckets += int(self.route_cache.stale_ttl // self.route_cache_time_bucket)
+        for previous in range(buckets):
+            route = self.route_cache.get_stale((*point_key, time_bucket - previous))
+            if route is not None:
+                return route
+        return None
+
+    def _route_cache_key(self, start_lat, start_lon, end_lat, end_lon) -> tuple:
+        """
+        Формирует ключ кэша маршрута по координатам пары остановок.
+
+        Для маршрутов с расписанием в ключ входит номер интервала времени
+        длиной ROUTE_CACHE_TIME_BUCKET секунд.
+        """
+        time_bucket = (
+            int(time.time() // self.route_cache_time_bucket)
+            if self.enable_schedule
+            else 0
+        )
+        return (
+            round(start_lat, 6),
+            round(start_lon, 6),
+            round(end_lat, 6),
+            round(end_lon, 6),
+            self.enable_schedule,
+            time_bucket,
+        )
+
+    def cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Возвращает статистику кэшей сервиса."""
+        stats = {"routes": self.route_cache.stats()}
+        if self.stop_cell_cache is not None:
+            stats["stops"] = self.stop_cell_cache.cache.stats()
+        return stats
+
+    def single_flight_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Возвращает статистику объединения одинаковых запросов к 2GIS."""
+        return {
+            "routes": self.route_flight.stats(),
+            "stops": self.stop_flight.stats(),
         }
 
+    @staticmethod
+    def stop_pairs(
+        initial_stops: List[Dict[str, Any]], end_stops: List[Dict[str, Any]]
+    ) -> List[Tuple[float, float, float, float]]:
+        """
+        Составляет пары начальных и конечных остановок с известными координатами.
+
+        Args:
+            initial_stops: Остановки у начальной точки
+            end_stops: Остановки у конечной точки
+
+        Returns:
+            Кортежи (широта, долгота начальной, широта, долгота конечной остановки)
+        """
+        return [
+            (*start, *end)
+            for start in PublicTransportService.stop_points(initial_stops)
+            for end in PublicTransportService.stop_points(end_stops)
+        ]
+
+    @staticmethod
+    def stop_points(stops: List[Dict[str, Any]]) -> List[Tuple[float, float]]:
+        """Координаты (широта, долгота) остановок с известными координатами."""
+        return [
+            (stop["point"]["lat"], stop["point"]["lon"])
+            for stop in PublicTransportService.located_stops(stops)
+        ]
+
+    @staticmethod
+    def located_stops(stops: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Остановки с известными координатами."""
+        return [
+            stop
+            for stop in stops
+            if stop.get("point", {}).get("lat") and stop.get("point", {}).get("lon")
+        ]
+
+    def candidate_pairs(
+        self, initial_stops: List[Dict[str, Any]], end_stops: List[Dict[str, Any]]
+    ) -> List[Tuple[float, float, float, float]]:
+        """
+        Отбирает пары остановок, для которых нужно строить маршруты.
+
+        Без матрицы времени в пути возвращает все пары (stop_pairs).
+        С матрицей пары упорядочиваются по оценке времени в пути и количества
+        пересадок, и остаются TRAVEL_MATRIX_TOP_PAIRS лучших; пары с
+        остановками, которых нет в матрице, оценить нельзя, и они остаются все.
+
+        Args:
+            initial_stops: Остановки у начальной точки
+            end_stops: Остановки у конечной точки
+
+        Returns:
+            Кортежи (широта, долгота начальной, широта, долгота конечной остановки)
+        """
+        pairs = self.stop_pairs(initial_stops, end_stops)
+        if (
+            self.travel_matrix is None
+            or not len(self.travel_matrix)
+            or len(pairs) <= self.travel_matrix_top_pairs
+        ):
+            return pairs
+
+        with stage("travel_matrix"):
+            durations, transfers = self.travel_matrix.estimate(
+                self.located_stops(initial_stops), self.located_stops(end_stops)
+            )
+        durations, transfers = durations.ravel(), transfers.ravel()
+        known = ~np.isnan(durations)
+        # NaN сортируется последним, поэтому оцененные пары идут первыми
+        order = np.lexsort((transfers, durations))
+        selected = [
+            *order[known[order]][: self.travel_matrix_top_pairs],
+            *np.flatnonzero(~known),
+        ]
+        logger.debug(
+            "Матрица времени в пути: выбрано {} из {} пар остановок",
+            len(selected),
+            len(pairs),
+        )
+        return [pairs[i] for i in selected]
+
+    async def _build_local_routes(
+        self,
+        origins: List[Tuple[float, float]],
+        destinations: List[Tuple[float, float]],
+    ) -> List[Dict[str, Any]]:
+        """
+        Строит маршруты для всех пар точек локальным движком RAPTOR
+        за один проход в отдельном потоке.
+
+        Returns:
+            Найденные маршруты
+        """
+        with stage("raptor"):
+            matrix = await asyncio.to_thread(
+                self.raptor_engine.route_matrix, origins, destinations
+            )
+        return [route for row in matrix for route in row if route is not None]
+
+    async def _build_bounded(
+        self,
+        semaphore: asyncio.Semaphore,
+        start_lat: float,
+        start_lon: float,
+        end_lat: float,
+        end_lon: float,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Строит маршрут между парой остановок, ожидая места в semaphore.
+
+        Returns:
+            Маршрут или None в случае ошибки
+        """
+        async with semaphore:
+            return await self.build_public_transport_route(
+                start_lat=start_lat,
+                start_lon=start_lon,
+                end_lat=end_lat,
+                end_lon=end_lon,
+            )
+
+    async def build_routes_between_stops(
+        self, initial_stops: List[Dict[str, Any]], end_stops: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Строит маршруты для всех пар начальных и конечных остановок одновременно.
+
+        Количество одновременных запросов к 2GIS ограничено настройкой
+        ROUTE_BUILD_CONCURRENCY. По истечении ROUTE_BUILD_TIMEOUT незавершенные
+        запросы отменяются, и возвращаются только уже построенные маршруты.
+        С локальным движком RAPTOR все маршруты строятся одним проходом,
+        с матрицей времени в пути - только для отобранных пар (candidate_pairs).
+
+        Args:
+            initial_stops: Остановки у начальной точки
+            end_stops: Остановки у конечной точки
+
+        Returns:
+            Список построенных маршрутов
+        """
+        if self.raptor_engine is not None:
+            return await self._build_local_routes(
+                self.stop_points(initial_stops), self.stop_points(end_stops)
+            )
+
+        semaphore = asyncio.Semaphore(self.route_build_concurrency)
+
+        tasks = [
+            asyncio.create_task(self._build_bounded(semaphore, *pair))
+            for pair in self.candidate_pairs(initial_stops, end_stops)
+        ]
+
+        if not tasks:
+            return []
+
+        done, pending = await asyncio.wait(tasks, timeout=self.route_build_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(
+                "Не успели построиться {} из {} маршрутов за {} с",
+                len(pending),
+                len(tasks),
+                self.route_build_timeout,
+            )
+
+        routes = []
+        for task in tasks:
+            if task not in done:
+                continue
+            route = task.result()
+            if route:
+                routes.append(route)
+        return routes
+
+    async def iter_routes_between_stops(
+        self, initial_stops: List[Dict[str, Any]], end_stops: List[Dict[str, Any]]
+    ) -> AsyncIterator[Tuple[Dict[str, Any], int]]:
+        """
+        Строит маршруты для всех пар остановок и отдает их по мере готовности.
+
+        Ограничения на количество одновременных запросов и общее время
+        и отбор пар по матрице времени в пути такие же, как
+        в build_routes_between_stops.
+
+        Args:
+            initial_stops: Остановки у начальной точки
+            end_stops: Остановки у конечной точки
+
+        Yields:
+            Кортежи (построенный маршрут, общее количество пар остановок)
+        """
+        if self.raptor_engine is not None:
+            # Локальный движок строит все маршруты за один проход
+            routes = await self._build_local_routes(
+                self.stop_points(initial_stops), self.stop_points(end_stops)
+            )
+            for route in routes:
+                yield route, len(routes)
+            return
+
+        semaphore = asyncio.Semaphore(self.route_build_concurrency)
+
+        pending = {
+            asyncio.create_task(self._build_bounded(semaphore, *pair))
+            for pair in self.candidate_pairs(initial_stops, end_stops)
+        }
+        total = len(pending)
+        deadline = asyncio.get_running_loop().time() + self.route_build_timeout
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(route_url, params=params, json=payload)
-                if response.status_code == 200:
-                    routes = response.json()
-                    return routes[0]
-                logger.error(f"Ошибка при построении маршрута: {response.text}")
-                return None
-        except Exception as e:
-            logger.error(f"Ошибка при построении маршрута: {e}")
-            return None
+            while pending:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    route = task.result()
+                    if route:
+                        yield route, total
+        finally:
+            # Клиент мог отключиться, не дождавшись всех маршрутов
+            for task in pending:
+                task.cancel()
+
+        if pending:
+            logger.warning(
+                "Не успели построиться {} из {} маршрутов за {} с",
+                len(pending),
+                total,
+                self.route_build_timeout,
+            )
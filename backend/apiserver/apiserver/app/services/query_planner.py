@@ -0,0 +1,236 @@
+"""
+Планирование запросов маршрутов между парами остановок.
+
+Для каждой пары остановок оценивается нижняя граница времени поездки
+«от двери до двери»: пешком по прямой от начальной точки до остановки
+и от остановки до конечной точки со скоростью пешехода, между остановками -
+по прямой с максимальной скоростью транспорта. Пары запрашиваются в порядке
+возрастания оценки, и запросы прекращаются по исчерпании бюджета запросов
+к провайдерам маршрутов на один запрос к приложению.
+
+Пара отсекается, когда уже построенный маршрут «от двери до двери» не хуже
+ее нижних границ по всем критериям ранжирования (RANKING_OBJECTIVES),
+для которых граница известна до построения маршрута: время в пути,
+количество пересадок (0) и расстояние пешком (подход и отход по прямой).
+Построенный маршрут дополняется подходом и отходом своей пары, поэтому
+прямой маршрут от близких остановок отсекает пары дальних остановок.
+Загруженность известна только после построения маршрута и в отсечении
+не участвует: наименее загруженный маршрут выбирается среди построенных.
+"""
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+import numpy as np
+from loguru import logger
+
+from apiserver.app.services.geo import haversine
+from apiserver.app.services.metrics import QUERY_PLANNER_PAIRS
+from apiserver.app.services.public_transport import PublicTransportService
+from apiserver.app.services.route_ranking import RouteRanker, objectives_matrix
+from apiserver.config.settings import settings
+
+Point = Tuple[float, float]
+
+# Критерии ранжирования, для которых известна нижняя граница до построения маршрута
+BOUNDED_OBJECTIVES = ("total_duration", "transfer_count", "walking_distance")
+
+
+@dataclass
+class PairBounds:
+    """Оценки пар остановок, массивы по парам."""
+
+    # Время «от двери до двери» в секундах - порядок запросов
+    door_to_door: np.ndarray
+    # Время и расстояние подхода к начальной и отхода от конечной остановки
+    access_time: np.ndarray
+    access_distance: np.ndarray
+    # Нижние границы критериев отсечения - матрица (пары, критерии)
+    bounds: np.ndarray
+
+
+class QueryPlanner:
+    """Выбор порядка и количества запросов маршрутов между парами остановок."""
+
+    def __init__(self, transport_service: PublicTransportService):
+        """
+        Инициализация планировщика.
+
+        Args:
+            transport_service: Сервис поиска остановок и построения маршрутов
+        """
+        self.transport_service = transport_service
+        # Пары не запрашиваются все сразу, поэтому остановок берется больше,
+        # чем MAX_STOP_COUNT для построения маршрутов без планировщика
+        self.max_stop_count = settings.get("QUERY_PLANNER_MAX_STOP_COUNT", 5)
+        self.call_budget = settings.get("QUERY_PLANNER_CALL_BUDGET", 9)
+        self.parallelism = settings.get("QUERY_PLANNER_PARALLELISM", 9)
+        self.walking_speed = settings.get("QUERY_PLANNER_WALKING_SPEED", 1.4)  # м/с
+        self.transit_speed = settings.get("QUERY_PLANNER_TRANSIT_SPEED", 20.0)  # м/с
+        self.timeout = settings.get("ROUTE_BUILD_TIMEOUT", 5.0)  # секунды
+        # Критерии ранжирования, по которым пары отсекаются до построения
+        self.objectives = [
+            name for name in RouteRanker().objectives if name in BOUNDED_OBJECTIVES
+        ]
+
+    def lower_bounds(
+        self, origin: Point, destination: Point, pairs: np.ndarray
+    ) -> PairBounds:
+        """
+        Оценивает снизу время поездки и критерии отсечения для пар остановок.
+
+        Args:
+            origin: Начальная точка (широта, долгота)
+            destination: Конечная точка (широта, долгота)
+            pairs: Пары остановок (широта, долгота начальной,
+                широта, долгота конечной остановки) - массив (n, 4)
+
+        Returns:
+            Оценки пар «от двери до двери»
+        """
+        access = haversine(origin[0], origin[1], pairs[:, 0], pairs[:, 1])
+        egress = haversine(pairs[:, 2], pairs[:, 3], destination[0], destination[1])
+        ride = haversine(pairs[:, 0], pairs[:, 1], pairs[:, 2], pairs[:, 3])
+        walking = access + egress
+        walking_time = walking / self.walking_speed
+        door_to_door = walking_time + ride / self.transit_speed
+        bounds = np.zeros((len(pairs), len(self.objectives)))
+        for column, name in enumerate(self.objectives):
+            if name == "total_duration":
+                bounds[:, column] = door_to_door
+            elif name == "walking_distance":
+                bounds[:, column] = walking
+        return PairBounds(door_to_door, walking_time, walking, bounds)
+
+    def door_to_door_values(
+        self, route: Dict[str, Any], estimate: PairBounds, index: int
+    ) -> np.ndarray:
+        """Критерии отсечения построенного маршрута пары с подходом и отходом."""
+        values = objectives_matrix([route], self.objectives)
+        for column, name in enumerate(self.objectives):
+            if name == "total_duration":
+                values[:, column] += estimate.access_time[index]
+            elif name == "walking_distance":
+                values[:, column] += estimate.access_distance[index]
+        return values
+
+    async def iter_routes(
+        self,
+        origin: Point,
+        destination: Point,
+        initial_stops: List[Dict[str, Any]],
+        end_stops: List[Dict[str, Any]],
+    ) -> AsyncIterator[Tuple[Dict[str, Any], int]]:
+        """
+        Строит маршруты для пар остановок в порядке возрастания нижней
+        границы, отдавая их по мере готовности.
+
+        Маршруты из кэша не расходуют бюджет и запрашиваются первыми.
+        Одновременно строится не больше QUERY_PLANNER_PARALLELISM маршрутов,
+        запросов к провайдерам - не больше QUERY_PLANNER_CALL_BUDGET;
+        по истечении ROUTE_BUILD_TIMEOUT незавершенные запросы отменяются.
+
+        Args:
+            origin: Начальная точка (широта, долгота)
+            destination: Конечная точка (широта, долгота)
+            initial_stops: Остановки у начальной точки
+            end_stops: Остановки у конечной точки
+
+        Yields:
+            Кортежи (построенный маршрут, общее количество пар остановок)
+        """
+        service = self.transport_service
+        pairs = service.candidate_pairs(initial_stops, end_stops)
+        if not pairs:
+            return
+        total = len(pairs)
+        estimate = self.lower_bounds(
+            origin, destination, np.array(pairs, dtype=np.float64)
+        )
+        order = np.argsort(estimate.door_to_door, kind="stable").tolist()
+        cached = {index for index in order if service.is_route_cached(*pairs[index])}
+        remaining = deque(
+            [index for index in order if index in cached]
+            + [index for index in order if index not in cached]
+        )
+
+        # Критерии отсечения построенных маршрутов «от двери до двери»
+        built: List[np.ndarray] = []
+        calls = from_cache = pruned = 0
+        running: Dict[asyncio.Task, int] = {}
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        try:
+            while True:
+                if self.objectives and built and remaining:
+                    # Пары, нижние границы которых не лучше построенного
+                    # маршрута ни по одному критерию, во фронт Парето не попадут
+                    values = np.vstack(built)
+                    candidates = np.fromiter(remaining, dtype=np.int64)
+                    bounds = estimate.bounds[candidates]
+                    dominated = (
+                        (values[:, None, :] <= bounds[None, :, :])
+                        .all(axis=2)
+                        .any(axis=0)
+                    )
+                    if dominated.any():
+                        pruned += int(dominated.sum())
+                        remaining = deque(candidates[~dominated].tolist())
+
+                while remaining and len(running) < self.parallelism:
+                    if remaining[0] in cached:
+                        from_cache += 1
+                    elif calls < self.call_budget:
+                        calls += 1
+                    else:
+                        break
+                    index = remaining.popleft()
+                    task = asyncio.create_task(
+                        service.build_public_transport_route(*pairs[index])
+                    )
+                    running[task] = index
+
+                if not running:
+                    break
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                done, _ = await asyncio.wait(
+                    running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    index = running.pop(task)
+                    route = task.result()
+                    if not route:
+                        continue
+                    if self.objectives:
+                        built.append(self.door_to_door_values(route, estimate, index))
+                    yield route, total
+        finally:
+            # Клиент мог отключиться, не дождавшись всех маршрутов
+            for task in running:
+                task.cancel()
+
+        # Не запрошены: сверх бюджета или не хватило времени
+        skipped = len(remaining)
+        QUERY_PLANNER_PAIRS.inc(from_cache, outcome="cached")
+        QUERY_PLANNER_PAIRS.inc(calls, outcome="requested")
+        QUERY_PLANNER_PAIRS.inc(pruned, outcome="pruned")
+        QUERY_PLANNER_PAIRS.inc(skipped, outcome="skipped")
+        logger.debug(
+            "Планировщик запросов: {} пар, из кэша {}, запросов {}, "
+            "отсечено {}, не запрошено {}",
+            total,
+            from_cache,
+            calls,
+            pruned,
+            skipped,
+        )
+        if running:
+            logger.warning(
+                "Не успели построиться {} из {} маршрутов за {} с",
+                len(running),
+                from_cache + calls,
+                self.timeout,
+            )
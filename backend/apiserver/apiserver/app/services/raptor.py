@@ -0,0 +1,862 @@
+"""
+Локальное построение маршрутов общественного транспорта по расписанию GTFS.
+
+Фид GTFS загружается в компактные массивы: поездки с одинаковой
+последовательностью остановок объединяются в шаблоны (routes в терминах
+RAPTOR), времена прибытия и отправления шаблона хранятся матрицей
+(поездки x остановки). Поиск - RAPTOR (Round-bAsed Public Transit
+Optimized Router): за раунд k находятся лучшие прибытия с k поездками,
+сканирование шаблона векторизовано по его остановкам.
+
+Один вызов route_matrix строит маршруты для всех пар начальных и конечных
+точек: на каждую начальную точку выполняется один поиск сразу от всех
+остановок GTFS в радиусе пешей доступности до всех остановок у конечных
+точек. Результат - маршруты в общей схеме провайдеров (routing_providers).
+"""
+import csv
+import io
+import threading
+import zipfile
+from dataclasses import dataclass
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from loguru import logger
+
+from apiserver.app.services.geo import METERS_PER_DEGREE, haversine
+from apiserver.app.services.routing_providers import linestring, normalized_route
+
+# Время прибытия «не достигнута»
+INF = np.iinfo(np.int32).max
+
+# Виды меток раунда
+_NONE, _RIDE, _WALK = 0, 1, 2
+
+Point = Tuple[float, float]
+
+
+def _parse_time(value: str) -> int:
+    """Время GTFS (ЧЧ:ММ:СС, часы могут быть больше 23) в секундах."""
+    hours, minutes, seconds = value.strip().split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+@dataclass
+class GtfsFeed:
+    """Таблицы фида GTFS, нужные для построения маршрутов."""
+
+    stop_ids: List[str]
+    stop_names: List[str]
+    stop_lat: np.ndarray
+    stop_lon: np.ndarray
+    route_names: Dict[str, str]
+    # trip_id -> (route_id, service_id)
+    trips: Dict[str, Tuple[str, str]]
+    # trip_id -> (индексы остановок, прибытия, отправления)
+    stop_times: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]
+    # service_id -> (дни недели, дата начала, дата окончания)
+    calendar: Dict[str, Tuple[Tuple[bool, ...], date, date]]
+    # (service_id, дата) -> добавлено (True) или отменено (False)
+    calendar_dates: Dict[Tuple[str, date], bool]
+    # Явные пересадки: (откуда, куда) -> минимальное время (секунды)
+    transfers: Dict[Tuple[int, int], int]
+    timezone: ZoneInfo
+
+    @classmethod
+    def load(cls, path: str) -> "GtfsFeed":
+        """
+        Загружает фид из zip-архива или каталога.
+
+        Args:
+            path: Путь к фиду GTFS
+        """
+        tables = _GtfsTables(Path(path))
+
+        stop_ids, stop_names, lat, lon = [], [], [], []
+        for row in tables.rows("stops.txt"):
+            # Станции (location_type=1) и входы - не места посадки
+            if row.get("location_type", "") not in ("", "0"):
+                continue
+            stop_ids.append(row["stop_id"])
+            stop_names.append(row.get("stop_name", ""))
+            lat.append(float(row["stop_lat"]))
+            lon.append(float(row["stop_lon"]))
+        stop_index = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+
+        route_names = {}
+        for row in tables.rows("routes.txt"):
+            name = row.get("route_short_name") or row.get("route_long_name", "")
+            route_names[row["route_id"]] = name
+
+        trips = {
+            row["trip_id"]: (row["route_id"], row["service_id"])
+            for row in tables.rows("trips.txt")
+        }
+
+        raw_times: Dict[str, List[Tuple[int, int, int, int]]] = {}
+        for row in tables.rows("stop_times.txt"):
+            stop = stop_index.get(row["stop_id"])
+            arrival = row.get("arrival_time", "").strip()
+            departure = row.get("departure_time", "").strip() or arrival
+            # Остановки без времени (интерполируемые) пропускаем
+            if stop is None or not departure:
+                continue
+            raw_times.setdefault(row["trip_id"], []).append(
+                (
+                    int(row["stop_sequence"]),
+                    stop,
+                    _parse_time(arrival or departure),
+                    _parse_time(departure),
+                )
+            )
+        stop_times = {}
+        for trip_id, rows in raw_times.items():
+            if trip_id not in trips or len(rows) < 2:
+                continue
+            rows.sort()
+            columns = np.array([row[1:] for row in rows], dtype=np.int32)
+            stop_times[trip_id] = (columns[:, 0], columns[:, 1], columns[:, 2])
+
+        calendar = {}
+        for row in tables.rows("calendar.txt"):
+            days = tuple(
+                row[day] == "1"
+                for day in (
+                    "monday",
+                    "tuesday",
+                    "wednesday",
+                    "thursday",
+                    "friday",
+                    "saturday",
+                    "sunday",
+                )
+            )
+            calendar[row["service_id"]] = (
+                days,
+                datetime.strptime(row["start_date"], "%Y%m%d").date(),
+                datetime.strptime(row["end_date"], "%Y%m%d").date(),
+            )
+        calendar_dates = {}
+        for row in tables.rows("calendar_dates.txt"):
+            day = datetime.strptime(row["date"], "%Y%m%d").date()
+            # Тип 1 - поездки добавлены, 2 - отменены
+            added = row["exception_type"].strip() == "1"
+            calendar_dates[(row["service_id"], day)] = added
+
+        transfers = {}
+        for row in tables.rows("transfers.txt"):
+            from_stop = stop_index.get(row["from_stop_id"])
+            to_stop = stop_index.get(row["to_stop_id"])
+            # Тип 3 - пересадка невозможна
+            if from_stop is None or to_stop is None or row.get("transfer_type") == "3":
+                continue
+            transfers[(from_stop, to_stop)] = int(row.get("min_transfer_time") or 0)
+
+        agencies = list(tables.rows("agency.txt"))
+        timezone = ZoneInfo(
+            agencies[0]["agency_timezone"] if agencies else "Europe/Moscow"
+        )
+
+        return cls(
+            stop_ids=stop_ids,
+            stop_names=stop_names,
+            stop_lat=np.array(lat, dtype=np.float64),
+            stop_lon=np.array(lon, dtype=np.float64),
+            route_names=route_names,
+            trips=trips,
+            stop_times=stop_times,
+            calendar=calendar,
+            calendar_dates=calendar_dates,
+            transfers=transfers,
+            timezone=timezone,
+        )
+
+    def is_active(self, service_id: str, day: date) -> bool:
+        """Проверяет, действует ли сервис (календарь поездок) в этот день."""
+        exception = self.calendar_dates.get((service_id, day))
+        if exception is not None:
+            return exception
+        entry = self.calendar.get(service_id)
+        if entry is None:
+            return False
+        days, start, end = entry
+        return start <= day <= end and days[day.weekday()]
+
+
+class _GtfsTables:
+    """Чтение таблиц GTFS из zip-архива или каталога."""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def rows(self, name: str) -> Iterator[Dict[str, str]]:
+        """Строки таблицы (пусто, если таблицы нет)."""
+        if self.path.is_dir():
+            table = self.path / name
+            if not table.exists():
+                return
+            with open(table, encoding="utf-8-sig", newline="") as file:
+                yield from csv.DictReader(file)
+            return
+
+        with zipfile.ZipFile(self.path) as archive:
+            if name not in archive.namelist():
+                return
+            with archive.open(name) as raw:
+                yield from csv.DictReader(
+                    io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+                )
+
+
+@dataclass
+class Timetable:
+    """
+    Расписание одного дня в массивах для RAPTOR.
+
+    Поездки шаблона упорядочены по отправлению и не обгоняют друг друга,
+    поэтому в каждом столбце матрицы отправлений времена не убывают.
+    """
+
+    service_date: date
+    # Остановки шаблонов: pattern_stops[pattern_offsets[p]:pattern_offsets[p + 1]]
+    pattern_offsets: np.ndarray
+    pattern_stops: np.ndarray
+    pattern_route: List[str]
+    arrivals: List[np.ndarray]
+    departures: List[np.ndarray]
+    # Шаблоны через остановку и позиция остановки в шаблоне
+    stop_offsets: np.ndarray
+    stop_patterns: np.ndarray
+    stop_positions: np.ndarray
+    # Пешие пересадки: transfer_to[transfer_offsets[s]:transfer_offsets[s + 1]]
+    transfer_offsets: np.ndarray
+    transfer_to: np.ndarray
+    transfer_time: np.ndarray
+    transfer_distance: np.ndarray
+
+    @classmethod
+    def build(
+        cls,
+        feed: GtfsFeed,
+        service_date: date,
+        transfer_radius: float,
+        walking_speed: float,
+    ) -> "Timetable":
+        """
+        Строит расписание на дату.
+
+        Args:
+            feed: Фид GTFS
+            service_date: Дата
+            transfer_radius: Радиус пеших пересадок между остановками (метры)
+            walking_speed: Скорость пешехода (м/с)
+        """
+        # Поездки, действующие в этот день, по последовательности остановок
+        groups: Dict[Tuple[str, Tuple[int, ...]], List[str]] = {}
+        for trip_id, (stops, _, _) in feed.stop_times.items():
+            route_id, service_id = feed.trips[trip_id]
+            if feed.is_active(service_id, service_date):
+                groups.setdefault((route_id, tuple(stops.tolist())), []).append(trip_id)
+
+        pattern_stops, pattern_offsets, pattern_route = [], [0], []
+        arrivals, departures = [], []
+        for (route_id, stops), trip_ids in groups.items():
+            trip_ids.sort(key=lambda trip_id: feed.stop_times[trip_id][2][0])
+            # Обгоняющие поездки выносятся в отдельные шаблоны
+            for chain in _fifo_chains(feed, trip_ids):
+                pattern_stops.extend(stops)
+                pattern_offsets.append(len(pattern_stops))
+                pattern_route.append(route_id)
+                arrivals.append(np.stack([feed.stop_times[t][1] for t in chain]))
+                departures.append(np.stack([feed.stop_times[t][2] for t in chain]))
+
+        pattern_offsets = np.array(pattern_offsets, dtype=np.int64)
+        pattern_stops = np.array(pattern_stops, dtype=np.int64)
+        n_stops = len(feed.stop_ids)
+
+        # Обратный индекс: остановка -> (шаблон, позиция)
+        pattern_of = np.repeat(np.arange(len(pattern_route)), np.diff(pattern_offsets))
+        positions = np.arange(len(pattern_stops)) - pattern_offsets[pattern_of]
+        order = np.argsort(pattern_stops, kind="stable")
+        stop_offsets = np.zeros(n_stops + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pattern_stops, minlength=n_stops), out=stop_offsets[1:])
+
+        transfers = _walking_transfers(feed, transfer_radius, walking_speed)
+
+        return cls(
+            service_date=service_date,
+            pattern_offsets=pattern_offsets,
+            pattern_stops=pattern_stops,
+            pattern_route=pattern_route,
+            arrivals=arrivals,
+            departures=departures,
+            stop_offsets=stop_offsets,
+            stop_patterns=pattern_of[order],
+            stop_positions=positions[order],
+            **transfers,
+        )
+
+    def stops_of(self, pattern: int) -> np.ndarray:
+        return self.pattern_stops[
+            self.pattern_offsets[pattern] : self.pattern_offsets[pattern + 1]
+        ]
+
+
+def _fifo_chains(feed: GtfsFeed, trip_ids: List[str]) -> List[List[str]]:
+    """Разбивает поездки на цепочки, в которых поездки не обгоняют друг друга."""
+    chains: List[List[str]] = []
+    for trip_id in trip_ids:
+        departures = feed.stop_times[trip_id][2]
+        for chain in chains:
+            if np.all(feed.stop_times[chain[-1]][2] <= departures):
+                chain.append(trip_id)
+                break
+        else:
+            chains.append([trip_id])
+    return chains
+
+
+def _walking_transfers(
+    feed: GtfsFeed, radius: float, walking_speed: float
+) -> Dict[str, np.ndarray]:
+    """
+    Пешие пересадки между остановками ближе radius метров и явные
+    пересадки из transfers.txt.
+    """
+    n_stops = len(feed.stop_ids)
+    order = np.argsort(feed.stop_lat)
+    sorted_lat = feed.stop_lat[order]
+    lat_window = radius / METERS_PER_DEGREE
+
+    edges: Dict[Tuple[int, int], Tuple[int, float]] = {}
+    for i in range(n_stops):
+        lo, hi = np.searchsorted(
+            sorted_lat, [feed.stop_lat[i] - lat_window, feed.stop_lat[i] + lat_window]
+        )
+        candidates = order[lo:hi]
+        distances = haversine(
+            feed.stop_lat[i],
+            feed.stop_lon[i],
+            feed.stop_lat[candidates],
+            feed.stop_lon[candidates],
+        )
+        for j, distance in zip(candidates, distances):
+            if j != i and distance <= radius:
+                edges[(i, int(j))] = (int(distance / walking_speed), float(distance))
+
+    for (i, j), min_time in feed.transfers.items():
+        if i == j:
+            continue
+        distance = float(
+            haversine(
+                feed.stop_lat[i], feed.stop_lon[i], feed.stop_lat[j], feed.stop_lon[j]
+            )
+        )
+        edges[(i, j)] = (max(min_time, int(distance / walking_speed)), distance)
+
+    keys = sorted(edges)
+    transfer_from = np.array([key[0] for key in keys], dtype=np.int64)
+    transfer_offsets = np.zeros(n_stops + 1, dtype=np.int64)
+    np.cumsum(np.bincount(transfer_from, minlength=n_stops), out=transfer_offsets[1:])
+    return {
+        "transfer_offsets": transfer_offsets,
+        "transfer_to": np.array([key[1] for key in keys], dtype=np.int64),
+        "transfer_time": np.array([edges[key][0] for key in keys], dtype=np.int64),
+        "transfer_distance": np.array([edges[key][1] for key in keys]),
+    }
+
+
+@dataclass
+class _Rounds:
+    """Метки раундов RAPTOR для восстановления маршрутов."""
+
+    labels: List[np.ndarray]
+    kind: List[np.ndarray]
+    pattern: List[np.ndarray]
+    trip: List[np.ndarray]
+    board: List[np.ndarray]
+    alight: List[np.ndarray]
+    walk_from: List[np.ndarray]
+
+
+def raptor(timetable: Timetable, sources: Dict[int, int], max_rounds: int) -> _Rounds:
+    """
+    Поиск RAPTOR от нескольких остановок одновременно.
+
+    Args:
+        timetable: Расписание
+        sources: Время (секунды от начала суток), с которого пассажир
+            находится на остановке, по индексу остановки
+        max_rounds: Максимальное количество поездок
+
+    Returns:
+        Метки раундов: labels[k][s] - лучшее прибытие на s не более чем
+        с k поездками
+    """
+    n_stops = len(timetable.stop_offsets) - 1
+    n_patterns = len(timetable.pattern_route)
+    best = np.full(n_stops, INF, dtype=np.int64)
+    labels = np.full(n_stops, INF, dtype=np.int64)
+    for stop, time in sources.items():
+        labels[stop] = min(labels[stop], time)
+    best[:] = labels
+    marked = labels < INF
+
+    def empty(fill: int) -> np.ndarray:
+        return np.full(n_stops, fill, dtype=np.int64)
+
+    rounds = _Rounds([labels], [empty(_NONE)], [], [], [], [], [])
+    for name in ("pattern", "trip", "board", "alight", "walk_from"):
+        getattr(rounds, name).append(empty(-1))
+
+    for _ in range(max_rounds):
+        previous = labels
+        labels = previous.copy()
+        kind, pattern_of, trip_of = empty(_NONE), empty(-1), empty(-1)
+        board_of, alight_of, walk_from = empty(-1), empty(-1), empty(-1)
+
+        # Шаблоны через отмеченные остановки и самая ранняя позиция посадки
+        marked_stops = np.flatnonzero(marked)
+        starts = timetable.stop_offsets[marked_stops]
+        counts = timetable.stop_offsets[marked_stops + 1] - starts
+        entries = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(
+            counts.sum()
+        )
+        first_position = np.full(n_patterns, INF, dtype=np.int64)
+        np.minimum.at(
+            first_position,
+            timetable.stop_patterns[entries],
+            timetable.stop_positions[entries],
+        )
+
+        improved = np.zeros(n_stops, dtype=bool)
+        for pattern in np.flatnonzero(first_position < INF):
+            start = first_position[pattern]
+            stops = timetable.stops_of(pattern)[start:]
+            departures = timetable.departures[pattern][:, start:]
+            n_trips = len(departures)
+
+            # Самая ранняя поездка, на которую можно сесть на каждой остановке
+            boardable = (departures < previous[stops][None, :]).sum(axis=0)
+            boardable[~marked[stops]] = n_trips
+            # Поездка, на которой пассажир подъезжает к остановке: самая ранняя
+            # из доступных на предыдущих остановках шаблона
+            reachable = np.minimum.accumulate(boardable)
+            trip = np.empty(len(stops), dtype=np.int64)
+            trip[0] = n_trips
+            trip[1:] = reachable[:-1]
+
+            # Позиция посадки - последняя, где доступная поездка стала более ранней
+            positions = np.arange(len(stops))
+            earlier = np.empty(len(stops), dtype=bool)
+            earlier[0] = reachable[0] < n_trips
+            earlier[1:] = reachable[1:] < reachable[:-1]
+            board = np.empty(len(stops), dtype=np.int64)
+            board[0] = -1
+            board[1:] = np.maximum.accumulate(np.where(earlier, positions, -1))[:-1]
+
+            riding = trip < n_trips
+            if not riding.any():
+                continue
+            arrival = np.full(len(stops), INF, dtype=np.int64)
+            arrival[riding] = timetable.arrivals[pattern][
+                trip[riding], start + positions[riding]
+            ]
+            better = np.flatnonzero(arrival < best[stops])
+            if len(better) == 0:
+                continue
+            # При повторе остановки в шаблоне побеждает более раннее прибытие
+            better = better[np.argsort(-arrival[better], kind="stable")]
+            targets = stops[better]
+            labels[targets] = best[targets] = arrival[better]
+            kind[targets] = _RIDE
+            pattern_of[targets] = pattern
+            trip_of[targets] = trip[better]
+            board_of[targets] = start + board[better]
+            alight_of[targets] = start + better
+            improved[targets] = True
+
+        # Пешие пересадки от остановок, улучшенных поездками этого раунда
+        ridden = np.flatnonzero(improved)
+        starts = timetable.transfer_offsets[ridden]
+        counts = timetable.transfer_offsets[ridden + 1] - starts
+        edges = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(
+            counts.sum()
+        )
+        origins = np.repeat(ridden, counts)
+        destinations = timetable.transfer_to[edges]
+        arrival = labels[origins] + timetable.transfer_time[edges]
+        better = np.flatnonzero(arrival < best[destinations])
+        better = better[np.argsort(-arrival[better], kind="stable")]
+        targets = destinations[better]
+        labels[targets] = best[targets] = arrival[better]
+        kind[targets] = _WALK
+        walk_from[targets] = origins[better]
+        improved[targets] = True
+
+        rounds.labels.append(labels)
+        rounds.kind.append(kind)
+        rounds.pattern.append(pattern_of)
+        rounds.trip.append(trip_of)
+        rounds.board.append(board_of)
+        rounds.alight.append(alight_of)
+        rounds.walk_from.append(walk_from)
+
+        marked = improved
+        if not marked.any():
+            break
+    return rounds
+
+
+class RaptorEngine:
+    """
+    Локальный движок маршрутов по фиду GTFS.
+
+    Расписание строится на дату запроса и перестраивается при смене даты
+    (на текущую дату - при запуске приложения). Методы синхронные
+    и рассчитаны на вызов в отдельном потоке.
+    """
+
+    def __init__(
+        self,
+        feed: GtfsFeed,
+        max_transfers: int = 3,
+        access_radius: float = 400,
+        transfer_radius: float = 200,
+        walking_speed: float = 1.2,
+    ):
+        """
+        Args:
+            feed: Фид GTFS
+            max_transfers: Максимальное количество пересадок
+            access_radius: Радиус пешего подхода от точки к остановкам (метры)
+            transfer_radius: Радиус пеших пересадок между остановками (метры)
+            walking_speed: Скорость пешехода (м/с)
+        """
+        self.feed = feed
+        self.max_transfers = max_transfers
+        self.access_radius = access_radius
+        self.transfer_radius = transfer_radius
+        self.walking_speed = walking_speed
+        self.timetable: Optional[Timetable] = None
+        # Расписание строится одним потоком, остальные ждут готового
+        self._timetable_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str, **options) -> "RaptorEngine":
+        """Загружает фид GTFS и создает движок (параметры - как у __init__)."""
+        feed = GtfsFeed.load(path)
+        logger.info(
+            "Загружен фид GTFS {}: {} остановок, {} поездок",
+            path,
+            len(feed.stop_ids),
+            len(feed.stop_times),
+        )
+        return cls(feed, **options)
+
+    def timetable_for(self, service_date: date) -> Timetable:
+        """Возвращает расписание на дату, при необходимости перестраивая его."""
+        timetable = self.timetable
+        if timetable is not None and timetable.service_date == service_date:
+            return timetable
+        with self._timetable_lock:
+            timetable = self.timetable
+            if timetable is None or timetable.service_date != service_date:
+                timetable = Timetable.build(
+                    self.feed, service_date, self.transfer_radius, self.walking_speed
+                )
+                self.timetable = timetable
+                logger.info(
+                    "Построено расписание RAPTOR на {}: {} шаблонов",
+                    service_date,
+                    len(timetable.pattern_route),
+                )
+        return timetable
+
+    def _nearby_stops(self, point: Point) -> List[Tuple[int, int, float]]:
+        """Остановки в радиусе пешего подхода: (индекс, время, расстояние)."""
+        distances = haversine(
+            point[0], point[1], self.feed.stop_lat, self.feed.stop_lon
+        )
+        nearby = np.flatnonzero(distances <= self.access_radius)
+        return [
+            (
+                int(stop),
+                int(distances[stop] / self.walking_speed),
+                float(distances[stop]),
+            )
+            for stop in nearby
+        ]
+
+    def route_matrix(
+        self,
+        origins: Sequence[Point],
+        destinations: Sequence[Point],
+        departure: Optional[datetime] = None,
+    ) -> List[List[Optional[Dict]]]:
+        """
+        Строит маршруты для всех пар начальных и конечных точек.
+
+        Args:
+            origins: Начальные точки (широта, долгота)
+            destinations: Конечные точки (широта, долгота)
+            departure: Время отправления (по умолчанию - текущее)
+
+        Returns:
+            Матрица маршрутов в общей схеме провайдеров (None - маршрут не найден)
+        """
+        timetable, now = self._departure(departure)
+        egress = [self._nearby_stops(point) for point in destinations]
+        matrix = []
+        for origin in origins:
+            access = self._nearby_stops(origin)
+            if not access:
+                matrix.append([None] * len(destinations))
+                continue
+            sources = {stop: now + time for stop, time, _ in access}
+            rounds = raptor(timetable, sources, self.max_transfers + 1)
+            matrix.append(
+                [
+                    self._journey(
+                        timetable, rounds, now, origin, access, destination, stops
+                    )
+                    for destination, stops in zip(destinations, egress)
+                ]
+            )
+        return matrix
+
+    def travel_times(
+        self,
+        origins: Sequence[Point],
+        destinations: Sequence[Point],
+        departure: Optional[datetime] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Рассчитывает время в пути и количество пересадок для всех пар точек
+        без восстановления маршрутов.
+
+        Args:
+            origins: Начальные точки (широта, долгота)
+            destinations: Конечные точки (широта, долгота)
+            departure: Время отправления (по умолчанию - текущее)
+
+        Returns:
+            Матрицы (начальные x конечные точки) времени в пути в секундах
+            и количества пересадок; для недостижимых пар время равно INF
+        """
+        timetable, now = self._departure(departure)
+        durations = np.full((len(origins), len(destinations)), INF, dtype=np.int64)
+        transfers = np.zeros((len(origins), len(destinations)), dtype=np.int64)
+
+        # Остановки у всех конечных точек одним списком
+        egress = [
+            (destination, stop, time)
+            for destination, point in enumerate(destinations)
+            for stop, time, _ in self._nearby_stops(point)
+        ]
+        if not egress:
+            return durations, transfers
+        egress_point, egress_stop, egress_time = (
+            np.array(column, dtype=np.int64) for column in zip(*egress)
+        )
+
+        for row, origin in enumerate(origins):
+            access = self._nearby_stops(origin)
+            if not access:
+                continue
+            sources = {stop: now + time for stop, time, _ in access}
+            rounds = raptor(timetable, sources, self.max_transfers + 1)
+
+            # Прибытие в конечную точку через каждую ее остановку в каждом
+            # раунде; как и в _journey, при равном прибытии - меньше поездок
+            labels = np.stack(rounds.labels[1:])[:, egress_stop]
+            arrivals = np.where(labels < INF, labels + egress_time, INF)
+            best_round = arrivals.argmin(axis=0)
+            best = arrivals[best_round, np.arange(len(egress_stop))]
+
+            # Лучшая остановка для каждой конечной точки
+            order = np.lexsort((best_round, best, egress_point))
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = egress_point[order][1:] != egress_point[order][:-1]
+            chosen = order[first]
+            reached = best[chosen] < INF
+            columns = egress_point[chosen][reached]
+            durations[row, columns] = best[chosen][reached] - now
+            # Раунд k (с нуля среди раундов с поездками) - k + 1 поездок
+            transfers[row, columns] = best_round[chosen][reached]
+        return durations, transfers
+
+    def _departure(self, departure: Optional[datetime]) -> Tuple[Timetable, int]:
+        """Расписание на дату отправления и время отправления от начала суток."""
+        departure = (departure or datetime.now(self.feed.timezone)).astimezone(
+            self.feed.timezone
+        )
+        timetable = self.timetable_for(departure.date())
+        midnight = departure.replace(hour=0, minute=0, second=0, microsecond=0)
+        return timetable, int((departure - midnight).total_seconds())
+
+    def _journey(
+        self,
+        timetable: Timetable,
+        rounds: _Rounds,
+        now: int,
+        origin: Point,
+        access: List[Tuple[int, int, float]],
+        destination: Point,
+        egress: List[Tuple[int, int, float]],
+    ) -> Optional[Dict]:
+        """Восстанавливает лучший маршрут до конечной точки."""
+        best = None
+        for k, labels in enumerate(rounds.labels):
+            if k == 0:
+                continue
+            for stop, time, distance in egress:
+                if labels[stop] >= INF:
+                    continue
+                arrival = labels[stop] + time
+                # При равном прибытии предпочитаем меньше пересадок
+                if best is None or arrival < best[0]:
+                    best = (arrival, k, stop, time, distance)
+        if best is None:
+            return None
+        arrival, k, stop, egress_time, egress_distance = best
+
+        # Ноги маршрута от конца к началу
+        legs = []
+        position = (destination[0], destination[1])
+        legs.append(self._walk(stop, None, egress_time, egress_distance, position))
+        while k > 0:
+            if rounds.kind[k][stop] == _NONE:
+                k -= 1
+                continue
+            if rounds.kind[k][stop] == _WALK:
+                origin_stop = rounds.walk_from[k][stop]
+                legs.append(self._transfer(timetable, origin_stop, stop))
+                stop = origin_stop
+                continue
+            pattern = rounds.pattern[k][stop]
+            trip = rounds.trip[k][stop]
+            board = rounds.board[k][stop]
+            alight = rounds.alight[k][stop]
+            stops = timetable.stops_of(pattern)
+            legs.append(
+                self._ride(
+                    timetable, pattern, trip, board, alight, rounds.labels[k - 1]
+                )
+            )
+            stop = stops[board]
+            k -= 1
+        access_time, access_distance = {
+            access_stop: (time, distance) for access_stop, time, distance in access
+        }[stop]
+        legs.append(self._walk(None, stop, access_time, access_distance, origin))
+        legs.reverse()
+
+        movements = []
+        for leg in legs:
+            if leg["type"] == "walkway" and not leg["distance"]:
+                continue
+            leg["id"] = str(len(movements))
+            movements.append(leg)
+        return normalized_route(movements, int(arrival - now))
+
+    def _point(self, stop: int) -> Point:
+        return float(self.feed.stop_lat[stop]), float(self.feed.stop_lon[stop])
+
+    def _walk(
+        self,
+        from_stop: Optional[int],
+        to_stop: Optional[int],
+        time: int,
+        distance: float,
+        point: Point,
+    ) -> Dict:
+        """Пеший участок между точкой и остановкой."""
+        start = point if from_stop is None else self._point(from_stop)
+        end = point if to_stop is None else self._point(to_stop)
+        return _movement(
+            "walkway",
+            distance,
+            time,
+            0,
+            self.feed.stop_names[to_stop] if to_stop is not None else "",
+            [],
+            [start, end],
+        )
+
+    def _transfer(self, timetable: Timetable, from_stop: int, to_stop: int) -> Dict:
+        """Пешая пересадка между остановками."""
+        start, end = timetable.transfer_offsets[from_stop : from_stop + 2]
+        edge = start + int(
+            np.flatnonzero(timetable.transfer_to[start:end] == to_stop)[0]
+        )
+        return _movement(
+            "walkway",
+            float(timetable.transfer_distance[edge]),
+            int(timetable.transfer_time[edge]),
+            0,
+            self.feed.stop_names[to_stop],
+            [],
+            [self._point(from_stop), self._point(to_stop)],
+        )
+
+    def _ride(
+        self,
+        timetable: Timetable,
+        pattern: int,
+        trip: int,
+        board: int,
+        alight: int,
+        ready: np.ndarray,
+    ) -> Dict:
+        """Поездка от остановки посадки до остановки высадки."""
+        stops = timetable.stops_of(pattern)[board : alight + 1]
+        departure = int(timetable.departures[pattern][trip, board])
+        arrival = int(timetable.arrivals[pattern][trip, alight])
+        points = [self._point(stop) for stop in stops]
+        distance = float(
+            haversine(
+                self.feed.stop_lat[stops[:-1]],
+                self.feed.stop_lon[stops[:-1]],
+                self.feed.stop_lat[stops[1:]],
+                self.feed.stop_lon[stops[1:]],
+            ).sum()
+        )
+        return _movement(
+            "passage",
+            distance,
+            arrival - departure,
+            # Ожидание - от момента, когда пассажир на остановке, до отправления
+            max(departure - int(ready[stops[0]]), 0),
+            self.feed.stop_names[stops[0]],
+            [self.feed.route_names.get(timetable.pattern_route[pattern], "")],
+            points,
+        )
+
+
+def _movement(
+    movement_type: str,
+    distance: float,
+    moving_duration: int,
+    waiting_duration: int,
+    name: str,
+    routes_names: List[str],
+    points: List[Point],
+) -> Dict:
+    """Участок маршрута в общей схеме провайдеров."""
+    passage = movement_type == "passage"
+    return {
+        "type": movement_type,
+        "distance": int(distance),
+        "moving_duration": int(moving_duration),
+        "waiting_duration": int(waiting_duration),
+        "waypoint": {
+            "name": name,
+            "subtype": "passage" if passage else "pedestrian",
+            "routes_names": routes_names,
+        },
+        "alternatives": [{"geometry": [{"selection": linestring(points)}]}],
+    }
@@ -0,0 +1,368 @@
+"""
+Защита от сбоев внешних API.
+
+Транспорт HTTP-клиента для каждого эндпоинта (хост и путь) ведет
+автоматический выключатель (circuit breaker) и адаптивный лимит
+одновременных запросов (AIMD), а повторы неудачных запросов ограничивает
+общим бюджетом. Когда выключатель разомкнут, запросы к эндпоинту сразу
+завершаются ошибкой UpstreamUnavailable, и сервисы отвечают из кэша.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+import httpx
+from loguru import logger
+
+from apiserver.app.services.metrics import (
+    UPSTREAM_BREAKER_STATE,
+    UPSTREAM_CONCURRENCY_LIMIT,
+    UPSTREAM_REJECTED,
+    UPSTREAM_RETRIES,
+)
+
+# Коды ответа, означающие перегрузку или сбой внешнего API
+RETRYABLE_STATUSES = frozenset({429, 502, 503, 504})
+
+# Значения метрики состояния выключателя
+BREAKER_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class UpstreamUnavailable(httpx.TransportError):
+    """Запрос не отправлен: выключатель разомкнут или превышен лимит."""
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель по доле ошибок в последних запросах.
+
+    Состояния: closed - запросы проходят; open - запросы отклоняются
+    в течение reset_timeout; half_open - пропускается пробный запрос,
+    по его результату выключатель замыкается или снова размыкается.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_ratio: float = 0.5,
+        window: int = 20,
+        min_calls: int = 10,
+        reset_timeout: float = 10.0,
+    ):
+        """
+        Args:
+            failure_ratio: Доля ошибок, при которой выключатель размыкается
+            window: Количество последних запросов для расчета доли ошибок
+            min_calls: Минимум запросов в окне для размыкания
+            reset_timeout: Время до пробного запроса после размыкания (секунды)
+        """
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self._results: Deque[bool] = deque(maxlen=window)
+
+    def allow(self) -> bool:
+        """Проверяет, можно ли отправить запрос."""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+        return True
+
+    def record(self, success: bool) -> None:
+        """Учитывает результат запроса."""
+        if self.state == self.HALF_OPEN:
+            self.probe_in_flight = False
+            if success:
+                self.state = self.CLOSED
+                self._results.clear()
+            else:
+                self._open()
+            return
+
+        self._results.append(success)
+        calls = len(self._results)
+        failures = self._results.count(False)
+        if calls >= self.min_calls and failures >= self.failure_ratio * calls:
+            self._open()
+
+    def _open(self) -> None:
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self._results.clear()
+
+
+class RetryBudget:
+    """
+    Бюджет повторов: каждый запрос пополняет бюджет на ratio повтора,
+    каждый повтор расходует единицу. Кроме того, допускается min_per_second
+    повторов в секунду, чтобы при малом трафике повторы оставались возможны.
+    """
+
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 1.0):
+        """
+        Args:
+            ratio: Доля повторов от числа запросов
+            min_per_second: Повторы в секунду сверх доли
+        """
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        # Запас не больше, чем на секунду повторов при пиковой доле
+        self.capacity = max(min_per_second, 1.0) * 10
+        self.balance = self.capacity
+        self.updated_at = time.monotonic()
+
+    def deposit(self) -> None:
+        """Учитывает запрос."""
+        self._refill()
+        self.balance = min(self.balance + self.ratio, self.capacity)
+
+    def withdraw(self) -> bool:
+        """Расходует единицу бюджета на повтор, если она есть."""
+        self._refill()
+        if self.balance < 1.0:
+            return False
+        self.balance -= 1.0
+        return True
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.balance = min(
+            self.balance + (now - self.updated_at) * self.min_per_second,
+            self.capacity,
+        )
+        self.updated_at = now
+
+
+class AdaptiveLimit:
+    """
+    Адаптивный лимит одновременных запросов (AIMD): после успешного
+    запроса лимит растет на 1/limit (примерно на единицу за «окно»
+    запросов), после сбоя или перегрузки умножается на backoff.
+    """
+
+    def __init__(
+        self,
+        initial: float = 20,
+        min_limit: float = 1,
+        max_limit: float = 100,
+        backoff: float = 0.5,
+    ):
+        """
+        Args:
+            initial: Начальный лимит
+            min_limit: Минимальный лимит
+            max_limit: Максимальный лимит
+            backoff: Множитель лимита после сбоя
+        """
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self, timeout: float) -> bool:
+        """
+        Занимает место для запроса, ожидая не дольше timeout секунд.
+
+        Returns:
+            False, если место не освободилось
+        """
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return True
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                return True
+            self._waiters.remove(waiter)
+            return False
+        except asyncio.CancelledError:
+            if waiter.done():
+                # Место уже передано этому запросу - возвращаем его
+                self.release(None)
+            else:
+                self._waiters.remove(waiter)
+            raise
+        # Место передано при освобождении, in_flight уже учтен
+        return True
+
+    def release(self, success: Optional[bool]) -> None:
+        """
+        Освобождает место и подстраивает лимит по результату запроса.
+
+        Args:
+            success: Результат запроса (None - запрос отменен, лимит не меняется)
+        """
+        if success:
+            self.limit = min(self.limit + 1 / self.limit, self.max_limit)
+        elif success is not None:
+            self.limit = max(self.limit * self.backoff, self.min_limit)
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """
+    Транспорт с выключателем и адаптивным лимитом на каждый эндпоинт
+    и повторами с экспоненциальной задержкой со случайным разбросом
+    в пределах общего бюджета.
+
+    Повторяются запросы, завершившиеся ошибкой соединения или таймаутом
+    или ответом из RETRYABLE_STATUSES. Все обращения приложения к внешним
+    API - чтение, поэтому повторять можно запросы любого метода.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        max_attempts: int = 3,
+        backoff_base: float = 0.05,
+        backoff_max: float = 1.0,
+        retry_budget: Optional[RetryBudget] = None,
+        breaker_options: Optional[Dict[str, float]] = None,
+        limit_options: Optional[Dict[str, float]] = None,
+        limit_timeout: float = 1.0,
+    ):
+        """
+        Args:
+            transport: Транспорт, выполняющий запросы
+            max_attempts: Максимальное количество попыток запроса
+            backoff_base: Задержка перед первым повтором (секунды)
+            backoff_max: Максимальная задержка перед повтором (секунды)
+            retry_budget: Общий бюджет повторов
+            breaker_options: Параметры CircuitBreaker
+            limit_options: Параметры AdaptiveLimit
+            limit_timeout: Время ожидания места в лимите (секунды)
+        """
+        self.transport = transport
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_budget = retry_budget or RetryBudget()
+        self.breaker_options = breaker_options or {}
+        self.limit_options = limit_options or {}
+        self.limit_timeout = limit_timeout
+        self.breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self.limits: Dict[Tuple[str, str], AdaptiveLimit] = {}
+
+    def _endpoint(
+        self, request: httpx.Request
+    ) -> Tuple[Tuple[str, str], CircuitBreaker, AdaptiveLimit]:
+        key = (request.url.host, request.url.path)
+        if key not in self.breakers:
+            self.breakers[key] = CircuitBreaker(**self.breaker_options)
+            self.limits[key] = AdaptiveLimit(**self.limit_options)
+        return key, self.breakers[key], self.limits[key]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key, breaker, limit = self._endpoint(request)
+        endpoint = "".join(key)
+        self.retry_budget.deposit()
+
+        attempt = 1
+        while True:
+            response, error = await self._attempt(request, endpoint, breaker, limit)
+            # Отказ самой защиты (разомкнутый выключатель, лимит) не повторяем
+            retryable = (
+                not isinstance(error, UpstreamUnavailable)
+                if error is not None
+                else response.status_code in RETRYABLE_STATUSES
+            )
+            if not retryable or attempt >= self.max_attempts:
+                break
+            if not self.retry_budget.withdraw():
+                UPSTREAM_REJECTED.inc(endpoint=endpoint, reason="retry_budget")
+                break
+
+            # Экспоненциальная задержка со случайным разбросом (full jitter)
+            delay = random.uniform(
+                0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+            )
+            if response is not None:
+                await response.aclose()
+            UPSTREAM_RETRIES.inc(endpoint=endpoint)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+        if error is not None:
+            raise error
+        return response
+
+    async def _attempt(
+        self,
+        request: httpx.Request,
+        endpoint: str,
+        breaker: CircuitBreaker,
+        limit: AdaptiveLimit,
+    ) -> Tuple[Optional[httpx.Response], Optional[Exception]]:
+        """
+        Выполняет одну попытку запроса.
+
+        Returns:
+            Ответ или ошибка попытки
+        """
+        if not breaker.allow():
+            UPSTREAM_REJECTED.inc(endpoint=endpoint, reason="circuit_open")
+            return None, UpstreamUnavailable(
+                f"Выключатель разомкнут: {endpoint}", request=request
+            )
+        if not await limit.acquire(self.limit_timeout):
+            # Пробный запрос не отправлен - разрешаем следующий
+            breaker.probe_in_flight = False
+            UPSTREAM_REJECTED.inc(endpoint=endpoint, reason="concurrency_limit")
+            return None, UpstreamUnavailable(
+                f"Превышен лимит одновременных запросов: {endpoint}", request=request
+            )
+
+        # None - попытка отменена (например, проиграла гонку хеджирования)
+        # и не считается ни успехом, ни сбоем
+        success = None
+        try:
+            response = await self.transport.handle_async_request(request)
+            success = response.status_code < 500 and (
+                response.status_code not in RETRYABLE_STATUSES
+            )
+            return response, None
+        except httpx.TransportError as e:
+            success = False
+            return None, e
+        finally:
+            limit.release(success)
+            previous_state = breaker.state
+            if success is None:
+                breaker.probe_in_flight = False
+            else:
+                breaker.record(success)
+            if breaker.state != previous_state:
+                logger.warning(
+                    "Выключатель {}: {} -> {}", endpoint, previous_state, breaker.state
+                )
+            UPSTREAM_BREAKER_STATE.set(
+                BREAKER_STATE_VALUES[breaker.state], endpoint=endpoint
+            )
+            UPSTREAM_CONCURRENCY_LIMIT.set(limit.limit, endpoint=endpoint)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
@@ -0,0 +1,143 @@
+"""
+Компактное представление маршрутов 2GIS для ответов API.
+
+Из маршрута остаются только поля, которые нужны клиентам. Одинаковые
+маршруты (например, когда самый быстрый маршрут одновременно наименее
+загруженный) передаются в ответе один раз и упоминаются по идентификатору.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+from apiserver.app.services.route_ranking import RankedRoutes, walking_distance
+
+# Поля компактного маршрута, доступные для выбора параметром fields
+COMPACT_ROUTE_FIELDS = (
+    "id",
+    "total_duration",
+    "total_distance",
+    "transfer_count",
+    "walking_distance",
+    "workload",
+    "movements",
+)
+
+
+def compact_movement(movement: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Оставляет в участке маршрута тип, длительности, остановку, названия
+    маршрутов транспорта и геометрию (WKT) первой альтернативы.
+
+    Args:
+        movement: Участок маршрута 2GIS
+
+    Returns:
+        Компактный участок маршрута
+    """
+    waypoint = movement.get("waypoint", {})
+    alternatives = movement.get("alternatives") or [{}]
+    # У 2GIS названия маршрутов транспорта - в routes[].names, в маршрутах
+    # остальных провайдеров и RAPTOR - в waypoint.routes_names
+    routes_names = [
+        name
+        for route in movement.get("routes") or []
+        for name in route.get("names") or []
+    ]
+    return {
+        "type": movement.get("type"),
+        "distance": movement.get("distance"),
+        "moving_duration": movement.get("moving_duration"),
+        "waiting_duration": movement.get("waiting_duration"),
+        "waypoint_name": waypoint.get("name"),
+        "routes_names": routes_names or waypoint.get("routes_names", []),
+        "geometry": [
+            geometry["selection"]
+            for geometry in alternatives[0].get("geometry", [])
+            if geometry.get("selection")
+        ],
+    }
+
+
+def compact_route(
+    route: Dict[str, Any], route_id: str, fields: Iterable[str] = COMPACT_ROUTE_FIELDS
+) -> Dict[str, Any]:
+    """
+    Формирует компактный маршрут с выбранными полями.
+
+    Args:
+        route: Маршрут 2GIS с рассчитанной загруженностью
+        route_id: Идентификатор маршрута в ответе
+        fields: Поля из COMPACT_ROUTE_FIELDS (id включается всегда)
+
+    Returns:
+        Компактный маршрут
+    """
+    getters = {
+        "total_duration": lambda: route.get("total_duration"),
+        "total_distance": lambda: route.get("total_distance"),
+        "transfer_count": lambda: route.get("transfer_count"),
+        "walking_distance": lambda: walking_distance(route),
+        "workload": lambda: route.get("workload"),
+        "movements": lambda: [
+            compact_movement(movement) for movement in route.get("movements", [])
+        ],
+    }
+    compact = {"id": route_id}
+    for name in fields:
+        if name in getters:
+            compact[name] = getters[name]()
+    return compact
+
+
+class CompactRouteSet:
+    """
+    Набор компактных маршрутов ответа, в котором каждый маршрут
+    хранится один раз.
+    """
+
+    def __init__(self, fields: Optional[List[str]] = None):
+        """
+        Инициализация пустого набора.
+
+        Args:
+            fields: Поля компактных маршрутов (по умолчанию - все)
+        """
+        self.fields = list(fields or COMPACT_ROUTE_FIELDS)
+        self.routes: Dict[str, Dict[str, Any]] = {}
+        self._ids: Dict[int, str] = {}
+
+    def add(self, route: Optional[Dict[str, Any]]) -> Optional[str]:
+        """
+        Добавляет маршрут, если его еще нет в наборе.
+
+        Args:
+            route: Маршрут 2GIS или None
+
+        Returns:
+            Идентификатор маршрута в наборе или None
+        """
+        if route is None:
+            return None
+        route_id = self._ids.get(id(route))
+        if route_id is None:
+            route_id = str(route.get("id") or len(self.routes))
+            if route_id in self.routes:
+                route_id = f"{route_id}-{len(self.routes)}"
+            self._ids[id(route)] = route_id
+            self.routes[route_id] = compact_route(route, route_id, self.fields)
+        return route_id
+
+    def add_ranked(self, ranked: RankedRoutes) -> Dict[str, Optional[str]]:
+        """
+        Добавляет выбранные маршруты.
+
+        Args:
+            ranked: Результат ранжирования
+
+        Returns:
+            Идентификаторы самого быстрого, сбалансированного и наименее
+            загруженного маршрутов
+        """
+        return {
+            "fastest_route": self.add(ranked.fastest),
+            "balanced_route": self.add(ranked.balanced),
+            "least_crowded_route": self.add(ranked.least_crowded),
+        }
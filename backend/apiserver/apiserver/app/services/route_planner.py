@@ -0,0 +1,418 @@
+"""
+Планирование маршрутов между парами точек.
+
+Для одной пары точек находит остановки, строит маршруты между ними,
+рассчитывает загруженность и ранжирует маршруты. Для пакета пар общие
+запросы к 2GIS (поиск остановок у одинаковых точек и построение маршрутов
+между одинаковыми парами остановок) выполняются один раз на весь пакет.
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Sequence,
+    Tuple,
+)
+
+from loguru import logger
+
+from apiserver.app.services.metrics import stage
+from apiserver.app.services.public_transport import PublicTransportService
+from apiserver.app.services.query_planner import QueryPlanner
+from apiserver.app.services.route_ranking import RankedRoutes, RouteRanker
+from apiserver.app.services.transport_workload import TransportWorkloadService
+from apiserver.config.settings import settings
+
+# Пара точек: (широта начала, долгота начала, широта конца, долгота конца)
+Trip = Tuple[float, float, float, float]
+
+
+@dataclass
+class PlanProgress:
+    """Промежуточный или окончательный результат выбора маршрутов."""
+
+    ranked: RankedRoutes
+    routes_built: int = 0
+    routes_total: int = 0
+    final: bool = False
+
+
+class RoutePlannerService:
+    """Сервис выбора маршрутов для одной пары точек или пакета пар."""
+
+    def __init__(
+        self,
+        transport_service: PublicTransportService,
+        transport_workload_service: TransportWorkloadService,
+    ):
+        """
+        Инициализация сервиса.
+
+        Args:
+            transport_service: Сервис поиска остановок и построения маршрутов
+            transport_workload_service: Сервис загруженности транспорта
+        """
+        self.transport_service = transport_service
+        self.transport_workload_service = transport_workload_service
+        self.batch_max_size = settings.get("ROUTE_BATCH_MAX_SIZE", 1000)
+        self.batch_concurrency = settings.get("ROUTE_BATCH_CONCURRENCY", 50)
+        self.batch_timeout = settings.get("ROUTE_BATCH_TIMEOUT", 60.0)  # секунды
+        # Локальный движок строит маршруты для всех пар за один проход,
+        # и планировать запросы к провайдерам не нужно
+        self.query_planner = None
+        if (
+            settings.get("QUERY_PLANNER_ENABLED", True)
+            and transport_service.raptor_engine is None
+        ):
+            self.query_planner = QueryPlanner(transport_service)
+
+    async def find_stops(
+        self, start_lat: float, start_lon: float, end_lat: float, end_lon: float
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Находит остановки у начальной и конечной точек параллельно.
+
+        Планировщик запрашивает пары остановок в пределах бюджета, поэтому
+        с ним остановок берется QUERY_PLANNER_MAX_STOP_COUNT, без него -
+        MAX_STOP_COUNT.
+
+        Returns:
+            Остановки у начальной и у конечной точки
+        """
+        max_count = self.query_planner.max_stop_count if self.query_planner else None
+        initial_stops, end_stops = await asyncio.gather(
+            self.transport_service.find_nearest_stops(
+                lat=start_lat, lon=start_lon, max_count=max_count
+            ),
+            self.transport_service.find_nearest_stops(
+                lat=end_lat, lon=end_lon, max_count=max_count
+            ),
+        )
+        return initial_stops, end_stops
+
+    async def plan(
+        self, start_lat: float, start_lon: float, end_lat: float, end_lon: float
+    ) -> RankedRoutes:
+        """
+        Выбирает маршруты между двумя точками.
+
+        Args:
+            start_lat: Широта начальной точки
+            start_lon: Долгота начальной точки
+            end_lat: Широта конечной точки
+            end_lon: Долгота конечной точки
+
+        Returns:
+            Самый быстрый, наименее загруженный и сбалансированный маршруты
+        """
+        # Находим остановки в радиусе от начальной и конечной точек параллельно
+        with stage("stop_lookup"):
+            initial_stops, end_stops = await self.find_stops(
+                start_lat, start_lon, end_lat, end_lon
+            )
+        logger.info(
+            "Найдено {} остановок общественного транспорта у начальной точки",
+            len(initial_stops),
+        )
+        logger.info(
+            "Найдено {} остановок общественного транспорта у конечной точки",
+            len(end_stops),
+        )
+
+        # Проверяем, что найдены остановки как у начальной, так и у конечной точки
+        if not initial_stops or not end_stops:
+            logger.warning("Не найдены остановки у начальной или конечной точки")
+            return RankedRoutes()
+
+        # Строим маршруты для пар остановок, отобранных планировщиком запросов,
+        # или для всех пар одновременно
+        with stage("route_fanout"):
+            if self.query_planner is not None:
+                routes_iter = self.query_planner.iter_routes(
+                    (start_lat, start_lon), (end_lat, end_lon), initial_stops, end_stops
+                )
+                all_routes = [route async for route, _ in routes_iter]
+            else:
+                all_routes = await self.transport_service.build_routes_between_stops(
+                    initial_stops, end_stops
+                )
+        return await self._rank(all_routes)
+
+    async def plan_progressive(
+        self,
+        start_lat: float,
+        start_lon: float,
+        end_lat: float,
+        end_lon: float,
+        initial_stops: List[Dict[str, Any]],
+        end_stops: List[Dict[str, Any]],
+    ) -> AsyncIterator[PlanProgress]:
+        """
+        Выбирает маршруты между двумя точками, отдавая промежуточные результаты.
+
+        Остановки находятся заранее (find_stops): ошибку каталога остановок
+        клиент должен получить кодом ответа, а не оборванным потоком.
+        Каждый построенный маршрут сразу дополняется загруженностью, после
+        чего ранжирование повторяется по всем уже полученным маршрутам.
+        Промежуточный результат отдается, только если изменился выбор
+        хотя бы одного из маршрутов.
+
+        Args:
+            start_lat: Широта начальной точки
+            start_lon: Долгота начальной точки
+            end_lat: Широта конечной точки
+            end_lon: Долгота конечной точки
+            initial_stops: Остановки у начальной точки
+            end_stops: Остановки у конечной точки
+
+        Yields:
+            Промежуточные результаты и последним - окончательный
+        """
+        if not initial_stops or not end_stops:
+            logger.warning("Не найдены остановки у начальной или конечной точки")
+            yield PlanProgress(RankedRoutes(), final=True)
+            return
+
+        ranker = RouteRanker()
+        routes: List[Dict[str, Any]] = []
+        ranked = RankedRoutes()
+        built = 0
+        total = 0
+        if self.query_planner is not None:
+            routes_iter = self.query_planner.iter_routes(
+                (start_lat, start_lon), (end_lat, end_lon), initial_stops, end_stops
+            )
+        else:
+            routes_iter = self.transport_service.iter_routes_between_stops(
+                initial_stops, end_stops
+            )
+        async for route, total in routes_iter:
+            built += 1
+            routes.extend(
+                await self.transport_workload_service.set_routes_workload([route])
+            )
+            if not routes:
+                continue
+
+            updated = ranker.rank(routes)
+            if any(
+                getattr(updated, name) is not getattr(ranked, name)
+                for name in ("fastest", "least_crowded", "balanced")
+            ):
+                ranked = updated
+                yield PlanProgress(ranked, built, total)
+
+        logger.info("Всего построено {} маршрутов", built)
+        yield PlanProgress(ranked, built, total, final=True)
+
+    async def plan_batch(self, trips: Sequence[Trip]) -> List[RankedRoutes]:
+        """
+        Выбирает маршруты для пакета пар точек.
+
+        Поиск остановок у каждой уникальной точки и построение маршрута между
+        каждой уникальной парой остановок выполняются один раз на пакет
+        (с локальным движком RAPTOR - построение маршрутов между всеми
+        остановками пары точек одним проходом). Загруженность маршрута общей
+        пары остановок тоже рассчитывается один раз, и пары точек получают
+        один и тот же маршрут.
+        Одновременных запросов к 2GIS не больше ROUTE_BATCH_CONCURRENCY;
+        по истечении ROUTE_BATCH_TIMEOUT недостроенные маршруты отменяются.
+
+        Args:
+            trips: Пары точек (широта, долгота начала, широта, долгота конца)
+
+        Returns:
+            Результаты ранжирования в порядке пар
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_timeout
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+        stop_tasks: Dict[Hashable, asyncio.Task] = {}
+        route_tasks: Dict[Hashable, asyncio.Task] = {}
+        # Маршруты с загруженностью по id общего маршрута задачи построения:
+        # пары точек с общей парой остановок получают один и тот же маршрут
+        annotated: Dict[int, Dict[str, Any]] = {}
+
+        def shared(
+            tasks: Dict[Hashable, asyncio.Task],
+            key: Hashable,
+            call: Callable[[], Awaitable[Any]],
+        ) -> asyncio.Task:
+            """Возвращает задачу для ключа, создавая ее при первом обращении."""
+            task = tasks.get(key)
+            if task is None:
+
+                async def run():
+                    async with semaphore:
+                        return await call()
+
+                task = tasks[key] = asyncio.create_task(run())
+            return task
+
+        def find_stops(lat: float, lon: float) -> asyncio.Task:
+            return shared(
+                stop_tasks,
+                (round(lat, 6), round(lon, 6)),
+                lambda: self.transport_service.find_nearest_stops(lat=lat, lon=lon),
+            )
+
+        def build_route(pair: Trip) -> asyncio.Task:
+            return shared(
+                route_tasks,
+                tuple(round(value, 6) for value in pair),
+                lambda: self.transport_service.build_public_transport_route(*pair),
+            )
+
+        def build_local_routes(
+            initial_stops: List[Dict[str, Any]], end_stops: List[Dict[str, Any]]
+        ) -> asyncio.Task:
+            service = self.transport_service
+            key = (
+                tuple(service.stop_points(initial_stops)),
+                tuple(service.stop_points(end_stops)),
+            )
+            return shared(
+                route_tasks,
+                key,
+                lambda: service.build_routes_between_stops(initial_stops, end_stops),
+            )
+
+        async def rank_shared(routes: List[Dict[str, Any]]) -> RankedRoutes:
+            """Ранжирует общие маршруты, дополняя загруженностью только новые."""
+            logger.info("Всего построено {} маршрутов", len(routes))
+            if not routes:
+                logger.warning("Не найдены маршруты")
+                return RankedRoutes()
+            # Маршрут задачи общий для пар точек, поэтому дополняется копия
+            fresh = {
+                id(route): dict(route) for route in routes if id(route) not in annotated
+            }
+            if fresh:
+                with stage("workload"):
+                    await self.transport_workload_service.set_routes_workload(
+                        list(fresh.values())
+                    )
+                for key, route in fresh.items():
+                    annotated.setdefault(key, route)
+            return self._select(
+                [
+                    annotated[id(route)]
+                    for route in routes
+                    if not route.get("pedestrian", False)
+                ]
+            )
+
+        async def plan_trip(trip: Trip) -> RankedRoutes:
+            start_lat, start_lon, end_lat, end_lon = trip
+            lookups = [find_stops(start_lat, start_lon), find_stops(end_lat, end_lon)]
+            done, _ = await asyncio.wait(
+                lookups, timeout=max(deadline - loop.time(), 0)
+            )
+            if len(done) < len(lookups):
+                return RankedRoutes()
+            try:
+                initial_stops, end_stops = [task.result() for task in lookups]
+            except Exception as e:
+                logger.error("Ошибка при поиске остановок: {}", e)
+                return RankedRoutes()
+            if not initial_stops or not end_stops:
+                return RankedRoutes()
+
+            if self.transport_service.raptor_engine is not None:
+                # Локальный движок строит маршруты для всех пар остановок
+                # одним проходом - одна задача на пару точек
+                task = build_local_routes(initial_stops, end_stops)
+                done, _ = await asyncio.wait(
+                    [task], timeout=max(deadline - loop.time(), 0)
+                )
+                if not done:
+                    return RankedRoutes()
+                try:
+                    routes = task.result()
+                except Exception as e:
+                    logger.error("Ошибка при построении маршрутов RAPTOR: {}", e)
+                    return RankedRoutes()
+                return await rank_shared(routes)
+
+            pairs = self.transport_service.candidate_pairs(initial_stops, end_stops)
+            tasks = [build_route(pair) for pair in pairs]
+            if not tasks:
+                return RankedRoutes()
+
+            # Задачи общие для нескольких пар точек, поэтому здесь их не отменяем
+            done, _ = await asyncio.wait(tasks, timeout=max(deadline - loop.time(), 0))
+            routes = [task.result() for task in tasks if task in done and task.result()]
+            return await rank_shared(routes)
+
+        try:
+            results = await asyncio.gather(*(plan_trip(trip) for trip in trips))
+        finally:
+            pending = [
+                task
+                for task in (*stop_tasks.values(), *route_tasks.values())
+                if not task.done()
+            ]
+            for task in pending:
+                task.cancel()
+
+        if pending:
+            logger.warning(
+                "Не успели построиться {} из {} запросов пакета за {} с",
+                len(pending),
+                len(stop_tasks) + len(route_tasks),
+                self.batch_timeout,
+            )
+        logger.info(
+            "Пакет из {} пар точек: {} поисков остановок, {} построений маршрутов",
+            len(trips),
+            len(stop_tasks),
+            len(route_tasks),
+        )
+        return results
+
+    async def _rank(self, all_routes: List[Dict[str, Any]]) -> RankedRoutes:
+        """
+        Рассчитывает загруженность маршрутов и ранжирует их.
+
+        Args:
+            all_routes: Построенные маршруты
+
+        Returns:
+            Самый быстрый, наименее загруженный и сбалансированный маршруты
+        """
+        logger.info("Всего построено {} маршрутов", len(all_routes))
+        if len(all_routes) == 0:
+            logger.warning("Не найдены маршруты")
+            return RankedRoutes()
+
+        with stage("workload"):
+            all_routes_with_workload = (
+                await self.transport_workload_service.set_routes_workload(all_routes)
+            )
+
+        return self._select(all_routes_with_workload)
+
+    def _select(self, routes_with_workload: List[Dict[str, Any]]) -> RankedRoutes:
+        """
+        Ранжирует маршруты с рассчитанной загруженностью.
+
+        Args:
+            routes_with_workload: Маршруты с загруженностью
+
+        Returns:
+            Самый быстрый, наименее загруженный и сбалансированный маршруты
+        """
+        # Если маршрутов нет после расчета загруженности
+        if not routes_with_workload:
+            return RankedRoutes()
+
+        # Выбираем самый быстрый, наименее загруженный и сбалансированный
+        # маршруты за один проход
+        with stage("ranking"):
+            return RouteRanker().rank(routes_with_workload)
@@ -0,0 +1,264 @@
+"""
+Ранжирование маршрутов по нескольким критериям.
+
+Все критерии минимизируются. Для двух критериев фронт Парето строится
+сортировкой и одним проходом, для большего числа критериев используется
+эффективная недоминируемая сортировка (ENS-SS).
+"""
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from apiserver.config.settings import settings
+
+
+def walking_distance(route: Dict[str, Any]) -> float:
+    """Суммарная длина пеших участков маршрута в метрах."""
+    return float(
+        sum(
+            movement.get("distance", 0)
+            for movement in route.get("movements", [])
+            if movement.get("type") == "walkway"
+        )
+    )
+
+
+# Критерии ранжирования: имя -> функция получения значения из маршрута
+OBJECTIVES: Dict[str, Callable[[Dict[str, Any]], float]] = {
+    "total_duration": lambda route: route.get("total_duration", float("inf")),
+    "workload": lambda route: route.get("workload", float("inf")),
+    "transfer_count": lambda route: route.get("transfer_count", 0),
+    "walking_distance": walking_distance,
+}
+
+
+def objectives_matrix(
+    routes: Sequence[Dict[str, Any]], objectives: Sequence[str]
+) -> np.ndarray:
+    """
+    Собирает значения критериев маршрутов в матрицу.
+
+    Args:
+        routes: Маршруты
+        objectives: Имена критериев из OBJECTIVES
+
+    Returns:
+        Матрица размера (количество маршрутов, количество критериев)
+    """
+    return np.array(
+        [[OBJECTIVES[name](route) for name in objectives] for route in routes],
+        dtype=np.float64,
+    ).reshape(len(routes), len(objectives))
+
+
+def pareto_front_2d(values: np.ndarray) -> np.ndarray:
+    """
+    Находит фронт Парето для двух критериев за O(n log n).
+
+    Точки сортируются по первому критерию, затем по второму. Точка входит
+    во фронт, если ее второй критерий строго меньше, чем у всех точек
+    с меньшим первым критерием, и минимален среди точек с тем же первым.
+
+    Args:
+        values: Матрица значений размера (n, 2)
+
+    Returns:
+        Индексы недоминируемых точек в порядке возрастания первого критерия
+    """
+    order = np.lexsort((values[:, 1], values[:, 0]))
+    front = []
+    best_y = np.inf
+    i = 0
+    while i < len(order):
+        x, y = values[order[i]]
+        # Группа точек с одинаковым первым критерием
+        j = i
+        while j < len(order) and values[order[j], 0] == x:
+            j += 1
+        if y < best_y:
+            front.extend(int(order[m]) for m in range(i, j) if values[order[m], 1] == y)
+            best_y = y
+        i = j
+    return np.array(front, dtype=np.int64)
+
+
+def non_dominated_sort(values: np.ndarray) -> np.ndarray:
+    """
+    Разбивает точки на фронты недоминирования (ENS-SS).
+
+    После лексикографической сортировки точку могут доминировать только
+    предшествующие ей, поэтому она сравнивается лишь с точками уже
+    построенных фронтов, по порядку, до первого фронта без доминирующих.
+
+    Args:
+        values: Матрица значений размера (n, k)
+
+    Returns:
+        Номер фронта для каждой точки (0 - фронт Парето)
+    """
+    ranks = np.full(len(values), -1, dtype=np.int64)
+    # Значения точек каждого фронта хранятся подряд в массивах с запасом
+    # (удваиваются при заполнении), чтобы проверка не копировала данные
+    fronts: List[np.ndarray] = []
+    sizes: List[int] = []
+
+    for index in np.lexsort(values.T[::-1]):
+        point = values[index]
+        for rank, front_values in enumerate(fronts):
+            members = front_values[: sizes[rank]]
+            dominated = np.any(
+                np.all(members <= point, axis=1) & np.any(members < point, axis=1)
+            )
+            if not dominated:
+                if sizes[rank] == len(front_values):
+                    front_values = np.concatenate([front_values, front_values])
+                    fronts[rank] = front_values
+                front_values[sizes[rank]] = point
+                sizes[rank] += 1
+                ranks[index] = rank
+                break
+        else:
+            front_values = np.empty((16, values.shape[1]), dtype=values.dtype)
+            front_values[0] = point
+            fronts.append(front_values)
+            sizes.append(1)
+            ranks[index] = len(fronts) - 1
+
+    return ranks
+
+
+def pareto_front(values: np.ndarray) -> np.ndarray:
+    """
+    Находит индексы недоминируемых точек для любого числа критериев.
+
+    Args:
+        values: Матрица значений размера (n, k)
+
+    Returns:
+        Индексы точек фронта Парето
+    """
+    if not len(values):
+        return np.empty(0, dtype=np.int64)
+    if values.shape[1] == 2:
+        return pareto_front_2d(values)
+    return np.flatnonzero(non_dominated_sort(values) == 0)
+
+
+def _normalize(values: np.ndarray) -> np.ndarray:
+    """Приводит каждый критерий к отрезку [0, 1]."""
+    low = values.min(axis=0)
+    span = values.max(axis=0) - low
+    return (values - low) / np.where(span > 0, span, 1)
+
+
+def knee_point(values: np.ndarray, weights: Optional[np.ndarray] = None) -> int:
+    """
+    Выбирает точку перегиба фронта Парето.
+
+    Для двух критериев это точка, наиболее удаленная от прямой через
+    крайние точки фронта. Для большего числа критериев - точка,
+    ближайшая к идеальной в нормированном пространстве.
+
+    Args:
+        values: Значения критериев точек фронта, матрица (n, k)
+        weights: Веса критериев при расчете расстояния до идеальной точки
+
+    Returns:
+        Индекс выбранной точки в values
+    """
+    normalized = _normalize(values)
+    if weights is None:
+        weights = np.ones(values.shape[1])
+
+    if values.shape[1] == 2 and len(values) > 2:
+        first = normalized[np.argmin(normalized[:, 0])]
+        last = normalized[np.argmax(normalized[:, 0])]
+        direction = last - first
+        norm = np.linalg.norm(direction)
+        if norm > 0:
+            offsets = normalized - first
+            distances = np.abs(
+                direction[0] * offsets[:, 1] - direction[1] * offsets[:, 0]
+            )
+            return int(np.argmax(distances / norm))
+
+    return int(np.argmin(np.sqrt(((normalized**2) * weights).sum(axis=1))))
+
+
+def weighted_choice(values: np.ndarray, weights: np.ndarray) -> int:
+    """
+    Выбирает точку с минимальной взвешенной суммой нормированных критериев.
+
+    Args:
+        values: Значения критериев, матрица (n, k)
+        weights: Веса критериев
+
+    Returns:
+        Индекс выбранной точки в values
+    """
+    return int(np.argmin(_normalize(values) @ weights))
+
+
+@dataclass
+class RankedRoutes:
+    """Результат ранжирования маршрутов."""
+
+    fastest: Optional[Dict[str, Any]] = None
+    least_crowded: Optional[Dict[str, Any]] = None
+    balanced: Optional[Dict[str, Any]] = None
+    pareto: List[Dict[str, Any]] = field(default_factory=list)
+
+
+class RouteRanker:
+    """
+    Выбирает самый быстрый, наименее загруженный и сбалансированный
+    маршруты за один проход по матрице критериев.
+    """
+
+    def __init__(self):
+        """Инициализация по настройкам RANKING_*."""
+        self.objectives: List[str] = list(
+            settings.get(
+                "RANKING_OBJECTIVES",
+                ["total_duration", "workload", "transfer_count", "walking_distance"],
+            )
+        )
+        self.method = settings.get("RANKING_BALANCED_METHOD", "knee")
+        configured_weights = settings.get("RANKING_WEIGHTS", {})
+        self.weights = np.array(
+            [float(configured_weights.get(name, 1.0)) for name in self.objectives]
+        )
+
+    def rank(self, routes: Sequence[Dict[str, Any]]) -> RankedRoutes:
+        """
+        Ранжирует маршруты.
+
+        Args:
+            routes: Маршруты с рассчитанной загруженностью
+
+        Returns:
+            Самый быстрый, наименее загруженный, сбалансированный маршруты
+            и фронт Парето
+        """
+        if not routes:
+            return RankedRoutes()
+
+        primary = objectives_matrix(routes, ["total_duration", "workload"])
+        # При равенстве основного критерия выбираем лучший по второму
+        fastest = int(np.lexsort((primary[:, 1], primary[:, 0]))[0])
+        least_crowded = int(np.lexsort((primary[:, 0], primary[:, 1]))[0])
+
+        values = objectives_matrix(routes, self.objectives)
+        front = pareto_front(values)
+        if self.method == "weighted":
+            balanced = front[weighted_choice(values[front], self.weights)]
+        else:
+            balanced = front[knee_point(values[front], self.weights)]
+
+        return RankedRoutes(
+            fastest=routes[fastest],
+            least_crowded=routes[least_crowded],
+            balanced=routes[int(balanced)],
+            pareto=[routes[i] for i in front],
+        )
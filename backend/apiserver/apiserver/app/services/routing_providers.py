@@ -0,0 +1,551 @@
+"""
+Провайдеры построения маршрутов общественного транспорта.
+
+Адаптеры Яндекс Карт и Google Maps приводят ответы к одной схеме -
+подмножеству маршрута 2GIS, с которым работают расчет загруженности,
+ранжирование и компактные ответы; ответ 2GIS передается как есть:
+
+    {
+        "id", "provider", "total_duration", "total_distance",
+        "transfer_count", "pedestrian",
+        "movements": [{
+            "id", "type" ("walkway" или "passage"), "distance",
+            "moving_duration", "waiting_duration",
+            "waypoint": {"name", "subtype", "routes_names"},
+            "alternatives": [{"geometry": [{"selection": WKT}]}],
+        }],
+    }
+
+Поле waypoint.routes_names (названия маршрутов транспорта участка) есть
+только в приведенных ответах: в схеме 2GIS (MovementWaypoint) его нет,
+названия там - в movements[].routes[].names.
+
+Маршрутизатор с хеджированием отправляет запрос основному провайдеру и,
+если тот не ответил за наблюдаемый квантиль своей задержки, параллельно
+запрашивает резервного; побеждает первый корректный ответ.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+import numpy as np
+from loguru import logger
+
+from apiserver.app.services.metrics import ROUTING_HEDGED, ROUTING_WINS
+from apiserver.app.services.resilience import UpstreamUnavailable
+from apiserver.config.settings import settings
+
+# Виды транспорта, запрашиваемые у 2GIS
+TWO_GIS_TRANSPORT = [
+    "pedestrian",
+    "metro",
+    "light_metro",
+    "suburban_train",
+    "aeroexpress",
+    "tram",
+    "bus",
+    "trolleybus",
+    "shuttle_bus",
+    "monorail",
+    "funicular_railway",
+    "river_transport",
+    "cable_car",
+    "light_rail",
+    "premetro",
+    "mcc",
+    "mcd",
+]
+
+
+def linestring(points: Sequence[Tuple[float, float]]) -> str:
+    """
+    Формирует геометрию WKT, как в ответах 2GIS.
+
+    Args:
+        points: Точки (широта, долгота)
+    """
+    return (
+        "LINESTRING(" + ", ".join(f"{lon:.6f} {lat:.6f}" for lat, lon in points) + ")"
+    )
+
+
+def decode_polyline(encoded: str) -> List[Tuple[float, float]]:
+    """
+    Декодирует ломаную в формате Google Encoded Polyline.
+
+    Returns:
+        Точки (широта, долгота)
+    """
+    points = []
+    index = lat = lon = 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        points.append((lat / 1e5, lon / 1e5))
+    return points
+
+
+def is_valid_route(route: Any) -> bool:
+    """Проверяет, что маршрут соответствует общей схеме провайдеров."""
+    return (
+        isinstance(route, dict)
+        and isinstance(route.get("total_duration"), (int, float))
+        and isinstance(route.get("movements"), list)
+    )
+
+
+class LatencyTracker:
+    """
+    Скользящее окно задержек провайдера для оценки квантилей.
+
+    Запросы, отмененные до ответа (проигравшие гонку при хеджировании или
+    не уложившиеся в срок) или завершившиеся без маршрута, сохраняются
+    как цензурированные наблюдения: их задержка не меньше прошедшего
+    времени. Без них оценка смещалась бы вниз, ведь отменяются как раз
+    самые медленные запросы, а отказы провайдера быстрее ответов. Квантиль
+    оценивается по функции выживания Каплана - Мейера.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        """
+        Args:
+            window: Количество последних наблюдений
+            min_samples: Минимум наблюдений для оценки квантиля
+        """
+        self.samples: Deque[Tuple[float, bool]] = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def observe(self, seconds: float, censored: bool = False) -> None:
+        """
+        Args:
+            seconds: Задержка ответа или время до отмены запроса
+            censored: Запрос отменен или завершился без маршрута, и задержка
+                ответа не меньше seconds
+        """
+        self.samples.append((seconds, censored))
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Возвращает квантиль задержки или None, если наблюдений мало."""
+        if len(self.samples) < self.min_samples:
+            return None
+        samples = np.array(self.samples, dtype=np.float64)
+        # При равной задержке ответы учитываются раньше отмен
+        order = np.lexsort((samples[:, 1], samples[:, 0]))
+        seconds = samples[order, 0]
+        censored = samples[order, 1].astype(bool)
+        at_risk = len(seconds) - np.arange(len(seconds))
+        survival = np.cumprod(np.where(censored, 1.0, 1.0 - 1.0 / at_risk))
+        reached = np.flatnonzero(1.0 - survival >= q - 1e-9)
+        # Квантиль не достигнут из-за отмен - известна только нижняя граница
+        return float(seconds[reached[0]] if len(reached) else seconds[-1])
+
+
+class RoutingProvider:
+    """Базовый провайдер: измеряет задержку и проверяет схему ответа."""
+
+    name = ""
+
+    def __init__(self, http_client: httpx.AsyncClient):
+        self.http_client = http_client
+        self.latency = LatencyTracker()
+
+    async def build_route(
+        self, start_lat: float, start_lon: float, end_lat: float, end_lon: float
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Строит маршрут между двумя точками.
+
+        Returns:
+            Маршрут в общей схеме или None в случае ошибки
+        """
+        start = time.perf_counter()
+        try:
+            route = await self._request(start_lat, start_lon, end_lat, end_lon)
+        except asyncio.CancelledError:
+            self.latency.observe(time.perf_counter() - start, censored=True)
+            raise
+        except UpstreamUnavailable as e:
+            # Выключатель уже сообщил о сбое, не дублируем ошибку на каждый запрос
+            logger.debug("Провайдер {} недоступен: {}", self.name, e)
+            route = None
+        except Exception as e:
+            logger.error("Ошибка при построении маршрута ({}): {}", self.name, e)
+            route = None
+        elapsed = time.perf_counter() - start
+
+        if route is not None and not is_valid_route(route):
+            logger.error("Некорректный маршрут от провайдера {}", self.name)
+            route = None
+        # Быстрый отказ (открытый выключатель, ошибка) не говорит о задержке
+        # ответа - только о том, что она не меньше прошедшего времени
+        self.latency.observe(elapsed, censored=route is None)
+        if route is None:
+            return None
+        route["provider"] = self.name
+        return route
+
+    async def _request(
+        self, start_lat: float, start_lon: float, end_lat: float, end_lon: float
+    ) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def _log_error(self, response: httpx.Response) -> None:
+        logger.error(
+            "Ошибка при построении маршрута ({}): {} {:.500}",
+            self.name,
+            response.status_code,
+            response.text,
+        )
+
+
+class TwoGisRoutingProvider(RoutingProvider):
+    """Public Transport API 2GIS (external/2gis/docs/PublicTransportAPI.json)."""
+
+    name = "2gis"
+
+    def __init__(self, http_client: httpx.AsyncClient):
+        super().__init__(http_client)
+        self.api_key = settings.get("GIS_API_KEY")
+        self.url = settings.get(
+            "TWO_GIS_ROUTING_URL", "https://routing.api.2gis.com/public_transport/2.0"
+        )
+        self.enable_schedule = settings.get("ROUTE_ENABLE_SCHEDULE", True)
+
+    async def _request(self, start_lat, start_lon, end_lat, end_lon):
+        payload = {
+            "max_result_count": 1,
+            "source": {"point": {"lat": start_lat, "lon": start_lon, "type": "stop"}},
+            "target": {"point": {"lat": end_lat, "lon": end_lon, "type": "stop"}},
+            "enable_schedule": self.enable_schedule,
+            "transport": TWO_GIS_TRANSPORT,
+            "locale": "ru_RU",
+        }
+        response = await self.http_client.post(
+            self.url, params={"key": self.api_key}, json=payload
+        )
+        if response.status_code != 200:
+            self._log_error(response)
+            return None
+        routes = response.json()
+        # Ответ 2GIS - исходная схема, остальные провайдеры приводятся к ней
+        return routes[0] if routes else None
+
+
+class YandexRoutingProvider(RoutingProvider):
+    """
+    Router API Яндекса (режим transit).
+
+    Используются поля ответа route.legs[].steps[]: mode (walking/transit),
+    duration, waiting_duration, length, polyline.points и transit.lines[].name,
+    transit.from_stop.name.
+    """
+
+    name = "yandex"
+
+    def __init__(self, http_client: httpx.AsyncClient):
+        super().__init__(http_client)
+        self.api_key = settings.get("YANDEX_ROUTING_API_KEY")
+        self.url = settings.get(
+            "YANDEX_ROUTING_URL", "https://api.routing.yandex.net/v2/route"
+        )
+
+    async def _request(self, start_lat, start_lon, end_lat, end_lon):
+        params = {
+            "apikey": self.api_key,
+            "waypoints": f"{start_lat},{start_lon}|{end_lat},{end_lon}",
+            "mode": "transit",
+        }
+        response = await self.http_client.get(self.url, params=params)
+        if response.status_code != 200:
+            self._log_error(response)
+            return None
+        legs = response.json().get("route", {}).get("legs", [])
+        if not legs or any(leg.get("status") != "OK" for leg in legs):
+            return None
+
+        movements = []
+        for leg in legs:
+            for step in leg.get("steps", []):
+                transit = step.get("transit") or {}
+                passage = step.get("mode") == "transit"
+                movements.append(
+                    {
+                        "id": str(len(movements)),
+                        "type": "passage" if passage else "walkway",
+                        "distance": step.get("length", 0),
+                        "moving_duration": step.get("duration", 0),
+                        "waiting_duration": step.get("waiting_duration", 0),
+                        "waypoint": {
+                            "name": (transit.get("from_stop") or {}).get("name", ""),
+                            "subtype": "passage" if passage else "pedestrian",
+                            "routes_names": [
+                                line.get("name", "")
+                                for line in transit.get("lines", [])
+                            ],
+                        },
+                        "alternatives": [
+                            {
+                                "geometry": [
+                                    {
+                                        "selection": linestring(
+                                            step.get("polyline", {}).get("points", [])
+                                        )
+                                    }
+                                ]
+                            }
+                        ],
+                    }
+                )
+        return normalized_route(movements)
+
+
+class GoogleRoutingProvider(RoutingProvider):
+    """
+    Directions API Google Maps (mode=transit).
+
+    Используются поля ответа routes[0].legs[].steps[]: travel_mode,
+    duration.value, distance.value, polyline.points и transit_details
+    (departure_stop.name, departure_time.value, line.short_name или line.name).
+    """
+
+    name = "google"
+
+    def __init__(self, http_client: httpx.AsyncClient):
+        super().__init__(http_client)
+        self.api_key = settings.get("GOOGLE_MAPS_API_KEY")
+        self.url = settings.get(
+            "GOOGLE_DIRECTIONS_URL",
+            "https://maps.googleapis.com/maps/api/directions/json",
+        )
+
+    async def _request(self, start_lat, start_lon, end_lat, end_lon):
+        params = {
+            "key": self.api_key,
+            "origin": f"{start_lat},{start_lon}",
+            "destination": f"{end_lat},{end_lon}",
+            "mode": "transit",
+            "language": "ru",
+        }
+        response = await self.http_client.get(self.url, params=params)
+        if response.status_code != 200:
+            self._log_error(response)
+            return None
+        data = response.json()
+        if data.get("status") != "OK" or not data.get("routes"):
+            return None
+
+        movements = []
+        total_duration = 0
+        for leg in data["routes"][0].get("legs", []):
+            # Время ожидания - разница между отправлением транспорта и моментом,
+            # когда пассажир оказывается на остановке
+            clock = (leg.get("departure_time") or {}).get("value")
+            leg_duration = leg.get("duration", {}).get("value", 0)
+            if leg.get("arrival_time") and clock is not None:
+                leg_duration = leg["arrival_time"]["value"] - clock
+            total_duration += leg_duration
+
+            for step in leg.get("steps", []):
+                details = step.get("transit_details") or {}
+                passage = step.get("travel_mode") == "TRANSIT"
+                duration = step.get("duration", {}).get("value", 0)
+                waiting = 0
+                departure = (details.get("departure_time") or {}).get("value")
+                if passage and clock is not None and departure is not None:
+                    waiting = max(departure - clock, 0)
+                if clock is not None:
+                    clock += waiting + duration
+
+                line = details.get("line") or {}
+                movements.append(
+                    {
+                        "id": str(len(movements)),
+                        "type": "passage" if passage else "walkway",
+                        "distance": step.get("distance", {}).get("value", 0),
+                        "moving_duration": duration,
+                        "waiting_duration": waiting,
+                        "waypoint": {
+                            "name": (details.get("departure_stop") or {}).get(
+                                "name", ""
+                            ),
+                            "subtype": "passage" if passage else "pedestrian",
+                            "routes_names": [
+                                line.get("short_name") or line.get("name", "")
+                            ]
+                            if line
+                            else [],
+                        },
+                        "alternatives": [
+                            {
+                                "geometry": [
+                                    {
+                                        "selection": linestring(
+                                            decode_polyline(
+                                                step.get("polyline", {}).get(
+                                                    "points", ""
+                                                )
+                                            )
+                                        )
+                                    }
+                                ]
+                            }
+                        ],
+                    }
+                )
+        return normalized_route(movements, total_duration)
+
+
+def normalized_route(
+    movements: List[Dict[str, Any]], total_duration: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Собирает маршрут в общей схеме из участков.
+
+    Args:
+        movements: Участки маршрута в общей схеме
+        total_duration: Длительность маршрута (по умолчанию - сумма участков)
+    """
+    passages = sum(movement["type"] == "passage" for movement in movements)
+    if total_duration is None:
+        total_duration = sum(
+            movement["moving_duration"] + movement["waiting_duration"]
+            for movement in movements
+        )
+    return {
+        "id": "1",
+        "total_duration": total_duration,
+        "total_distance": sum(movement["distance"] for movement in movements),
+        "transfer_count": max(passages - 1, 0),
+        "pedestrian": passages == 0,
+        "movements": movements,
+    }
+
+
+PROVIDERS = {
+    provider.name: provider
+    for provider in (
+        TwoGisRoutingProvider,
+        YandexRoutingProvider,
+        GoogleRoutingProvider,
+    )
+}
+
+
+class HedgedRouter:
+    """
+    Строит маршрут у провайдеров в порядке приоритета.
+
+    Без хеджирования следующий провайдер запрашивается только после ошибки
+    предыдущего. С хеджированием резервный провайдер запускается, если
+    текущий не ответил за квантиль своей задержки; побеждает первый
+    корректный ответ, остальные запросы отменяются.
+    """
+
+    def __init__(
+        self,
+        providers: Sequence[RoutingProvider],
+        hedge: bool = False,
+        quantile: float = 0.9,
+        default_delay: float = 1.0,
+        min_delay: float = 0.05,
+    ):
+        """
+        Args:
+            providers: Провайдеры в порядке приоритета
+            hedge: Включить хеджирование
+            quantile: Квантиль задержки, после которого запускается резервный
+            default_delay: Задержка перед резервным запросом, пока
+                наблюдений мало (секунды)
+            min_delay: Нижняя граница задержки перед резервным запросом (секунды)
+        """
+        self.providers = list(providers)
+        self.hedge = hedge
+        self.quantile = quantile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+
+    def hedge_delay(self, provider: RoutingProvider) -> float:
+        """Время ожидания ответа провайдера до запуска резервного."""
+        observed = provider.latency.quantile(self.quantile)
+        return max(self.default_delay if observed is None else observed, self.min_delay)
+
+    async def build_route(
+        self, start_lat: float, start_lon: float, end_lat: float, end_lon: float
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Строит маршрут между двумя точками.
+
+        Returns:
+            Первый корректный маршрут или None, если ни один провайдер не ответил
+        """
+        waiting = list(self.providers)
+        running: Dict[asyncio.Task, RoutingProvider] = {}
+        last: Optional[RoutingProvider] = None
+
+        def launch() -> None:
+            nonlocal last
+            last = waiting.pop(0)
+            task = asyncio.ensure_future(
+                last.build_route(start_lat, start_lon, end_lat, end_lon)
+            )
+            running[task] = last
+
+        launch()
+        try:
+            while running:
+                timeout = self.hedge_delay(last) if self.hedge and waiting else None
+                done, _ = await asyncio.wait(
+                    running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Провайдер не уложился в свой квантиль - запускаем резервный
+                    ROUTING_HEDGED.inc(provider=last.name)
+                    launch()
+                    continue
+
+                for task in done:
+                    provider = running.pop(task)
+                    route = task.result()
+                    if route is not None:
+                        ROUTING_WINS.inc(provider=provider.name)
+                        return route
+                # Все запущенные запросы неудачны - сразу пробуем следующего
+                if not running and waiting:
+                    launch()
+            return None
+        finally:
+            for task in running:
+                task.cancel()
+
+
+def create_router(http_client: httpx.AsyncClient) -> HedgedRouter:
+    """
+    Создает маршрутизатор по настройкам приложения.
+
+    Args:
+        http_client: Общий HTTP-клиент приложения
+    """
+    names = settings.get("ROUTING_PROVIDERS", ["2gis"])
+    unknown = [name for name in names if name not in PROVIDERS]
+    if unknown:
+        raise ValueError(f"Неизвестные провайдеры маршрутов: {unknown}")
+    return HedgedRouter(
+        [PROVIDERS[name](http_client) for name in names],
+        hedge=settings.get("ROUTING_HEDGE", False),
+        quantile=settings.get("ROUTING_HEDGE_QUANTILE", 0.9),
+        default_delay=settings.get("ROUTING_HEDGE_DEFAULT_DELAY", 1.0),
+        min_delay=settings.get("ROUTING_HEDGE_MIN_DELAY", 0.05),
+    )
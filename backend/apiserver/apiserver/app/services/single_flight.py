@@ -0,0 +1,83 @@
+"""
+Объединение одинаковых одновременных запросов (single-flight).
+
+Пока запрос с некоторым ключом выполняется, остальные вызовы с тем же
+ключом не отправляют свой запрос, а ждут результата уже запущенного.
+Запрос отменяется, когда его перестают ждать все вызовы, поэтому
+отмененные по сроку вызовы не оставляют за собой запросов к провайдерам
+сверх ограничений на количество одновременных запросов.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Выполняет не больше одного запроса на ключ одновременно.
+
+    Ведет счетчики вызовов и объединенных вызовов.
+    """
+
+    def __init__(self):
+        """Инициализация без выполняющихся запросов."""
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        # Количество вызовов, ожидающих каждый запрос
+        self._waiters: Dict[asyncio.Task, int] = {}
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Возвращает результат запроса с ключом key.
+
+        Если запрос с этим ключом уже выполняется, ожидает его результата,
+        иначе запускает call(). Отмена одного из ожидающих не отменяет
+        общий запрос: он завершается для остальных. Когда отменены все
+        ожидающие, отменяется и запрос.
+
+        Args:
+            key: Нормализованный ключ запроса
+            call: Функция, запускающая запрос
+
+        Returns:
+            Результат запроса (общий для всех ожидающих; изменять его нельзя)
+        """
+        self.calls += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    # Следующий вызов с этим ключом запустит новый запрос,
+                    # а не будет ждать отменяемого
+                    if self._in_flight.get(key) is task:
+                        del self._in_flight[key]
+                    task.cancel()
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        """Удаляет завершенный запрос и забирает его исключение."""
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Если все ожидающие были отменены, исключение иначе не будет прочитано
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает счетчики вызовов и долю объединенных вызовов."""
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalescing_ratio": self.coalesced / self.calls if self.calls else 0.0,
+            "in_flight": len(self._in_flight),
+        }
@@ -0,0 +1,151 @@
+"""
+Кэш ответов каталога 2GIS по ячейкам geohash.
+
+Для каждой ячейки хранится список остановок-кандидатов вокруг ее центра
+с запасом на размер ячейки. Для конкретной точки кандидаты фильтруются
+заново, поэтому ответ совпадает с прямым запросом к каталогу.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from apiserver.app.services.cache import TTLCache
+from apiserver.app.services.geo import geohash_bounds, geohash_encode, haversine
+
+
+@dataclass(frozen=True)
+class StopCell:
+    """Остановки-кандидаты в круге заданного радиуса вокруг центра ячейки."""
+
+    center_lat: float
+    center_lon: float
+    radius: float
+    stops: List[Dict[str, Any]]
+    lat: np.ndarray
+    lon: np.ndarray
+
+    @classmethod
+    def create(
+        cls,
+        center_lat: float,
+        center_lon: float,
+        radius: float,
+        stops: List[Dict[str, Any]],
+    ) -> "StopCell":
+        """
+        Создает ячейку, отбрасывая остановки без координат.
+
+        Args:
+            center_lat: Широта центра ячейки
+            center_lon: Долгота центра ячейки
+            radius: Радиус вокруг центра, в котором найдены все остановки (метры)
+            stops: Остановки в формате элементов каталога 2GIS
+        """
+        stops = [
+            stop
+            for stop in stops
+            if stop.get("point", {}).get("lat") and stop.get("point", {}).get("lon")
+        ]
+        return cls(
+            center_lat=center_lat,
+            center_lon=center_lon,
+            radius=radius,
+            stops=stops,
+            lat=np.array([stop["point"]["lat"] for stop in stops], dtype=np.float64),
+            lon=np.array([stop["point"]["lon"] for stop in stops], dtype=np.float64),
+        )
+
+    def select(
+        self,
+        lat: float,
+        lon: float,
+        extra_radius: float,
+        max_radius: float,
+        max_count: int,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Находит ближайшую к точке остановку и все остановки в радиусе
+        (расстояние до ближайшей + extra_radius).
+
+        Args:
+            lat: Широта точки
+            lon: Долгота точки
+            extra_radius: Добавка к расстоянию до ближайшей остановки в метрах
+            max_radius: Максимальное расстояние до ближайшей остановки в метрах
+            max_count: Максимальное количество остановок в ответе
+
+        Returns:
+            Остановки, отсортированные по расстоянию, или None, если кандидатов
+            ячейки недостаточно для точного ответа в этой точке
+        """
+        offset = float(haversine(self.center_lat, self.center_lon, lat, lon))
+
+        if not self.stops:
+            return [] if max_radius + offset <= self.radius else None
+
+        distances = haversine(lat, lon, self.lat, self.lon)
+        nearest = float(distances.min())
+        if nearest > max_radius:
+            return [] if max_radius + offset <= self.radius else None
+
+        # Все остановки за пределами круга ячейки дальше от точки, чем
+        # self.radius - offset, поэтому кандидатов достаточно
+        radius = nearest + extra_radius
+        if radius + offset > self.radius:
+            return None
+
+        order = np.argsort(distances, kind="stable")
+        return [self.stops[i] for i in order[:max_count] if distances[i] <= radius]
+
+
+class StopCellCache:
+    """Кэш ячеек с остановками-кандидатами, ключ - geohash ячейки."""
+
+    def __init__(self, precision: int, maxsize: int, ttl: float, stale_ttl: float = 0):
+        """
+        Инициализация кэша.
+
+        Args:
+            precision: Длина geohash, задающая размер ячейки
+            maxsize: Максимальное количество ячеек в кэше
+            ttl: Время жизни ячейки в секундах
+            stale_ttl: Сколько секунд после истечения времени жизни ячейка
+                доступна через get_stale
+        """
+        self.precision = precision
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl, stale_ttl=stale_ttl)
+
+    def cell(self, lat: float, lon: float) -> Tuple[str, float, float, float]:
+        """
+        Определяет ячейку, в которую попадает точка.
+
+        Args:
+            lat: Широта точки
+            lon: Долгота точки
+
+        Returns:
+            Кортеж (geohash, широта центра, долгота центра, полудиагональ в метрах)
+        """
+        key = geohash_encode(lat, lon, self.precision)
+        lat_min, lat_max, lon_min, lon_max = geohash_bounds(key)
+        center_lat = (lat_min + lat_max) / 2
+        center_lon = (lon_min + lon_max) / 2
+        half_diagonal = float(
+            haversine(
+                center_lat, center_lon, np.array([lat_min, lat_max]), lon_max
+            ).max()
+        )
+        return key, center_lat, center_lon, half_diagonal
+
+    def get(self, key: str) -> Optional[StopCell]:
+        """Возвращает ячейку по geohash или None."""
+        return self.cache.get(key)
+
+    def get_stale(self, key: str) -> Optional[StopCell]:
+        """Возвращает ячейку по geohash, даже если время ее жизни истекло, или None."""
+        return self.cache.get_stale(key)
+
+    def set(self, key: str, cell: StopCell) -> None:
+        """Сохраняет ячейку."""
+        self.cache.set(key, cell)
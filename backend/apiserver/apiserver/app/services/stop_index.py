@@ -0,0 +1,243 @@
+"""
+Локальный пространственный индекс остановок общественного транспорта.
+
+Остановки загружаются из файла-снимка и раскладываются по сетке ячеек
+фиксированного размера в градусах. Поиск ближайших остановок выполняется
+без обращения к 2GIS.
+"""
+import asyncio
+import json
+import math
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from apiserver.app.services.geo import METERS_PER_DEGREE, haversine
+
+# Множитель для кодирования номера строки и столбца ячейки в одно число
+_CELL_KEY_BASE = 1 << 24
+
+
+def read_snapshot(path: str) -> List[Dict[str, Any]]:
+    """
+    Читает остановки из файла-снимка.
+
+    Args:
+        path: Путь к JSON-файлу со снимком остановок
+
+    Returns:
+        Остановки в формате элементов каталога 2GIS
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("result", {}).get("items", [])
+    return data
+
+
+@dataclass(frozen=True)
+class _StopGrid:
+    """Неизменяемое содержимое индекса, отсортированное по ключу ячейки."""
+
+    stops: List[Dict[str, Any]]
+    lat: np.ndarray
+    lon: np.ndarray
+    keys: np.ndarray
+
+
+class StopIndex:
+    """
+    Индекс остановок на сетке ячеек.
+
+    Файл-снимок содержит список остановок в формате элементов ответа
+    каталога 2GIS (поля ``id``, ``name``, ``point.lat``, ``point.lon``),
+    либо объект с этим списком в ``result.items``.
+    """
+
+    def __init__(self, cell_size: float = 0.01):
+        """
+        Инициализация индекса.
+
+        Args:
+            cell_size: Размер ячейки сетки в градусах
+        """
+        self.cell_size = cell_size
+        self._grid: Optional[_StopGrid] = None
+        self._snapshot_mtime: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._grid.stops) if self._grid else 0
+
+    def build(self, stops: List[Dict[str, Any]]) -> None:
+        """
+        Строит индекс по списку остановок.
+
+        Args:
+            stops: Остановки в формате элементов каталога 2GIS
+        """
+        stops = [
+            stop
+            for stop in stops
+            if stop.get("point", {}).get("lat") and stop.get("point", {}).get("lon")
+        ]
+        lat = np.array([stop["point"]["lat"] for stop in stops], dtype=np.float64)
+        lon = np.array([stop["point"]["lon"] for stop in stops], dtype=np.float64)
+        keys = self._cell_keys(self._cell(lat), self._cell(lon))
+
+        order = np.argsort(keys, kind="stable")
+        self._grid = _StopGrid(
+            stops=[stops[i] for i in order],
+            lat=lat[order],
+            lon=lon[order],
+            keys=keys[order],
+        )
+
+    def load_snapshot(self, path: str) -> None:
+        """
+        Загружает остановки из файла-снимка и перестраивает индекс.
+
+        Args:
+            path: Путь к JSON-файлу со снимком остановок
+        """
+        mtime = os.path.getmtime(path)
+        self.build(read_snapshot(path))
+        self._snapshot_mtime = mtime
+        logger.info("Загружено {} остановок из снимка {}", len(self), path)
+
+    async def refresh_periodically(self, path: str, interval: float) -> None:
+        """
+        Перечитывает снимок в фоне, если файл изменился.
+
+        Чтение и построение индекса выполняются в отдельном потоке,
+        готовый индекс подменяется целиком.
+
+        Args:
+            path: Путь к JSON-файлу со снимком остановок
+            interval: Период проверки файла в секундах
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if os.path.getmtime(path) != self._snapshot_mtime:
+                    await asyncio.to_thread(self.load_snapshot, path)
+            except (OSError, ValueError) as e:
+                logger.error("Не удалось обновить снимок остановок {}: {}", path, e)
+
+    def find_nearest_stop(
+        self, lat: float, lon: float, max_radius: float
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Находит ближайшую к точке остановку.
+
+        Args:
+            lat: Широта точки
+            lon: Долгота точки
+            max_radius: Максимальное расстояние поиска в метрах
+
+        Returns:
+            Ближайшая остановка или None, если в радиусе остановок нет
+        """
+        found = self._nearest(lat, lon, max_radius)
+        if found is None:
+            return None
+        return self._grid.stops[found[0]]
+
+    def find_nearest_stops(
+        self,
+        lat: float,
+        lon: float,
+        extra_radius: float,
+        max_radius: float,
+        max_count: int,
+    ) -> List[Dict[str, Any]]:
+        """
+        Находит ближайшую остановку, а затем все остановки в радиусе
+        (расстояние до ближайшей + extra_radius), отсортированные по расстоянию.
+
+        Args:
+            lat: Широта точки
+            lon: Долгота точки
+            extra_radius: Добавка к расстоянию до ближайшей остановки в метрах
+            max_radius: Максимальное расстояние до ближайшей остановки в метрах
+            max_count: Максимальное количество остановок в ответе
+
+        Returns:
+            Список остановок или пустой список, если в радиусе остановок нет
+        """
+        found = self._nearest(lat, lon, max_radius)
+        if found is None:
+            return []
+
+        radius = found[1] + extra_radius
+        indices = self._candidates(lat, lon, radius)
+        distances = haversine(
+            lat, lon, self._grid.lat[indices], self._grid.lon[indices]
+        )
+        within = distances <= radius
+        indices, distances = indices[within], distances[within]
+
+        order = np.argsort(distances, kind="stable")[:max_count]
+        return [self._grid.stops[i] for i in indices[order]]
+
+    def _nearest(self, lat: float, lon: float, max_radius: float):
+        """
+        Ищет ближайшую остановку, удваивая радиус поиска.
+
+        Returns:
+            Пара (позиция остановки в индексе, расстояние в метрах) или None
+        """
+        if not self._grid or not len(self._grid.stops):
+            return None
+
+        radius = min(self.cell_size * METERS_PER_DEGREE / 2, max_radius)
+        while True:
+            indices = self._candidates(lat, lon, radius)
+            if len(indices):
+                distances = haversine(
+                    lat, lon, self._grid.lat[indices], self._grid.lon[indices]
+                )
+                best = int(np.argmin(distances))
+                # Остановки дальше radius могли не попасть в выборку ячеек
+                if distances[best] <= radius:
+                    return int(indices[best]), float(distances[best])
+            if radius >= max_radius:
+                return None
+            radius = min(radius * 2, max_radius)
+
+    def _candidates(self, lat: float, lon: float, radius: float) -> np.ndarray:
+        """
+        Возвращает позиции остановок из ячеек, покрывающих круг заданного радиуса.
+        """
+        dlat = radius / METERS_PER_DEGREE
+        dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+
+        rows = np.arange(self._cell(lat - dlat), self._cell(lat + dlat) + 1)
+        col_min = self._cell(lon - dlon)
+        col_max = self._cell(lon + dlon)
+
+        # Ячейки одной строки идут в индексе подряд, поэтому на строку
+        # достаточно одного бинарного поиска
+        keys = self._grid.keys
+        starts = np.searchsorted(keys, self._cell_keys(rows, col_min), side="left")
+        ends = np.searchsorted(keys, self._cell_keys(rows, col_max), side="right")
+
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if not total:
+            return np.empty(0, dtype=np.int64)
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return offsets + np.arange(total)
+
+    def _cell(self, value):
+        """Номер ячейки сетки для координаты (числа или массива)."""
+        return np.floor(np.asarray(value) / self.cell_size).astype(np.int64)
+
+    @staticmethod
+    def _cell_keys(rows, cols) -> np.ndarray:
+        """Кодирует номера строки и столбца ячейки в сортируемый ключ."""
+        return (np.asarray(rows, dtype=np.int64) + _CELL_KEY_BASE // 2) * (
+            _CELL_KEY_BASE
+        ) + (np.asarray(cols, dtype=np.int64) + _CELL_KEY_BASE // 2)
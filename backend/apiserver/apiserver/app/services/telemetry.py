@@ -0,0 +1,140 @@
+"""
+Фоновый сбор телеметрии процесса для эндпоинта /status.
+
+Коллектор раз в интервал снимает загрузку CPU, память, задержку цикла
+событий и количество открытых соединений, не блокируя цикл событий.
+Каждый процесс uvicorn записывает свой снимок в общий каталог, поэтому
+/status любого процесса возвращает сводку по всем процессам.
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import psutil
+from loguru import logger
+
+from apiserver.app.services.metrics import HTTP_REQUESTS_IN_FLIGHT
+
+
+class TelemetryCollector:
+    """Периодически снимает телеметрию процесса и сводит снимки всех процессов."""
+
+    def __init__(self, interval: float, snapshot_dir: Optional[str] = None):
+        """
+        Инициализация коллектора.
+
+        Args:
+            interval: Период сбора телеметрии в секундах
+            snapshot_dir: Каталог снимков процессов (по умолчанию - во временном
+                каталоге системы)
+        """
+        self.interval = interval
+        self.snapshot_dir = Path(
+            snapshot_dir or Path(tempfile.gettempdir()) / "apiserver-telemetry"
+        )
+        self.snapshot_path = self.snapshot_dir / f"{os.getpid()}.json"
+        self.process = psutil.Process()
+        self.loop_lag = 0.0
+        self.snapshot: Dict[str, Any] = {}
+
+        # Первый вызов cpu_percent без интервала только запоминает отсчет
+        psutil.cpu_percent(interval=None)
+        self.process.cpu_percent(interval=None)
+
+    async def run(self) -> None:
+        """Собирает телеметрию до отмены задачи."""
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                await self.collect()
+                # Задержка цикла событий - насколько позже срока проснулись
+                started = loop.time()
+                await asyncio.sleep(self.interval)
+                self.loop_lag = max(loop.time() - started - self.interval, 0.0)
+        finally:
+            self.snapshot_path.unlink(missing_ok=True)
+
+    async def collect(self) -> None:
+        """Снимает телеметрию процесса и обновляет сводку по всем процессам."""
+        try:
+            self.snapshot = await asyncio.to_thread(self._collect)
+        except Exception as e:
+            logger.warning("Не удалось собрать телеметрию: {}", e)
+
+    def _collect(self) -> Dict[str, Any]:
+        """Снимает телеметрию и читает снимки остальных процессов (в потоке)."""
+        memory = psutil.virtual_memory()
+        system = {
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "memory_total": memory.total,
+            "memory_available": memory.available,
+            "memory_percent": memory.percent,
+        }
+
+        # net_connections появился в psutil 6.0
+        connections = getattr(
+            self.process, "net_connections", self.process.connections
+        )(kind="tcp")
+        worker = {
+            "pid": self.process.pid,
+            "collected_at": time.time(),
+            "cpu_percent": self.process.cpu_percent(interval=None),
+            "memory_rss": self.process.memory_info().rss,
+            "loop_lag_ms": self.loop_lag * 1000,
+            "connections": len(connections),
+            "connections_established": sum(
+                connection.status == psutil.CONN_ESTABLISHED
+                for connection in connections
+            ),
+            "requests_in_flight": int(HTTP_REQUESTS_IN_FLIGHT.value()),
+        }
+
+        # Запись через временный файл, чтобы другие процессы не прочитали
+        # снимок наполовину
+        temporary_path = self.snapshot_path.with_suffix(".tmp")
+        temporary_path.write_text(json.dumps(worker), encoding="utf-8")
+        temporary_path.replace(self.snapshot_path)
+
+        workers = self._read_workers()
+        return {
+            "system": system,
+            "workers": workers,
+            "total": {
+                "workers": len(workers),
+                "cpu_percent": sum(item["cpu_percent"] for item in workers),
+                "memory_rss": sum(item["memory_rss"] for item in workers),
+                "max_loop_lag_ms": max(item["loop_lag_ms"] for item in workers),
+                "connections": sum(item["connections"] for item in workers),
+                "connections_established": sum(
+                    item["connections_established"] for item in workers
+                ),
+                "requests_in_flight": sum(
+                    item["requests_in_flight"] for item in workers
+                ),
+            },
+        }
+
+    def _read_workers(self) -> List[Dict[str, Any]]:
+        """
+        Читает снимки всех процессов.
+
+        Снимки, не обновлявшиеся дольше трех интервалов, принадлежат
+        завершившимся процессам и удаляются.
+        """
+        stale_before = time.time() - 3 * self.interval
+        workers = []
+        for path in self.snapshot_dir.glob("*.json"):
+            try:
+                worker = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            if worker["collected_at"] < stale_before:
+                path.unlink(missing_ok=True)
+                continue
+            workers.append(worker)
+        return sorted(workers, key=lambda item: item["pid"])
@@ -1,11 +1,15 @@
 """
 Сервис для расчета загруженности транспорта.
 """
-import random
-from typing import Any, Dict, List
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 import httpx
+import numpy as np
+from loguru import logger
 
+from apiserver.app.services.cache import TTLCache
+from apiserver.app.services.route_ranking import objectives_matrix, pareto_front
 from apiserver.config.settings import settings
 
 
@@ -18,31 +22,171 @@ class TransportWorkloadService:
     загруженности и длительности.
     """
 
-    def __init__(self):
-        """Инициализация сервиса загруженности транспорта."""
-        pass
+    def __init__(self, http_client: httpx.AsyncClient):
+        """
+        Инициализация сервиса загруженности транспорта.
 
-    def get_station_workload(self) -> int:
+        Args:
+            http_client: Общий HTTP-клиент приложения
+        """
+        self.http_client = http_client
+        self.batch_url = settings.get("STATION_WORKLOAD_BATCH_URL", "")
+        # Показания детектора кэшируются на короткое время
+        self.workload_cache = TTLCache(
+            maxsize=settings.get("STATION_WORKLOAD_CACHE_MAX_SIZE", 10000),
+            ttl=settings.get("STATION_WORKLOAD_TTL", 30),
+        )
+
+        # Зеркало сглаженной загруженности из фонового опроса DetectionAPI
+        self.occupancy_url = settings.get("STATION_OCCUPANCY_URL", "")
+        self.occupancy: Dict[str, int] = {}
+        self.requested_stations: Set[str] = set()
+
+        self.workload_aggregate = settings.get("WORKLOAD_AGGREGATE", "mean")
+        self.rng = np.random.default_rng()
+
+    async def get_station_workload(self, station_id: str) -> Optional[int]:
         """
         Получает информацию о загруженности станции.
 
-        Выполняет запрос к внешнему API для получения текущей
-        загруженности станции.
+        Args:
+            station_id: Идентификатор станции.
+
+        Returns:
+            Optional[int]: Числовое значение загруженности станции или None,
+                если получить его не удалось.
+        """
+        workloads = await self.get_stations_workload([station_id])
+        return workloads.get(station_id)
+
+    async def get_stations_workload(self, station_ids: Iterable[str]) -> Dict[str, int]:
+        """
+        Получает загруженность нескольких станций одним запросом.
+
+        Если задан STATION_OCCUPANCY_URL, значения берутся из зеркала,
+        которое обновляется в фоне, а станции запоминаются для отправки
+        в DetectionAPI как недавно запрошенные. Иначе повторяющиеся станции
+        запрашиваются одним пакетом, станции с недавними показаниями
+        берутся из кэша.
+
+        Args:
+            station_ids (Iterable[str]): Идентификаторы станций.
+
+        Returns:
+            Dict[str, int]: Загруженность по идентификаторам станций. Станции,
+                для которых получить данные не удалось, отсутствуют в словаре.
+        """
+        if self.occupancy_url:
+            station_ids = list(dict.fromkeys(station_ids))
+            self.requested_stations.update(station_ids)
+            return {
+                station_id: self.occupancy[station_id]
+                for station_id in station_ids
+                if station_id in self.occupancy
+            }
+
+        workloads = {}
+        missing = []
+        for station_id in dict.fromkeys(station_ids):
+            workload = self.workload_cache.get(station_id)
+            if workload is None:
+                missing.append(station_id)
+            else:
+                workloads[station_id] = workload
+
+        if not missing or not self.batch_url:
+            return workloads
+
+        try:
+            response = await self.http_client.post(
+                self.batch_url, json={"station_ids": missing}
+            )
+            response.raise_for_status()
+            fetched = response.json().get("workloads", {})
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error("Ошибка при получении загруженности станций: {}", e)
+            return workloads
+
+        for station_id, workload in fetched.items():
+            self.workload_cache.set(station_id, int(workload))
+            workloads[station_id] = int(workload)
+
+        return workloads
+
+    async def sync_occupancy(self) -> None:
+        """
+        Передает в DetectionAPI станции из недавних запросов маршрутов
+        и обновляет зеркало сглаженной загруженности всех станций.
+        """
+        requested, self.requested_stations = self.requested_stations, set()
+        try:
+            response = await self.http_client.post(
+                self.occupancy_url, json={"station_ids": sorted(requested)}
+            )
+            response.raise_for_status()
+            workloads = response.json().get("workloads", {})
+        except (httpx.HTTPError, ValueError) as e:
+            # Станции отправим при следующей синхронизации
+            self.requested_stations |= requested
+            logger.error("Ошибка при синхронизации загруженности станций: {}", e)
+            return
+
+        self.occupancy = {
+            station_id: round(workload) for station_id, workload in workloads.items()
+        }
+
+    async def run_occupancy_sync(self, interval: float) -> None:
+        """
+        Периодически синхронизирует зеркало загруженности с DetectionAPI.
+
+        Args:
+            interval: Период синхронизации в секундах
+        """
+        while True:
+            try:
+                await self.sync_occupancy()
+            except Exception as e:
+                # Некорректный ответ DetectionAPI не должен останавливать синхронизацию
+                logger.error("Ошибка при синхронизации загруженности станций: {}", e)
+            await asyncio.sleep(interval)
+
+    @staticmethod
+    def get_route_segments(route: Dict[str, Any]) -> List[Tuple[str, float]]:
+        """
+        Возвращает транспортные участки маршрута.
+
+        Args:
+            route (Dict[str, Any]): Маршрут 2GIS.
 
         Returns:
-            int: Числовое значение загруженности станции.
+            List[Tuple[str, float]]: Пары (станция посадки, длительность участка
+                в секундах с учетом ожидания). Если станция неизвестна,
+                вместо названия пустая строка.
         """
-        url = settings.station_workload_url
-        response = httpx.get(url, params={"station_id": "test_station"})
-        return int(response.text)
+        segments = []
+        for movement in route.get("movements", []):
+            if movement.get("type") != "passage":
+                continue
+            duration = (movement.get("moving_duration") or 0) + (
+                movement.get("waiting_duration") or 0
+            )
+            station = movement.get("waypoint", {}).get("name") or ""
+            segments.append((station, duration))
+        return segments
 
-    def set_routes_workload(self, routes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    async def set_routes_workload(
+        self, routes: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
         """
         Рассчитывает загруженность для списка маршрутов.
 
-        Для каждого маршрута, который не является пешеходным,
-        вычисляется загруженность на основе случайных значений и
-        данных о загруженности станций, если доступен URL станции.
+        Транспортные участки всех маршрутов, которые не являются пешеходными,
+        собираются в массивы NumPy. Загруженность участка складывается из
+        случайного значения и загруженности станции посадки, если она известна.
+        Загруженность всех станций запрашивается одним пакетом. По участкам
+        каждого маршрута считаются среднее, максимум и среднее, взвешенное
+        по длительности; в поле workload записывается агрегат из настройки
+        WORKLOAD_AGGREGATE.
 
         Args:
             routes (List[Dict[str, Any]]): Список маршрутов, для которых нужно
@@ -52,27 +196,72 @@ class TransportWorkloadService:
             List[Dict[str, Any]]: Список маршрутов с добавленной информацией
                 о загруженности.
         """
-        routes_with_transport = []
+        routes_with_transport = [
+            route for route in routes if not route.get("pedestrian", False)
+        ]
+        if not routes_with_transport:
+            return []
 
-        for route in routes:
-            if route.get("pedestrian", False):
-                continue
-            routes_with_transport.append(route)
-        for i in range(len(routes_with_transport)):
-            workload_values = []
-            for _ in range(
-                len(routes_with_transport[i]["waypoints"][0]["routes_names"])
-            ):
-                transport_workload = random.randint(1, 60)
-                combined_workload = transport_workload
-                if settings.station_workload_url:
-                    combined_workload = transport_workload + min(
-                        self.get_station_workload(), 60 - transport_workload
-                    )
-                workload_values.append(combined_workload / 60)
-            routes_with_transport[i]["workload"] = sum(workload_values) / len(
-                workload_values
-            )
+        segment_routes = []
+        segment_stations = []
+        segment_durations = []
+        for i, route in enumerate(routes_with_transport):
+            for station, duration in self.get_route_segments(route):
+                segment_routes.append(i)
+                segment_stations.append(station)
+                segment_durations.append(duration)
+
+        stations_workload = await self.get_stations_workload(
+            station for station in segment_stations if station
+        )
+
+        route_count = len(routes_with_transport)
+        route_index = np.array(segment_routes, dtype=np.int64)
+        durations = np.array(segment_durations, dtype=np.float64)
+
+        # Соединяем участки с загруженностью станций через уникальные станции
+        unique_stations, inverse = np.unique(
+            np.array(segment_stations, dtype=str), return_inverse=True
+        )
+        station_values = np.array(
+            [stations_workload.get(station, np.nan) for station in unique_stations],
+            dtype=np.float64,
+        )
+        station_workload = station_values[inverse]
+
+        transport_workload = self.rng.integers(1, 61, size=len(route_index))
+        # Загруженность станции (если известна) добавляется до предела в 60
+        station_share = np.minimum(station_workload, 60 - transport_workload)
+        combined = (transport_workload + np.nan_to_num(station_share)) / 60
+
+        counts = np.bincount(route_index, minlength=route_count)
+        mean = np.bincount(route_index, weights=combined, minlength=route_count)
+        mean = mean / np.maximum(counts, 1)
+
+        # Участки идут по маршрутам подряд, поэтому максимум - reduceat
+        maximum = np.zeros(route_count)
+        has_segments = counts > 0
+        if has_segments.any():
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[has_segments]
+            maximum[has_segments] = np.maximum.reduceat(combined, starts)
+
+        total_duration = np.bincount(
+            route_index, weights=durations, minlength=route_count
+        )
+        weighted = np.bincount(
+            route_index, weights=combined * durations, minlength=route_count
+        )
+        weighted = np.where(
+            total_duration > 0, weighted / np.maximum(total_duration, 1e-9), mean
+        )
+
+        aggregates = {"mean": mean, "max": maximum, "duration_weighted": weighted}
+        workload = aggregates.get(self.workload_aggregate, mean)
+        for i, route in enumerate(routes_with_transport):
+            route["workload"] = float(workload[i])
+            route["workload_stats"] = {
+                name: float(values[i]) for name, values in aggregates.items()
+            }
 
         return routes_with_transport
 
@@ -83,6 +272,7 @@ class TransportWorkloadService:
         Маршрут считается Парето-оптимальным, если не существует другого маршрута,
         который был бы лучше по обоим критериям (загруженность и время)
         или лучше по одному критерию и не хуже по другому.
+        Фронт строится сортировкой за O(n log n).
 
         Args:
             routes (List[Dict[str, Any]]): Список маршрутов для анализа.
@@ -90,19 +280,5 @@ class TransportWorkloadService:
         Returns:
             List[Dict[str, Any]]: Список Парето-оптимальных маршрутов.
         """
-        pareto = []
-        for candidate in routes:
-            dominated = False
-            for other in routes:
-                if (
-                    other["workload"] < candidate["workload"]
-                    and other["total_duration"] <= candidate["total_duration"]
-                ) or (
-                    other["workload"] <= candidate["workload"]
-                    and other["total_duration"] < candidate["total_duration"]
-                ):
-                    dominated = True
-                    break
-            if not dominated:
-                pareto.append(candidate)
-        return pareto
+        values = objectives_matrix(routes, ["workload", "total_duration"])
+        return [routes[i] for i in sorted(pareto_front(values))]
@@ -0,0 +1,289 @@
+"""
+Предрассчитанная матрица времени в пути между остановками.
+
+Матрица строится офлайн (python -m apiserver.jobs.travel_matrix) для
+остановок снимка локального индекса на каждый интервал времени суток
+и хранится в каталоге из трех файлов:
+
+    stops.json      - остановки (id и координаты), длина интервала, часовой пояс
+    durations.npy   - время в пути, секунды (uint16, интервалы x остановки x остановки)
+    transfers.npy   - количество пересадок (uint8, той же формы)
+
+Задание записывает файлы .npy блоками строк (MatrixWriter), а сервер
+открывает их отображением в память только для чтения, поэтому все
+процессы uvicorn используют общие страницы кэша ОС, а при оценке пар
+остановок читаются только нужные элементы матрицы.
+"""
+import asyncio
+import contextlib
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from loguru import logger
+
+STOPS_FILE = "stops.json"
+DURATIONS_FILE = "durations.npy"
+TRANSFERS_FILE = "transfers.npy"
+
+# Значения «пара не рассчитана или недостижима»
+UNKNOWN_DURATION = np.iinfo(np.uint16).max
+UNKNOWN_TRANSFERS = np.iinfo(np.uint8).max
+
+
+def stop_key(stop: Dict[str, Any]) -> Optional[Any]:
+    """Ключ остановки в матрице: id, а без него - координаты."""
+    if stop.get("id"):
+        return stop["id"]
+    point = stop.get("point", {})
+    if point.get("lat") and point.get("lon"):
+        return round(point["lat"], 6), round(point["lon"], 6)
+    return None
+
+
+@dataclass(frozen=True)
+class _MatrixData:
+    """Неизменяемое содержимое матрицы, отображенное в память."""
+
+    index: Dict[Any, int]
+    bucket_size: int
+    timezone: ZoneInfo
+    durations: np.ndarray
+    transfers: np.ndarray
+
+
+class TravelMatrix:
+    """Матрица времени в пути и пересадок между остановками по интервалам суток."""
+
+    def __init__(self):
+        self._data: Optional[_MatrixData] = None
+        self._mtime: Optional[float] = None
+
+    def __len__(self) -> int:
+        return self._data.durations.shape[1] if self._data else 0
+
+    def load(self, path: str) -> None:
+        """
+        Открывает матрицу из каталога отображением в память.
+
+        Args:
+            path: Каталог с файлами матрицы
+        """
+        mtime = os.path.getmtime(os.path.join(path, STOPS_FILE))
+        with open(os.path.join(path, STOPS_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        durations = np.load(os.path.join(path, DURATIONS_FILE), mmap_mode="r")
+        transfers = np.load(os.path.join(path, TRANSFERS_FILE), mmap_mode="r")
+
+        stops = meta["stops"]
+        if durations.shape != (durations.shape[0], len(stops), len(stops)):
+            raise ValueError(
+                f"Размер матрицы {durations.shape} не совпадает "
+                f"с количеством остановок {len(stops)}"
+            )
+        index = {}
+        for position, stop in enumerate(stops):
+            index[stop_key(stop)] = position
+            # Остановки без id в запросе ищутся по координатам
+            index.setdefault(stop_key({"point": stop["point"]}), position)
+
+        self._data = _MatrixData(
+            index=index,
+            bucket_size=meta["bucket_size"],
+            timezone=ZoneInfo(meta["timezone"]),
+            durations=durations,
+            transfers=transfers,
+        )
+        self._mtime = mtime
+        logger.info(
+            "Загружена матрица времени в пути {}: {} остановок, {} интервалов",
+            path,
+            len(stops),
+            durations.shape[0],
+        )
+
+    async def refresh_periodically(self, path: str, interval: float) -> None:
+        """
+        Открывает матрицу заново в фоне, если задание перестроило ее.
+
+        Args:
+            path: Каталог с файлами матрицы
+            interval: Период проверки в секундах
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if os.path.getmtime(os.path.join(path, STOPS_FILE)) != self._mtime:
+                    await asyncio.to_thread(self.load, path)
+            except Exception as e:
+                logger.error("Ошибка при обновлении матрицы времени в пути: {}", e)
+
+    def bucket(self, when: Optional[datetime] = None) -> int:
+        """Номер интервала суток для момента времени (по умолчанию - текущего)."""
+        data = self._data
+        when = (when or datetime.now(data.timezone)).astimezone(data.timezone)
+        seconds = when.hour * 3600 + when.minute * 60 + when.second
+        return min(seconds // data.bucket_size, data.durations.shape[0] - 1)
+
+    def estimate(
+        self,
+        initial_stops: List[Dict[str, Any]],
+        end_stops: List[Dict[str, Any]],
+        when: Optional[datetime] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Оценивает время в пути и количество пересадок для всех пар остановок.
+
+        Args:
+            initial_stops: Начальные остановки
+            end_stops: Конечные остановки
+            when: Время отправления (по умолчанию - текущее)
+
+        Returns:
+            Матрицы (начальные x конечные остановки) времени в пути в секундах
+            и количества пересадок: NaN - остановки нет в матрице,
+            inf - пара не рассчитана или недостижима
+        """
+        data = self._data
+        shape = (len(initial_stops), len(end_stops))
+        durations = np.full(shape, np.nan)
+        transfers = np.full(shape, np.nan)
+        if data is None:
+            return durations, transfers
+
+        rows = np.array([data.index.get(stop_key(stop), -1) for stop in initial_stops])
+        columns = np.array([data.index.get(stop_key(stop), -1) for stop in end_stops])
+        known_rows = np.flatnonzero(rows >= 0)
+        known_columns = np.flatnonzero(columns >= 0)
+        if not len(known_rows) or not len(known_columns):
+            return durations, transfers
+
+        # Из отображенного файла читаются только элементы этих пар
+        cells = np.ix_(rows[known_rows], columns[known_columns])
+        bucket = self.bucket(when)
+        known_durations = data.durations[bucket][cells].astype(np.float64)
+        known_transfers = data.transfers[bucket][cells].astype(np.float64)
+        known_durations[known_durations == UNKNOWN_DURATION] = np.inf
+        known_transfers[known_transfers == UNKNOWN_TRANSFERS] = np.inf
+
+        durations[np.ix_(known_rows, known_columns)] = known_durations
+        transfers[np.ix_(known_rows, known_columns)] = known_transfers
+        return durations, transfers
+
+
+def encode(
+    durations: np.ndarray, transfers: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Переводит время в пути и количество пересадок в типы файлов матрицы.
+
+    Args:
+        durations: Время в пути, секунды (inf - пара недостижима)
+        transfers: Количество пересадок той же формы
+
+    Returns:
+        Массивы uint16 и uint8; недостижимые и не помещающиеся в тип значения
+        заменены на UNKNOWN_DURATION и UNKNOWN_TRANSFERS
+    """
+    known = np.isfinite(durations) & (durations < UNKNOWN_DURATION)
+    encoded_durations = np.where(known, durations, UNKNOWN_DURATION).astype(np.uint16)
+    # Без времени в пути количество пересадок не имеет смысла
+    known &= np.isfinite(transfers) & (transfers < UNKNOWN_TRANSFERS)
+    encoded_transfers = np.where(known, transfers, UNKNOWN_TRANSFERS).astype(np.uint8)
+    return encoded_durations, encoded_transfers
+
+
+class MatrixWriter:
+    """
+    Запись матрицы в каталог.
+
+    Матрица записывается блоками строк во временные файлы, отображенные
+    в память, поэтому целиком в памяти не держится. При сохранении файлы
+    заменяются целиком: процессы, уже отобразившие старую матрицу,
+    продолжают читать ее до перезагрузки. Файл остановок заменяется
+    последним - по нему процессы обнаруживают обновление.
+    """
+
+    def __init__(self, path: str, n_buckets: int, n_stops: int):
+        """
+        Создает временные файлы матрицы, заполненные значениями
+        «пара не рассчитана».
+
+        Args:
+            path: Каталог с файлами матрицы
+            n_buckets: Количество интервалов суток
+            n_stops: Количество остановок
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._tmp_paths = {
+            name: f"{os.path.join(path, name)}.{os.getpid()}.tmp"
+            for name in (DURATIONS_FILE, TRANSFERS_FILE)
+        }
+        shape = (n_buckets, n_stops, n_stops)
+        self.durations = np.lib.format.open_memmap(
+            self._tmp_paths[DURATIONS_FILE], mode="w+", dtype=np.uint16, shape=shape
+        )
+        self.transfers = np.lib.format.open_memmap(
+            self._tmp_paths[TRANSFERS_FILE], mode="w+", dtype=np.uint8, shape=shape
+        )
+        for bucket in range(n_buckets):
+            self.durations[bucket] = UNKNOWN_DURATION
+            self.transfers[bucket] = UNKNOWN_TRANSFERS
+
+    def write_rows(
+        self, bucket: int, start: int, durations: np.ndarray, transfers: np.ndarray
+    ) -> None:
+        """
+        Записывает блок строк матрицы одного интервала.
+
+        Args:
+            bucket: Номер интервала суток
+            start: Первая строка (начальная остановка) блока
+            durations: Время в пути, секунды (строки блока x остановки,
+                inf - пара недостижима)
+            transfers: Количество пересадок той же формы
+        """
+        rows = slice(start, start + len(durations))
+        self.durations[bucket, rows], self.transfers[bucket, rows] = encode(
+            durations, transfers
+        )
+
+    def commit(
+        self, stops: List[Dict[str, Any]], bucket_size: int, timezone: str
+    ) -> None:
+        """
+        Сохраняет записанную матрицу вместо текущей.
+
+        Args:
+            stops: Остановки в формате элементов каталога 2GIS
+            bucket_size: Длина интервала суток в секундах
+            timezone: Часовой пояс, в котором отсчитываются интервалы
+        """
+        self.durations.flush()
+        self.transfers.flush()
+        del self.durations, self.transfers
+        for name, tmp_path in self._tmp_paths.items():
+            os.replace(tmp_path, os.path.join(self.path, name))
+
+        meta = {
+            "bucket_size": bucket_size,
+            "timezone": timezone,
+            "created_at": datetime.now().astimezone().isoformat(),
+            "stops": [{"id": stop.get("id"), "point": stop["point"]} for stop in stops],
+        }
+        target = os.path.join(self.path, STOPS_FILE)
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, target)
+
+    def discard(self) -> None:
+        """Удаляет временные файлы несохраненной матрицы."""
+        for tmp_path in self._tmp_paths.values():
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
@@ -0,0 +1,307 @@
+"""
+Построение матрицы времени в пути между остановками.
+
+Для всех пар остановок снимка локального индекса (или его части в зоне
+обслуживания --center, --radius) рассчитывает время в пути и количество
+пересадок на каждый интервал времени суток и сохраняет матрицу
+(apiserver.app.services.travel_matrix), которую сервер использует
+для отбора пар остановок перед построением маршрутов.
+
+Источники:
+
+    raptor - локальный движок по фиду GTFS: все интервалы за один запуск,
+             отправление в середине интервала на дату --date;
+    remote - build_public_transport_route (провайдеры маршрутов): только
+             интервал текущего времени, остальные интервалы сохраняются
+             из предыдущих запусков, поэтому задание запускают по расписанию
+             в каждом интервале.
+
+Запуск (из backend/apiserver):
+
+    python -m apiserver.jobs.travel_matrix --backend raptor \\
+        --stops stops.json --gtfs gtfs.zip --output travel_matrix
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from loguru import logger
+
+from apiserver.app.services.geo import haversine
+from apiserver.app.services.http_client import create_http_client
+from apiserver.app.services.public_transport import PublicTransportService
+from apiserver.app.services.raptor import INF, RaptorEngine
+from apiserver.app.services.stop_index import read_snapshot
+from apiserver.app.services.travel_matrix import (
+    DURATIONS_FILE,
+    STOPS_FILE,
+    TRANSFERS_FILE,
+    MatrixWriter,
+    encode,
+)
+from apiserver.config.settings import settings
+
+# Количество начальных остановок между записями о ходе расчета
+PROGRESS_EVERY = 100
+
+
+def build_with_raptor(
+    engine: RaptorEngine,
+    points: List[Tuple[float, float]],
+    service_date: date,
+    bucket_size: int,
+    timezone: ZoneInfo,
+    writer: MatrixWriter,
+) -> None:
+    """
+    Рассчитывает матрицу локальным движком RAPTOR на все интервалы суток
+    и записывает ее блоками по PROGRESS_EVERY начальных остановок.
+    """
+    n_buckets = -(-86400 // bucket_size)
+    midnight = datetime.combine(service_date, datetime.min.time(), timezone)
+
+    for bucket in range(n_buckets):
+        departure = midnight + timedelta(seconds=(bucket + 0.5) * bucket_size)
+        started = time.perf_counter()
+        reached = 0
+        for start in range(0, len(points), PROGRESS_EVERY):
+            durations, transfers = engine.travel_times(
+                points[start : start + PROGRESS_EVERY], points, departure
+            )
+            reached += int((durations < INF).sum())
+            durations = np.where(durations < INF, durations, np.inf)
+            writer.write_rows(bucket, start, durations, transfers)
+        logger.info(
+            "Интервал {} ({:%H:%M}): {:.1f} с, достижимо {:.0%} пар",
+            bucket,
+            departure,
+            time.perf_counter() - started,
+            reached / len(points) ** 2,
+        )
+
+
+async def build_with_remote(
+    points: List[Tuple[float, float]],
+    durations: np.ndarray,
+    transfers: np.ndarray,
+    max_distance: float,
+    concurrency: int,
+) -> None:
+    """
+    Рассчитывает матрицу одного интервала через build_public_transport_route.
+
+    Args:
+        points: Координаты остановок
+        durations: Время в пути интервала в формате файла матрицы
+            (заполняется на месте)
+        transfers: Количество пересадок интервала в формате файла матрицы
+            (заполняется на месте)
+        max_distance: Пары дальше этого расстояния (метры) не рассчитываются
+            (0 - рассчитываются все)
+        concurrency: Количество одновременных запросов
+    """
+    lat = np.array([point[0] for point in points])
+    lon = np.array([point[1] for point in points])
+    http_client = create_http_client()
+    service = PublicTransportService(http_client)
+
+    def pairs():
+        for row in range(len(points)):
+            distances = haversine(lat[row], lon[row], lat, lon)
+            for column in np.flatnonzero(distances > 0):
+                if not max_distance or distances[column] <= max_distance:
+                    yield row, int(column)
+
+    queue = pairs()
+    done = 0
+
+    async def worker():
+        nonlocal done
+        for row, column in queue:
+            route = await service.build_public_transport_route(
+                *points[row], *points[column]
+            )
+            if route and route.get("total_duration") is not None:
+                duration, transfer_count = encode(
+                    np.array([route["total_duration"]]),
+                    np.array([route.get("transfer_count", 0)]),
+                )
+                durations[row, column] = duration[0]
+                transfers[row, column] = transfer_count[0]
+            done += 1
+            if done % (PROGRESS_EVERY * 10) == 0:
+                logger.info("Построено маршрутов: {}", done)
+
+    try:
+        # Рабочие берут пары из общего генератора, задачи на все пары не создаются
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        await http_client.aclose()
+
+
+def previous_matrix(
+    path: str, stops: List[Dict[str, Any]], bucket_size: int
+) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Матрица предыдущего запуска, если она построена для тех же остановок.
+
+    Файлы открываются отображением в память и при копировании в новую
+    матрицу читаются по одному интервалу.
+    """
+    try:
+        with open(os.path.join(path, STOPS_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    same_stops = [stop["point"] for stop in meta["stops"]] == [
+        stop["point"] for stop in stops
+    ]
+    if not same_stops or meta["bucket_size"] != bucket_size:
+        return None
+    return (
+        np.load(os.path.join(path, DURATIONS_FILE), mmap_mode="r"),
+        np.load(os.path.join(path, TRANSFERS_FILE), mmap_mode="r"),
+    )
+
+
+def service_area(
+    stops: List[Dict[str, Any]], center: str, radius: float
+) -> List[Dict[str, Any]]:
+    """
+    Остановки в радиусе от центра зоны обслуживания.
+
+    Args:
+        stops: Остановки снимка с координатами
+        center: Центр зоны «широта,долгота» (пустая строка - без ограничения)
+        radius: Радиус зоны в метрах (0 - без ограничения)
+
+    Returns:
+        Остановки зоны в порядке снимка
+    """
+    if not center or not radius:
+        return stops
+    center_lat, center_lon = (float(value) for value in center.split(","))
+    distances = haversine(
+        center_lat,
+        center_lon,
+        np.array([stop["point"]["lat"] for stop in stops]),
+        np.array([stop["point"]["lon"] for stop in stops]),
+    )
+    return [stop for stop, distance in zip(stops, distances) if distance <= radius]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--stops", default=settings.get("STOP_INDEX_SNAPSHOT_PATH", ""))
+    parser.add_argument("--output", default=settings.get("TRAVEL_MATRIX_PATH", ""))
+    parser.add_argument(
+        "--backend",
+        choices=["raptor", "remote"],
+        default=settings.get("ROUTING_BACKEND", "remote"),
+    )
+    parser.add_argument("--gtfs", default=settings.get("GTFS_FEED_PATH", ""))
+    parser.add_argument("--bucket-size", type=int, default=10800)
+    parser.add_argument("--date", type=date.fromisoformat, default=None)
+    parser.add_argument(
+        "--timezone",
+        default=None,
+        help="Часовой пояс интервалов (для raptor по умолчанию - пояс фида)",
+    )
+    parser.add_argument("--max-distance", type=float, default=0.0)
+    parser.add_argument(
+        "--center",
+        default="",
+        help="Центр зоны обслуживания «широта,долгота» (по умолчанию - весь снимок)",
+    )
+    parser.add_argument(
+        "--radius", type=float, default=0.0, help="Радиус зоны обслуживания (метры)"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=settings.get("ROUTE_BUILD_CONCURRENCY", 10)
+    )
+    args = parser.parse_args(argv)
+    if not args.stops or not args.output:
+        parser.error("нужны --stops и --output")
+    if args.backend == "raptor" and not args.gtfs:
+        parser.error("для raptor нужен --gtfs")
+    if args.backend == "remote" and not args.timezone:
+        parser.error("для remote нужен --timezone")
+    if bool(args.center) != bool(args.radius):
+        parser.error("--center и --radius задаются вместе")
+
+    stops = [
+        stop
+        for stop in read_snapshot(args.stops)
+        if stop.get("point", {}).get("lat") and stop.get("point", {}).get("lon")
+    ]
+    logger.info("Остановок в снимке: {}", len(stops))
+    stops = service_area(stops, args.center, args.radius)
+    if args.center:
+        logger.info("Остановок в зоне обслуживания: {}", len(stops))
+    points = [(stop["point"]["lat"], stop["point"]["lon"]) for stop in stops]
+    n_buckets = -(-86400 // args.bucket_size)
+
+    if args.backend == "raptor":
+        engine = RaptorEngine.load(
+            args.gtfs,
+            max_transfers=settings.get("RAPTOR_MAX_TRANSFERS", 3),
+            access_radius=settings.get("RAPTOR_ACCESS_RADIUS", 400),
+            transfer_radius=settings.get("RAPTOR_TRANSFER_RADIUS", 200),
+            walking_speed=settings.get("RAPTOR_WALKING_SPEED", 1.2),
+        )
+        timezone = args.timezone or engine.feed.timezone.key
+        service_date = args.date or datetime.now(ZoneInfo(timezone)).date()
+        writer = MatrixWriter(args.output, n_buckets, len(points))
+        try:
+            build_with_raptor(
+                engine,
+                points,
+                service_date,
+                args.bucket_size,
+                ZoneInfo(timezone),
+                writer,
+            )
+        except BaseException:
+            writer.discard()
+            raise
+    else:
+        timezone = args.timezone
+        now = datetime.now(ZoneInfo(timezone))
+        bucket = (now.hour * 3600 + now.minute * 60 + now.second) // args.bucket_size
+        previous = previous_matrix(args.output, stops, args.bucket_size)
+        writer = MatrixWriter(args.output, n_buckets, len(points))
+        try:
+            if previous is not None:
+                # Остальные интервалы - из предыдущего запуска, по одному
+                for other in range(n_buckets):
+                    if other != bucket:
+                        writer.durations[other] = previous[0][other]
+                        writer.transfers[other] = previous[1][other]
+                del previous
+            asyncio.run(
+                build_with_remote(
+                    points,
+                    writer.durations[bucket],
+                    writer.transfers[bucket],
+                    args.max_distance,
+                    args.concurrency,
+                )
+            )
+        except BaseException:
+            writer.discard()
+            raise
+
+    writer.commit(stops, args.bucket_size, timezone)
+    logger.info("Матрица сохранена в {}", args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,34 +1,41 @@
 """
 Main application module.
 """
+import asyncio
+import contextlib
 import os
-import sys
 from contextlib import asynccontextmanager
+from datetime import datetime
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from loguru import logger
 
+from apiserver.app.api.middleware import CorrelationIdMiddleware, TimingMiddleware
 from apiserver.app.api.v1.endpoints.router import api_router
+from apiserver.app.services.http_client import create_http_client, warm_up_http_client
+from apiserver.app.services.logs import setup_logging
+from apiserver.app.services.public_transport import PublicTransportService
+from apiserver.app.services.raptor import RaptorEngine
+from apiserver.app.services.route_planner import RoutePlannerService
+from apiserver.app.services.stop_index import StopIndex
+from apiserver.app.services.telemetry import TelemetryCollector
+from apiserver.app.services.transport_workload import TransportWorkloadService
+from apiserver.app.services.travel_matrix import TravelMatrix
 from apiserver.config.settings import settings
 
-# Настройка логирования
-logger.remove()  # Удаляем стандартный обработчик
-logger.add(
-    sys.stdout,
-    format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-    level=settings.log_level,
-)
-
 # Создаем директорию для логов, если её нет
 os.makedirs("logs", exist_ok=True)
 
-logger.add(
-    "logs/app.log",
+# Настройка логирования: запись через очередь, JSON и прореживание по уровням
+setup_logging(
+    level=settings.log_level,
+    log_file="logs/app.log",
     rotation=settings.log_rotation_period,
     retention=settings.log_retention_period,
-    format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
-    level=settings.log_level,
+    json=settings.get("LOG_JSON", False),
+    enqueue=settings.get("LOG_ENQUEUE", True),
+    sampling=settings.get("LOG_SAMPLING", {}),
 )
 
 
@@ -36,12 +43,98 @@ logger.add(
 async def lifespan(app: FastAPI):
     # Код выполняется при запуске приложения
     logger.info("Application startup")
-    logger.info(f"API Documentation: http://localhost:8000{settings.API_V1_STR}/docs")
+    logger.info("API Documentation: http://localhost:8000{}/docs", settings.API_V1_STR)
+
+    # Общий HTTP-клиент с пулом соединений для всех внешних API
+    http_client = create_http_client()
+    await warm_up_http_client(http_client)
+    app.state.http_client = http_client
+
+    # Локальный индекс остановок из снимка, обновляемый в фоне
+    stop_index = None
+    stop_index_task = None
+    snapshot_path = settings.get("STOP_INDEX_SNAPSHOT_PATH", "")
+    if snapshot_path:
+        stop_index = StopIndex(cell_size=settings.get("STOP_INDEX_CELL_SIZE", 0.01))
+        await asyncio.to_thread(stop_index.load_snapshot, snapshot_path)
+        stop_index_task = asyncio.create_task(
+            stop_index.refresh_periodically(
+                snapshot_path, settings.get("STOP_INDEX_REFRESH_INTERVAL", 300)
+            )
+        )
+
+    # Локальный движок маршрутов по расписанию GTFS вместо провайдеров
+    raptor_engine = None
+    if settings.get("ROUTING_BACKEND", "remote") == "raptor":
+        raptor_engine = await asyncio.to_thread(
+            RaptorEngine.load,
+            settings.GTFS_FEED_PATH,
+            max_transfers=settings.get("RAPTOR_MAX_TRANSFERS", 3),
+            access_radius=settings.get("RAPTOR_ACCESS_RADIUS", 400),
+            transfer_radius=settings.get("RAPTOR_TRANSFER_RADIUS", 200),
+            walking_speed=settings.get("RAPTOR_WALKING_SPEED", 1.2),
+        )
+        # Расписание на сегодня строится до первого запроса
+        await asyncio.to_thread(
+            raptor_engine.timetable_for,
+            datetime.now(raptor_engine.feed.timezone).date(),
+        )
+
+    # Предрассчитанная матрица времени в пути между остановками, общая
+    # для всех процессов через отображение файлов в память
+    travel_matrix = None
+    travel_matrix_task = None
+    travel_matrix_path = settings.get("TRAVEL_MATRIX_PATH", "")
+    if travel_matrix_path:
+        travel_matrix = TravelMatrix()
+        await asyncio.to_thread(travel_matrix.load, travel_matrix_path)
+        travel_matrix_task = asyncio.create_task(
+            travel_matrix.refresh_periodically(
+                travel_matrix_path, settings.get("TRAVEL_MATRIX_REFRESH_INTERVAL", 300)
+            )
+        )
+
+    public_transport_service = PublicTransportService(
+        http_client,
+        stop_index=stop_index,
+        raptor_engine=raptor_engine,
+        travel_matrix=travel_matrix,
+    )
+    app.state.public_transport_service = public_transport_service
+    transport_workload_service = TransportWorkloadService(http_client)
+    app.state.transport_workload_service = transport_workload_service
+    app.state.route_planner_service = RoutePlannerService(
+        public_transport_service, transport_workload_service
+    )
+
+    # Фоновая синхронизация загруженности станций с DetectionAPI
+    occupancy_task = None
+    if transport_workload_service.occupancy_url:
+        occupancy_task = asyncio.create_task(
+            transport_workload_service.run_occupancy_sync(
+                settings.get("STATION_OCCUPANCY_SYNC_INTERVAL", 5)
+            )
+        )
+
+    # Фоновый сбор телеметрии для /status
+    telemetry_collector = TelemetryCollector(
+        settings.get("TELEMETRY_INTERVAL", 5.0), settings.get("TELEMETRY_DIR", "")
+    )
+    app.state.telemetry_collector = telemetry_collector
+    telemetry_task = asyncio.create_task(telemetry_collector.run())
 
     yield  # Здесь приложение работает и обрабатывает запросы
 
     # Код выполняется при завершении работы приложения
+    for task in (stop_index_task, travel_matrix_task, occupancy_task, telemetry_task):
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+    await http_client.aclose()
     logger.info("Application shutdown")
+    # Дожидаемся записи оставшихся в очереди сообщений
+    await logger.complete()
 
 
 app = FastAPI(
@@ -61,5 +154,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Время обработки запросов и заголовок Server-Timing с временем этапов
+app.add_middleware(
+    TimingMiddleware, timing_headers=settings.get("METRICS_TIMING_HEADERS", False)
+)
+
+# Идентификатор запроса для журнала и заголовка X-Request-ID
+app.add_middleware(CorrelationIdMiddleware)
+
 # Подключаем API роутер
 app.include_router(api_router)
@@ -0,0 +1,3 @@
+"""
+Локальная замена API 2GIS и нагрузочные тесты apiserver.
+"""
@@ -0,0 +1,197 @@
+"""
+Нагрузочный тест эндпоинта построения маршрутов.
+
+Отправляет запросы со случайными парами точек вокруг заданного центра
+с фиксированным количеством одновременных клиентов и выводит пропускную
+способность и задержку (p50, p95, p99).
+
+    python -m benchmarks.load_test --concurrency 32 --requests 2000 --output run.json
+
+С параметром --baseline сравнивает результат с сохраненным прогоном
+и завершается с кодом 1, если пропускная способность упала или задержка
+p95 выросла больше допустимого (--max-regression).
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+from apiserver.app.services.geo import METERS_PER_DEGREE
+
+# Центр Сочи, как в примере запроса в README
+DEFAULT_CENTER = "43.585472,39.723098"
+
+
+def random_pairs(
+    count: int, center: Tuple[float, float], spread: float, hotspots: int, seed: int
+) -> List[Dict[str, Any]]:
+    """
+    Формирует тела запросов со случайными начальной и конечной точками.
+
+    Args:
+        count: Количество запросов
+        center: Широта и долгота центра области
+        spread: Полуширина области в метрах
+        hotspots: Количество популярных точек (0 - все точки случайные);
+            точки берутся из них, чтобы запросы повторялись, как в час пик
+        seed: Зерно генератора случайных чисел
+
+    Returns:
+        Тела запросов RouteByCoordinatesRequest
+    """
+    rng = random.Random(seed)
+    lat, lon = center
+    lat_spread = spread / METERS_PER_DEGREE
+    lon_spread = lat_spread / np.cos(np.radians(lat))
+
+    def point() -> Dict[str, float]:
+        return {
+            "latitude": round(lat + rng.uniform(-lat_spread, lat_spread), 6),
+            "longitude": round(lon + rng.uniform(-lon_spread, lon_spread), 6),
+        }
+
+    pool = [point() for _ in range(hotspots)]
+
+    def pick() -> Dict[str, float]:
+        return rng.choice(pool) if pool else point()
+
+    return [
+        {"start": pick(), "end": pick(), "transport_type": "public_transport"}
+        for _ in range(count)
+    ]
+
+
+async def run(
+    url: str,
+    bodies: List[Dict[str, Any]],
+    concurrency: int,
+    timeout: float,
+    params: Dict[str, str],
+) -> Dict[str, Any]:
+    """
+    Отправляет запросы с заданным количеством одновременных клиентов.
+
+    Returns:
+        Статистика прогона
+    """
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    queue = iter(bodies)
+
+    async def client(http_client: httpx.AsyncClient):
+        for body in queue:
+            start = time.perf_counter()
+            try:
+                response = await http_client.post(url, json=body, params=params)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as http_client:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(http_client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "errors": sum(count for status, count in statuses.items() if status != "200"),
+        "statuses": statuses,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "max_ms": float(latencies_ms.max()),
+    }
+
+
+def regressions(
+    stats: Dict[str, Any], baseline: Dict[str, Any], max_regression: float
+) -> List[str]:
+    """Возвращает описания ухудшений относительно базового прогона."""
+    found = []
+    if stats["throughput_rps"] < baseline["throughput_rps"] * (1 - max_regression):
+        found.append(
+            f"пропускная способность {stats['throughput_rps']:.1f} "
+            f"< {baseline['throughput_rps']:.1f} req/s"
+        )
+    for name in ("p95_ms", "p99_ms"):
+        if stats[name] > baseline[name] * (1 + max_regression):
+            found.append(f"{name} {stats[name]:.1f} > {baseline[name]:.1f}")
+    return found
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--url", default="http://127.0.0.1:8080/api/v1/routes/build_routes"
+    )
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--center", default=DEFAULT_CENTER)
+    parser.add_argument("--spread", type=float, default=3000.0)
+    parser.add_argument("--hotspots", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--param",
+        action="append",
+        default=[],
+        help="Параметр запроса name=value (например, compact=true)",
+    )
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--baseline", type=Path, default=None)
+    parser.add_argument("--max-regression", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    center = tuple(float(value) for value in args.center.split(","))
+    params = dict(param.split("=", 1) for param in args.param)
+    bodies = random_pairs(
+        args.warmup + args.requests, center, args.spread, args.hotspots, args.seed
+    )
+
+    if args.warmup:
+        asyncio.run(
+            run(args.url, bodies[: args.warmup], args.concurrency, args.timeout, params)
+        )
+    stats = asyncio.run(
+        run(args.url, bodies[args.warmup :], args.concurrency, args.timeout, params)
+    )
+
+    print(
+        f"{stats['requests']} запросов за {stats['elapsed_s']:.1f} с, "
+        f"{stats['throughput_rps']:.1f} req/s, ошибок: {stats['errors']} "
+        f"{stats['statuses']}"
+    )
+    print(
+        f"p50 {stats['p50_ms']:.1f} мс, p95 {stats['p95_ms']:.1f} мс, "
+        f"p99 {stats['p99_ms']:.1f} мс, max {stats['max_ms']:.1f} мс"
+    )
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(stats, indent=2), encoding="utf-8")
+
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        found = regressions(stats, baseline, args.max_regression)
+        for message in found:
+            print(f"Ухудшение: {message}")
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,388 @@
+"""
+Локальная замена API 2GIS для нагрузочного тестирования.
+
+Отвечает на поиск остановок в каталоге (GET /3.0/items) и построение
+маршрутов на общественном транспорте (POST /public_transport/2.0).
+Остановки расположены на сетке вокруг любой точки, маршруты строятся
+по примеру ответа из спецификации external/2gis/docs/PublicTransportAPI.json
+с длительностями, зависящими от расстояния. Для одного и того же запроса
+ответ всегда одинаковый.
+
+Задержка и доля ошибок задаются параметрами. Ответы можно записывать
+с настоящего API 2GIS (--record с --upstream) и воспроизводить (--replay).
+
+Запуск (из backend/apiserver):
+
+    python -m benchmarks.stand_in --port 9000 --routing-latency lognormal:150,0.5
+
+и запуск apiserver с адресами замены:
+
+    API_TWO_GIS_BASE_URL=http://127.0.0.1:9000/3.0/items \\
+    API_TWO_GIS_ROUTING_URL=http://127.0.0.1:9000/public_transport/2.0 \\
+    API_HTTP_CLIENT_WARMUP_URLS=[] make run-prod
+"""
+import argparse
+import asyncio
+import copy
+import hashlib
+import json
+import random
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+from apiserver.app.services.geo import METERS_PER_DEGREE, haversine
+
+SPEC_PATH = (
+    Path(__file__).resolve().parent.parent
+    / "external"
+    / "2gis"
+    / "docs"
+    / "PublicTransportAPI.json"
+)
+
+CATALOG_URL = "https://catalog.api.2gis.com/3.0/items"
+ROUTING_URL = "https://routing.api.2gis.com/public_transport/2.0"
+
+
+class Latency:
+    """
+    Распределение задержки ответа.
+
+    Задается строкой: none, fixed:<мс>, uniform:<от мс>,<до мс>
+    или lognormal:<медиана мс>,<sigma>.
+    """
+
+    def __init__(self, spec: str):
+        name, _, params = spec.partition(":")
+        self.name = name
+        self.params = [float(value) for value in params.split(",") if value]
+        if name not in ("none", "fixed", "uniform", "lognormal"):
+            raise ValueError(f"Неизвестное распределение задержки: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        """Возвращает задержку в секундах."""
+        if self.name == "fixed":
+            return self.params[0] / 1000
+        if self.name == "uniform":
+            return rng.uniform(*self.params) / 1000
+        if self.name == "lognormal":
+            median, sigma = self.params
+            return rng.lognormvariate(np.log(median), sigma) / 1000
+        return 0.0
+
+
+def request_seed(*values: Any) -> int:
+    """Детерминированное зерно генератора для параметров запроса."""
+    digest = hashlib.blake2b(repr(values).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class StopGrid:
+    """Остановки в узлах сетки со смещением, заданным хэшем узла."""
+
+    def __init__(self, spacing: float):
+        """
+        Args:
+            spacing: Расстояние между соседними остановками в метрах
+        """
+        self.spacing = spacing / METERS_PER_DEGREE  # градусы широты
+
+    def search(
+        self, lat: float, lon: float, radius: float, page_size: int
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Находит остановки в радиусе от точки, отсортированные по расстоянию.
+
+        Returns:
+            Кортеж (остановки страницы, общее количество найденных)
+        """
+        lat_step = self.spacing
+        # Шаг по долготе растянут так, что в метрах он равен шагу по широте
+        lon_step = self.spacing / max(np.cos(np.radians(lat)), 0.01)
+        span = int(np.ceil(radius / METERS_PER_DEGREE / lat_step)) + 1
+
+        rows = np.arange(-span, span + 1) + int(round(lat / lat_step))
+        cols = np.arange(-span, span + 1) + int(round(lon / lon_step))
+        rows, cols = [grid.ravel() for grid in np.meshgrid(rows, cols, indexing="ij")]
+
+        # Смещение остановки внутри узла - до трети шага сетки
+        jitter = (rows * 73856093 ^ cols * 19349663) % 1000 / 1000 - 0.5
+        stop_lat = (rows + jitter * 0.66) * lat_step
+        stop_lon = (cols - jitter * 0.66) * lon_step
+
+        distances = haversine(lat, lon, stop_lat, stop_lon)
+        found = np.flatnonzero(distances <= radius)
+        found = found[np.argsort(distances[found], kind="stable")]
+
+        items = [
+            {
+                "id": f"{rows[i]}_{cols[i]}",
+                "name": f"Остановка {rows[i]}_{cols[i]}",
+                "type": "station",
+                "point": {
+                    "lat": round(float(stop_lat[i]), 6),
+                    "lon": round(float(stop_lon[i]), 6),
+                },
+            }
+            for i in found[:page_size]
+        ]
+        return items, len(found)
+
+
+class RouteGenerator:
+    """Маршруты по примеру ответа из спецификации PublicTransportAPI."""
+
+    def __init__(self, spec_path: Path):
+        spec = json.loads(spec_path.read_text(encoding="utf-8"))
+        schemas = spec["components"]["schemas"]
+        self.template = schemas["PublicTransportResponseModel"]["example"][0][0]
+        self.required = schemas["PublicTransportRequestModel"]["required"]
+        self.transport_types = set(schemas["CTXTransportType"]["enum"])
+
+    def validate(self, payload: Dict[str, Any]) -> Optional[str]:
+        """Возвращает описание ошибки запроса или None."""
+        missing = [name for name in self.required if name not in payload]
+        if missing:
+            return f"Отсутствуют обязательные поля: {', '.join(missing)}"
+        unknown = set(payload["transport"]) - self.transport_types
+        if unknown:
+            return f"Неизвестные виды транспорта: {', '.join(sorted(unknown))}"
+        for name in ("source", "target"):
+            point = payload[name].get("point", {})
+            if "lat" not in point or "lon" not in point:
+                return f"Не заданы координаты точки {name}"
+        return None
+
+    def build(self, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Строит маршруты между точками source и target запроса."""
+        source = payload["source"]["point"]
+        target = payload["target"]["point"]
+        rng = random.Random(
+            request_seed(source["lat"], source["lon"], target["lat"], target["lon"])
+        )
+        distance = float(
+            haversine(source["lat"], source["lon"], target["lat"], target["lon"])
+        )
+        transport = [name for name in payload["transport"] if name != "pedestrian"]
+
+        routes = []
+        for index in range(payload.get("max_result_count") or 1):
+            if distance < 500 or not transport:
+                routes.append(self._pedestrian(index, distance))
+            else:
+                routes.append(
+                    self._transit(index, distance, rng.choice(transport), rng)
+                )
+        return routes
+
+    def _transit(
+        self, index: int, distance: float, subtype: str, rng: random.Random
+    ) -> Dict[str, Any]:
+        route = copy.deepcopy(self.template)
+        walk_start = rng.randint(50, 400)
+        walk_end = rng.randint(50, 400)
+        ride = max(distance - walk_start - walk_end, 100)
+        line = str(rng.randint(1, 150))
+        station = f"Остановка {rng.randint(1, 500)}"
+        durations = {
+            "start": (walk_start, int(walk_start / 1.3), 0),
+            "passage": (int(ride), int(ride / rng.uniform(5, 9)), rng.randint(30, 600)),
+            "transfer": (walk_end, int(walk_end / 1.3), 0),
+            "finish": (0, 0, 0),
+        }
+
+        for movement, part in zip(route["movements"], durations.values()):
+            (
+                movement["distance"],
+                movement["moving_duration"],
+                movement["waiting_duration"],
+            ) = part
+            if movement["type"] == "passage":
+                movement["waypoint"]["name"] = station
+                movement["waypoint"]["subtype"] = subtype
+                movement["routes"] = [{"names": [line], "subtype": subtype}]
+
+        route["id"] = str(index + 1)
+        route["route_id"] = f"stand-in/{rng.getrandbits(48)}"
+        route["total_distance"] = int(sum(part[0] for part in durations.values()))
+        route["total_duration"] = int(
+            sum(part[1] + part[2] for part in durations.values())
+        )
+        route["transfer_count"] = 0
+        route["waypoints"] = [
+            {"combined": False, "routes_names": [line], "subtype": subtype}
+        ]
+        return route
+
+    def _pedestrian(self, index: int, distance: float) -> Dict[str, Any]:
+        return {
+            "id": str(index + 1),
+            "crossing_count": 0,
+            "pedestrian": True,
+            "transfer_count": 0,
+            "total_distance": int(distance),
+            "total_duration": int(distance / 1.3),
+            "movements": [
+                {
+                    "id": "1",
+                    "type": "walkway",
+                    "distance": int(distance),
+                    "moving_duration": int(distance / 1.3),
+                    "waiting_duration": 0,
+                    "waypoint": {"comment": "", "subtype": "start"},
+                }
+            ],
+        }
+
+
+class Recorder:
+    """Записанные ответы API 2GIS в формате JSON Lines."""
+
+    def __init__(self, replay: Optional[Path], record: Optional[Path]):
+        self.responses: Dict[str, Tuple[int, Any]] = {}
+        if replay is not None:
+            for line in replay.read_text(encoding="utf-8").splitlines():
+                entry = json.loads(line)
+                self.responses[entry["key"]] = (entry["status"], entry["body"])
+        self.record = record
+
+    @staticmethod
+    def key(endpoint: str, params: Dict[str, Any]) -> str:
+        """Ключ запроса без API-ключа."""
+        params = {name: value for name, value in params.items() if name != "key"}
+        return f"{endpoint}:{json.dumps(params, sort_keys=True, ensure_ascii=False)}"
+
+    def get(self, key: str) -> Optional[Tuple[int, Any]]:
+        return self.responses.get(key)
+
+    def save(self, key: str, status: int, body: Any) -> None:
+        self.responses[key] = (status, body)
+        if self.record is not None:
+            with self.record.open("a", encoding="utf-8") as f:
+                entry = {"key": key, "status": status, "body": body}
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def create_app(args: argparse.Namespace) -> FastAPI:
+    """Создает приложение замены API 2GIS по параметрам командной строки."""
+    app = FastAPI(title="2GIS stand-in")
+    rng = random.Random(args.seed)
+    stops = StopGrid(args.stop_spacing)
+    routes = RouteGenerator(args.spec)
+    recorder = Recorder(args.replay, args.record)
+    catalog_latency = Latency(args.catalog_latency)
+    routing_latency = Latency(args.routing_latency)
+    upstream = httpx.AsyncClient(timeout=30) if args.upstream else None
+    stats = {"catalog": 0, "routing": 0, "errors": 0, "replayed": 0}
+
+    async def respond(
+        endpoint: str, key: str, latency: Latency, build, forward
+    ) -> Response:
+        stats[endpoint] += 1
+        await asyncio.sleep(latency.sample(rng))
+        if rng.random() < args.error_rate:
+            stats["errors"] += 1
+            return JSONResponse(
+                {"type": "error", "message": "stand-in error"},
+                status_code=args.error_status,
+            )
+
+        recorded = recorder.get(key)
+        if recorded is not None:
+            stats["replayed"] += 1
+            status, body = recorded
+        elif upstream is not None:
+            response = await forward()
+            status, body = response.status_code, response.json()
+            recorder.save(key, status, body)
+        else:
+            status, body = build()
+        return JSONResponse(body, status_code=status)
+
+    @app.get("/3.0/items")
+    async def catalog(request: Request) -> Response:
+        params = dict(request.query_params)
+
+        def build():
+            lon, lat = (float(value) for value in params["point"].split(","))
+            items, total = stops.search(
+                lat,
+                lon,
+                float(params.get("radius", 250)),
+                int(params.get("page_size", 20)),
+            )
+            if not items:
+                return 404, {"meta": {"code": 404, "error": {"type": "itemNotFound"}}}
+            return 200, {
+                "meta": {"code": 200},
+                "result": {"items": items, "total": total},
+            }
+
+        return await respond(
+            "catalog",
+            recorder.key("catalog", params),
+            catalog_latency,
+            build,
+            lambda: upstream.get(CATALOG_URL, params=request.query_params),
+        )
+
+    @app.post("/public_transport/2.0")
+    async def routing(request: Request) -> Response:
+        payload = await request.json()
+        error = routes.validate(payload)
+        if error:
+            return JSONResponse({"type": "error", "message": error}, status_code=422)
+
+        points = {name: payload[name]["point"] for name in ("source", "target")}
+        key = recorder.key(
+            "routing", {**points, "enable_schedule": payload.get("enable_schedule")}
+        )
+        return await respond(
+            "routing",
+            key,
+            routing_latency,
+            lambda: (200, routes.build(payload)),
+            lambda: upstream.post(
+                ROUTING_URL, params=request.query_params, json=payload
+            ),
+        )
+
+    @app.get("/stats")
+    async def get_stats() -> Dict[str, int]:
+        """Количество обработанных запросов."""
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--spec", type=Path, default=SPEC_PATH)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stop-spacing", type=float, default=300.0)
+    parser.add_argument("--catalog-latency", default="lognormal:40,0.4")
+    parser.add_argument("--routing-latency", default="lognormal:150,0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--replay", type=Path, default=None)
+    parser.add_argument("--record", type=Path, default=None)
+    parser.add_argument(
+        "--upstream",
+        action="store_true",
+        help="Отправлять незаписанные запросы в настоящий API 2GIS",
+    )
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pytest
+
+from apiserver.app.services.raptor import (
+    INF,
+    GtfsFeed,
+    RaptorEngine,
+    Timetable,
+    _fifo_chains,
+    _parse_time,
+    raptor,
+)
+
+# Остановки A-B-C-D на одной долготе примерно в 1,1 км друг от друга:
+# пешие пересадки между ними не проходят по радиусу
+STOPS = {"A": 55.70, "B": 55.71, "C": 55.72, "D": 55.73}
+
+# Линия 1: A -> B -> C, экспресс t4 отправляется позже t1 и обгоняет ее;
+# линия 2: C -> D
+TRIPS = {
+    "t1": ("R1", [("A", "08:00:00"), ("B", "08:05:00"), ("C", "08:10:00")]),
+    "t2": ("R1", [("A", "08:20:00"), ("B", "08:25:00"), ("C", "08:30:00")]),
+    "t4": ("R1", [("A", "08:02:00"), ("B", "08:04:00"), ("C", "08:06:00")]),
+    "t3": ("R2", [("C", "08:15:00"), ("D", "08:25:00")]),
+}
+
+SERVICE_DATE = date(2026, 10, 19)
+TIMEZONE = ZoneInfo("Europe/Moscow")
+
+
+def _write(path, name, header, rows):
+    lines = [",".join(header)] + [",".join(row) for row in rows]
+    (path / name).write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+@pytest.fixture
+def feed(tmp_path):
+    _write(
+        tmp_path,
+        "agency.txt",
+        ["agency_id", "agency_name", "agency_url", "agency_timezone"],
+        [["1", "Test", "http://example.com", "Europe/Moscow"]],
+    )
+    _write(
+        tmp_path,
+        "stops.txt",
+        ["stop_id", "stop_name", "stop_lat", "stop_lon"],
+        [[stop, f"Stop {stop}", str(lat), "37.6"] for stop, lat in STOPS.items()],
+    )
+    _write(
+        tmp_path,
+        "routes.txt",
+        ["route_id", "route_short_name", "route_type"],
+        [["R1", "1", "3"], ["R2", "2", "3"]],
+    )
+    _write(
+        tmp_path,
+        "trips.txt",
+        ["route_id", "service_id", "trip_id"],
+        [[route, "daily", trip] for trip, (route, _) in TRIPS.items()],
+    )
+    _write(
+        tmp_path,
+        "stop_times.txt",
+        ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"],
+        [
+            [trip, time, time, stop, str(sequence)]
+            for trip, (_, stop_times) in TRIPS.items()
+            for sequence, (stop, time) in enumerate(stop_times, 1)
+        ],
+    )
+    _write(
+        tmp_path,
+        "calendar.txt",
+        [
+            "service_id",
+            "monday",
+            "tuesday",
+            "wednesday",
+            "thursday",
+            "friday",
+            "saturday",
+            "sunday",
+            "start_date",
+            "end_date",
+        ],
+        [["daily"] + ["1"] * 7 + ["20260101", "20261231"]],
+    )
+    return GtfsFeed.load(str(tmp_path))
+
+
+def _stop(feed, stop_id):
+    return feed.stop_ids.index(stop_id)
+
+
+def _point(stop_id):
+    return STOPS[stop_id], 37.6
+
+
+def test_fifo_chains_split_overtaking_trips(feed):
+    # Поездки отсортированы по отправлению, t4 обгоняет t1 на B
+    assert _fifo_chains(feed, ["t1", "t4", "t2"]) == [["t1", "t2"], ["t4"]]
+
+
+def test_timetable_build(feed):
+    timetable = Timetable.build(feed, SERVICE_DATE, 200, 1.2)
+
+    # Линия 1 разбита на две цепочки без обгонов
+    assert sorted(timetable.pattern_route) == ["R1", "R1", "R2"]
+    for departures in timetable.departures:
+        assert np.all(np.diff(departures, axis=0) >= 0)
+
+    # Через C проходят все три шаблона, через D - один
+    patterns_through = np.diff(timetable.stop_offsets)
+    assert patterns_through[_stop(feed, "C")] == 3
+    assert patterns_through[_stop(feed, "D")] == 1
+    # Остановки дальше радиуса пересадок
+    assert len(timetable.transfer_to) == 0
+
+
+def test_timetable_build_skips_inactive_service(feed):
+    timetable = Timetable.build(feed, date(2027, 1, 4), 200, 1.2)
+    assert timetable.pattern_route == []
+
+
+def test_raptor_rounds(feed):
+    timetable = Timetable.build(feed, SERVICE_DATE, 200, 1.2)
+    start = _parse_time("07:58:00")
+    rounds = raptor(timetable, {_stop(feed, "A"): start}, 3)
+
+    # Одной поездкой - экспрессом t4 до C, D недостижима
+    assert rounds.labels[1][_stop(feed, "C")] == _parse_time("08:06:00")
+    assert rounds.labels[1][_stop(feed, "D")] == INF
+    # Двумя поездками - пересадка на t3 в C
+    assert rounds.labels[2][_stop(feed, "D")] == _parse_time("08:25:00")
+
+
+def test_raptor_waits_for_later_trip(feed):
+    timetable = Timetable.build(feed, SERVICE_DATE, 200, 1.2)
+    rounds = raptor(timetable, {_stop(feed, "A"): _parse_time("08:03:00")}, 3)
+
+    # t1 и t4 уже ушли, следующая - t2, а t3 на C ушла до ее прибытия
+    assert rounds.labels[1][_stop(feed, "C")] == _parse_time("08:30:00")
+    assert all(labels[_stop(feed, "D")] == INF for labels in rounds.labels)
+
+
+def test_route_matrix_journey(feed):
+    engine = RaptorEngine(feed, access_radius=100, transfer_radius=200)
+    departure = datetime(2026, 10, 19, 7, 58, tzinfo=TIMEZONE)
+
+    [[route, unreachable]] = engine.route_matrix(
+        [_point("A")], [_point("D"), (55.9, 37.6)], departure
+    )
+
+    assert unreachable is None
+    # Пешие участки нулевой длины (точка на остановке) пропускаются
+    assert [movement["type"] for movement in route["movements"]] == [
+        "passage",
+        "passage",
+    ]
+    first, second = route["movements"]
+    assert first["waypoint"]["name"] == "Stop A"
+    assert first["waypoint"]["routes_names"] == ["1"]
+    assert first["waiting_duration"] == 4 * 60
+    assert first["moving_duration"] == 4 * 60
+    assert second["waypoint"]["name"] == "Stop C"
+    assert second["waypoint"]["routes_names"] == ["2"]
+    assert second["waiting_duration"] == 9 * 60
+    assert route["transfer_count"] == 1
+    assert route["total_duration"] == 27 * 60
@@ -0,0 +1,181 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from apiserver.app.services import resilience
+from apiserver.app.services.resilience import (
+    AdaptiveLimit,
+    CircuitBreaker,
+    ResilientTransport,
+    RetryBudget,
+    UpstreamUnavailable,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Подменяет часы модуля: clock.now сдвигается вручную."""
+    fake = SimpleNamespace(now=1000.0)
+    fake.monotonic = lambda: fake.now
+    monkeypatch.setattr(resilience, "time", fake)
+    return fake
+
+
+def test_breaker_opens_on_failure_ratio(clock):
+    breaker = CircuitBreaker(failure_ratio=0.5, window=4, min_calls=4)
+    for success in (True, False, True):
+        breaker.record(success)
+    # Меньше min_calls запросов - не размыкается
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_half_open_probe(clock):
+    breaker = CircuitBreaker(window=2, min_calls=2, reset_timeout=10)
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now += 10
+    # Пропускается один пробный запрос
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    # Неудачная проба размыкает выключатель снова
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_retry_budget(clock):
+    budget = RetryBudget(ratio=0.5, min_per_second=1.0)
+    assert budget.capacity == 10
+
+    # Начальный запас расходуется, без трафика и времени повторов нет
+    for _ in range(10):
+        assert budget.withdraw()
+    assert not budget.withdraw()
+
+    # Два запроса - один повтор
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+
+    # min_per_second повторов в секунду, но не больше запаса
+    clock.now += 3
+    for _ in range(3):
+        assert budget.withdraw()
+    assert not budget.withdraw()
+    clock.now += 100
+    budget.deposit()
+    assert budget.balance == budget.capacity
+
+
+def test_adaptive_limit_aimd():
+    limit = AdaptiveLimit(initial=4, min_limit=1, max_limit=5, backoff=0.5)
+
+    async def cycle(success):
+        assert await limit.acquire(0.1)
+        limit.release(success)
+
+    # Аддитивный рост на 1/limit за запрос
+    asyncio.run(cycle(True))
+    assert limit.limit == pytest.approx(4.25)
+    # Мультипликативное снижение после сбоя
+    asyncio.run(cycle(False))
+    assert limit.limit == pytest.approx(2.125)
+    # Отмененный запрос лимит не меняет
+    asyncio.run(cycle(None))
+    assert limit.limit == pytest.approx(2.125)
+
+    for _ in range(3):
+        asyncio.run(cycle(False))
+    assert limit.limit == 1
+    for _ in range(100):
+        asyncio.run(cycle(True))
+    assert limit.limit == 5
+    assert limit.in_flight == 0
+
+
+def test_adaptive_limit_waiters():
+    async def scenario():
+        limit = AdaptiveLimit(initial=1)
+        assert await limit.acquire(0.1)
+        # Места нет - ожидание завершается по таймауту
+        assert not await limit.acquire(0.01)
+
+        waiting = asyncio.create_task(limit.acquire(1.0))
+        await asyncio.sleep(0)
+        # Освобожденное место передается ожидающему запросу
+        limit.release(None)
+        assert await waiting
+        assert limit.in_flight == 1
+
+    asyncio.run(scenario())
+
+
+def _transport(statuses, **options):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(statuses[min(len(calls), len(statuses)) - 1])
+
+    transport = ResilientTransport(
+        httpx.MockTransport(handler), backoff_base=0, **options
+    )
+    return transport, calls
+
+
+async def _get(transport, url="http://upstream.test/items"):
+    async with httpx.AsyncClient(transport=transport) as client:
+        return await client.get(url)
+
+
+def test_transport_retries_retryable_status():
+    transport, calls = _transport([503, 503, 200], max_attempts=3)
+    response = asyncio.run(_get(transport))
+    assert response.status_code == 200
+    assert len(calls) == 3
+
+
+def test_transport_stops_at_retry_budget():
+    transport, calls = _transport(
+        [503],
+        max_attempts=5,
+        retry_budget=RetryBudget(ratio=0, min_per_second=0),
+    )
+    # Бюджет не пополняется, запаса хватает на один повтор
+    transport.retry_budget.balance = 1
+    response = asyncio.run(_get(transport))
+    assert response.status_code == 503
+    assert len(calls) == 2
+
+
+def test_transport_rejects_when_breaker_open():
+    transport, calls = _transport(
+        [500],
+        max_attempts=1,
+        breaker_options={"window": 2, "min_calls": 2, "reset_timeout": 60},
+    )
+    for _ in range(2):
+        assert asyncio.run(_get(transport)).status_code == 500
+    with pytest.raises(UpstreamUnavailable):
+        asyncio.run(_get(transport))
+    # Разомкнутый выключатель не пропускает запрос к эндпоинту
+    assert len(calls) == 2
+    # Другой эндпоинт - свой выключатель
+    other = asyncio.run(_get(transport, "http://upstream.test/other"))
+    assert other.status_code == 500
@@ -0,0 +1,123 @@
+import numpy as np
+
+from apiserver.app.services.route_ranking import (
+    RouteRanker,
+    knee_point,
+    non_dominated_sort,
+    pareto_front,
+    pareto_front_2d,
+    walking_distance,
+    weighted_choice,
+)
+
+
+def _dominates(a, b):
+    return np.all(a <= b) and np.any(a < b)
+
+
+def _brute_force_ranks(values):
+    ranks = np.full(len(values), -1)
+    remaining = set(range(len(values)))
+    rank = 0
+    while remaining:
+        front = {
+            i
+            for i in remaining
+            if not any(_dominates(values[j], values[i]) for j in remaining)
+        }
+        for i in front:
+            ranks[i] = rank
+        remaining -= front
+        rank += 1
+    return ranks
+
+
+def test_non_dominated_sort_fronts():
+    values = np.array(
+        [
+            [1, 3, 2],
+            [2, 2, 2],
+            [3, 1, 1],
+            [2, 3, 3],
+            [4, 4, 4],
+            # Дубликат точки фронта тоже во фронте
+            [1, 3, 2],
+        ],
+        dtype=np.float64,
+    )
+    assert non_dominated_sort(values).tolist() == [0, 0, 0, 1, 2, 0]
+
+
+def test_non_dominated_sort_matches_brute_force():
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        # Малый диапазон значений - много равенств по отдельным критериям
+        values = rng.integers(0, 5, size=(40, 4)).astype(np.float64)
+        assert non_dominated_sort(values).tolist() == (
+            _brute_force_ranks(values).tolist()
+        )
+
+
+def test_pareto_front_2d():
+    values = np.array([[1, 5], [2, 3], [3, 4], [4, 1], [2, 3]], dtype=np.float64)
+    # По возрастанию первого критерия, равные точки - обе
+    assert pareto_front_2d(values).tolist() == [0, 1, 4, 3]
+    assert pareto_front(values).tolist() == [0, 1, 4, 3]
+
+
+def test_pareto_front_empty():
+    assert len(pareto_front(np.empty((0, 3)))) == 0
+
+
+def test_knee_point_two_objectives():
+    # Нормированные точки (0, 1), (0.1, 0.2), (0.3, 0.15), (1, 0): дальше всех
+    # от прямой через крайние точки - вторая
+    front = np.array([[0, 10], [1, 2], [3, 1.5], [10, 0]], dtype=np.float64)
+    assert knee_point(front) == 1
+
+
+def test_knee_point_nearest_to_ideal():
+    front = np.array([[0, 10, 5], [5, 5, 5], [10, 0, 5]], dtype=np.float64)
+    assert knee_point(front) == 1
+    # Большой вес первого критерия сдвигает выбор к его минимуму
+    assert knee_point(front, np.array([10.0, 1.0, 1.0])) == 0
+
+
+def test_weighted_choice():
+    values = np.array([[0, 10], [4, 4], [10, 0]], dtype=np.float64)
+    assert weighted_choice(values, np.array([1.0, 1.0])) == 1
+    assert weighted_choice(values, np.array([1.0, 0.1])) == 0
+
+
+def _route(duration, workload, transfers, walking):
+    return {
+        "total_duration": duration,
+        "workload": workload,
+        "transfer_count": transfers,
+        "movements": [{"type": "walkway", "distance": walking}],
+    }
+
+
+def test_walking_distance_counts_walkways_only():
+    route = {
+        "movements": [
+            {"type": "walkway", "distance": 100},
+            {"type": "passage", "distance": 5000},
+            {"type": "walkway", "distance": 50},
+        ]
+    }
+    assert walking_distance(route) == 150
+
+
+def test_route_ranker_rank():
+    fast = _route(600, 0.9, 1, 300)
+    calm = _route(1500, 0.1, 1, 300)
+    balanced = _route(700, 0.3, 1, 300)
+    dominated = _route(1600, 0.95, 2, 400)
+    ranked = RouteRanker().rank([fast, calm, balanced, dominated])
+
+    assert ranked.fastest is fast
+    assert ranked.least_crowded is calm
+    assert ranked.balanced is balanced
+    assert dominated not in ranked.pareto
+    assert len(ranked.pareto) == 3